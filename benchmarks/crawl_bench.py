@@ -0,0 +1,407 @@
+# -*- coding: utf-8 -*-
+
+'''
+
+End-to-end throughput benchmark for the crawler that runs entirely offline.
+
+The Hatena search pages and bookmark count APIs are replayed by the local stand-in server (tests/standin.py)
+with a configurable latency and jitter, and CrawlingHatena and UpdateBookmarksHatena are driven
+against a temporary copy of the database with a temporary userConfig.json (passed through METIS_CONFIG).
+Neither the Tk dialogs nor the Internet connectivity check are used.
+
+The pages are either generated in the markup of the Hatena search page,
+or replayed from a fixture directory laid out as
+
+    <dir>/bookmarks.json                 {"<url>": <bookmarks>, ...}
+    <dir>/search/<word>/<page>.html      search result pages
+
+which can be recorded by hand or written from the generated pages with --save-fixtures.
+
+For each phase the report gives the requests served, pages/sec, articles/sec, DB rows/sec and the peak RSS.
+Run it from this directory:
+
+    python crawl_bench.py [--words 4] [--pages 10] [--articles 40] [--latency 0.02] [--jitter 0.01]
+                          [--processes 1] [--fixtures DIR] [--save-fixtures DIR] [--telemetry] [--json FILE]
+
+:copyright: (c) 2018 by Kato Shinya.
+:license: MIT, see LICENSE for more details.
+'''
+
+from contextlib import redirect_stdout, redirect_stderr
+import argparse
+import tempfile
+import sqlite3
+import shutil
+import random
+import glob
+import json
+import time
+import sys
+import os
+
+try:
+    import resource
+except ImportError:
+    # Windowsでは最大常駐セットサイズを取得しない
+    resource = None
+
+# 相対パスで参照する管理ファイルを読み込めるよう、metisディレクトリで実行する
+DIR_METIS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'metis')
+sys.path.insert(0, DIR_METIS)
+# スタンドインサーバはテストと共用する
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests'))
+
+from standin import HatenaStandInServer
+
+__author__ = 'Kato Shinya'
+__date__ = '2018/04/21'
+
+def create_search_page(word: str, page: int, articles: int) -> tuple:
+    '''Hatenaの検索結果ページと同じ構造のHTMLを生成する関数。
+
+    :param str word: 検索ワード。
+    :param int page: ページ番号。
+    :param int articles: 1ページあたりの記事数。
+    :rtype: tuple
+    :return: 検索結果ページのHTMLと、掲載した記事のURLのリストのタプル。
+    '''
+
+    rnd = random.Random('{}/{}'.format(word, page))
+    urls = []
+    items = []
+
+    for i in range(articles):
+        url = 'http://example.com/{}/{}/{}'.format(word, page, i)
+        urls.append(url)
+
+        tags = ''.join('<li><a href="/search/tag?q=tag{0}">tag{0}&amp;{1}</a></li>'.format(rnd.randint(0, 50), word) for _ in range(rnd.randint(0, 5)))
+        items.append('<li class="bookmark-item js-keyboard-selectable-item">\n'
+                     '<div class="centerarticle-entry-title"><h3><a href="{0}" target="_blank"><img src="http://favicon.example.com/{1}.png" alt="">{2}の記事 {1} &amp; &lt;benchmark&gt;</a></h3></div>\n'
+                     '<div class="entry-contents"><span class="entry-contents-date">2018/06/{3:02d}</span></div>\n'
+                     '<div class="entrysearch-entry-tags-wrap"><ul class="entrysearch-entry-tags">{4}</ul></div>\n'
+                     '</li>\n'.format(url, page * articles + i, word, i % 28 + 1, tags))
+
+    html = ('<html><body><header>Hatena</header><div class="entrysearch-articles"><ul>\n'
+            + ''.join(items)
+            + '</ul></div><div class="centerarticle-pager"><a>next</a></div></body></html>')
+
+    return html, urls
+
+def create_fixtures(words: list, pages: int, articles: int) -> tuple:
+    '''全検索ワードの検索結果ページとブックマーク数を生成する関数。
+
+    :param list words: 検索ワードのリスト。
+    :param int pages: 検索ワード毎のページ数。
+    :param int articles: 1ページあたりの記事数。
+    :rtype: tuple
+    :return: (検索ワード, ページ番号)をキーとした検索結果ページの辞書と、URLをキーとしたブックマーク数の辞書のタプル。
+    '''
+
+    search_pages = {}
+    bookmarks = {}
+
+    for word in words:
+        for page in range(1, pages + 1):
+            search_pages[(word, page)], urls = create_search_page(word, page, articles)
+            bookmarks.update((url, len(url) * 7 % 500) for url in urls)
+
+    return search_pages, bookmarks
+
+def load_fixtures(dir_fixtures: str) -> tuple:
+    '''記録済みの検索結果ページとブックマーク数を読み込む関数。
+
+    :param str dir_fixtures: フィクスチャを格納したディレクトリ。
+    :rtype: tuple
+    :return: (検索ワード, ページ番号)をキーとした検索結果ページの辞書と、URLをキーとしたブックマーク数の辞書のタプル。
+    '''
+
+    search_pages = {}
+
+    for path in glob.glob(os.path.join(dir_fixtures, 'search', '*', '*.html')):
+        word = os.path.basename(os.path.dirname(path))
+        page = int(os.path.splitext(os.path.basename(path))[0])
+        with open(path, encoding='utf-8') as f:
+            search_pages[(word, page)] = f.read()
+
+    with open(os.path.join(dir_fixtures, 'bookmarks.json'), encoding='utf-8') as f:
+        bookmarks = json.load(f)
+
+    return search_pages, bookmarks
+
+def save_fixtures(dir_fixtures: str, search_pages: dict, bookmarks: dict):
+    '''検索結果ページとブックマーク数をフィクスチャとして書き出す関数。
+
+    :param str dir_fixtures: 書き出し先のディレクトリ。
+    :param dict search_pages: (検索ワード, ページ番号)をキーとした検索結果ページの辞書。
+    :param dict bookmarks: URLをキーとしたブックマーク数の辞書。
+    '''
+
+    for (word, page), html in search_pages.items():
+        dir_word = os.path.join(dir_fixtures, 'search', word)
+        os.makedirs(dir_word, exist_ok=True)
+        with open(os.path.join(dir_word, '{}.html'.format(page)), 'w', encoding='utf-8') as f:
+            f.write(html)
+
+    with open(os.path.join(dir_fixtures, 'bookmarks.json'), 'w', encoding='utf-8') as f:
+        json.dump(bookmarks, f, ensure_ascii=False, indent=1)
+
+def write_config(dir_work: str, base_url: str, processes=1, pages=10, rate=0.0, telemetry=False) -> str:
+    '''一時ディレクトリを参照する構成管理ファイルを生成する関数。
+    全てのURLをスタンドインサーバへ向け、キャッシュと終了時の待機は無効にする。
+
+    :param str dir_work: 一時ディレクトリ。
+    :param str base_url: スタンドインサーバのベースURL。
+    :param int processes: クローラのプロセス数。初期値は1。
+    :param int pages: 検索ワード毎の取得ページ数。初期値は10。
+    :param float rate: ホスト毎の毎秒の最大リクエスト数。0の場合は制限しない。初期値は0.0。
+    :param bool telemetry: テレメトリを記録するか否か。初期値はFalse。
+    :rtype: str
+    :return: 生成した構成管理ファイルへのパス。
+    '''
+
+    with open(os.path.join(DIR_METIS, '..', 'env', 'userConfig.json'), encoding='utf-8') as f:
+        config = json.load(f)
+
+    config['url']['hatena_search'] = base_url + '/search/tag'
+    config['url']['hatena_bookmark_api'] = base_url + '/entry.count'
+    config['url']['hatena_bookmarks_api'] = base_url + '/entry.counts'
+
+    config['path']['database'] = os.path.join(dir_work, 'USER01.db')
+    config['path']['dir_log'] = os.path.join(dir_work, 'log') + os.sep
+    config['path']['http_cache'] = os.path.join(dir_work, 'cache', 'http_cache.db')
+    config['path']['dir_archive'] = os.path.join(dir_work, 'archive') + os.sep
+    config['path']['dir_staging'] = os.path.join(dir_work, 'staging') + os.sep
+    config['path']['dir_telemetry'] = os.path.join(dir_work, 'telemetry') + os.sep
+
+    config['cache']['enabled'] = False
+    config['telemetry']['enabled'] = telemetry
+    config['crawler']['processes'] = processes
+    config['crawler']['page_depth_initial'] = pages
+    config['crawler']['page_depth_max'] = max(pages, config['crawler']['page_depth_max'])
+    config['crawler']['refresh_policy'] = 'full'
+    config['crawler']['exit_pause_sec'] = 0
+    config['http']['rate_per_host'] = rate
+
+    path = os.path.join(dir_work, 'userConfig.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(config, f, ensure_ascii=False, indent=2)
+
+    return path
+
+def prepare_workspace(dir_work: str, base_url: str, words: list, **options) -> str:
+    '''一時ディレクトリに構成管理ファイルと空のDBを用意し、metisディレクトリへ移動する関数。
+    構成管理ファイルは環境変数METIS_CONFIGで参照させるため、ワーカプロセスにも引き継がれる。
+
+    :param str dir_work: 一時ディレクトリ。
+    :param str base_url: スタンドインサーバのベースURL。
+    :param list words: 登録する検索ワードのリスト。
+    :param dict options: write_configへ渡す設定値。
+    :rtype: str
+    :return: 一時ディレクトリのDBへのパス。
+    '''
+
+    os.environ['METIS_CONFIG'] = write_config(dir_work, base_url, **options)
+    os.chdir(DIR_METIS)
+
+    # 空のDBを複製し、検索ワードを登録する
+    path_database = os.path.join(dir_work, 'USER01.db')
+    shutil.copy(os.path.join('..', 'common', 'db', 'USER01.db'), path_database)
+    conn = sqlite3.connect(path_database)
+    conn.execute("UPDATE MST_PARAMETER SET VALUE = ? WHERE PARAM_NAME = 'SEARCH_WORDS_4_HATENA'", (','.join(words),))
+    conn.commit()
+    conn.close()
+
+    return path_database
+
+def peak_rss_mib() -> float:
+    '''本プロセスと終了済みの子プロセスの最大常駐セットサイズを返す関数。
+
+    :rtype: float
+    :return: 最大常駐セットサイズ(MiB)。取得できない環境ではNone。
+    '''
+
+    if resource is None:
+        return None
+
+    # Linuxはキロバイト、macOSはバイト単位
+    unit = 1 if sys.platform == 'darwin' else 1024
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+    return peak * unit / (1024 * 1024)
+
+def select_bookmarks(path_database: str) -> dict:
+    '''登録済みの記事のブックマーク数を取得する関数。
+
+    :param str path_database: DBへのパス。
+    :rtype: dict
+    :return: URLをキーとしたブックマーク数の辞書。
+    '''
+
+    conn = sqlite3.connect(path_database)
+    try:
+        return dict(conn.execute('SELECT URL, BOOKMARKS FROM ARTICLE_INFO_HATENA'))
+    finally:
+        conn.close()
+
+def count_tags(path_database: str) -> int:
+    '''タグテーブルの件数を取得する関数。
+
+    :param str path_database: DBへのパス。
+    :rtype: int
+    :return: ARTICLE_TAG.TBLの件数。
+    '''
+
+    conn = sqlite3.connect(path_database)
+    try:
+        return conn.execute('SELECT COUNT(1) FROM ARTICLE_TAG').fetchone()[0]
+    finally:
+        conn.close()
+
+def create_crawler(crawler_class, order: str, name='crawl_bench'):
+    '''画面からの起動と同様にシリアル番号を発行し、疎通確認を行わずにクローラを生成する関数。
+    prepare_workspaceの実行後に呼び出すこと。
+
+    :param type crawler_class: 生成するクローラクラス。
+    :param str order: 処理オーダ。
+    :param str name: コマンドライン引数の先頭に渡す名前。初期値は'crawl_bench'。
+    :rtype: crawler.CommunicateBase
+    :return: クローラ。
+    '''
+
+    from common import connect_to_database, create_serial_number
+    from sql import ManageSerialDao
+
+    serial_number = create_serial_number()
+    conn, cursor = connect_to_database(shared=False)
+    try:
+        ManageSerialDao().insert_serial_no(cursor, serial_number)
+        conn.commit()
+    finally:
+        conn.close()
+
+    return crawler_class([name, order, serial_number], check_internet=False)
+
+def run_phase(crawler_class, order: str, verbose: bool) -> float:
+    '''クローラを生成して1回実行する関数。
+
+    :param type crawler_class: 実行するクローラクラス。
+    :param str order: 処理オーダ。
+    :param bool verbose: クローラの標準出力と進捗表示を表示するか否か。
+    :rtype: float
+    :return: 処理時間(秒)。
+    '''
+
+    with open(os.devnull, 'w') as devnull, redirect_stdout(sys.stdout if verbose else devnull), redirect_stderr(sys.stderr if verbose else devnull):
+        crawler = create_crawler(crawler_class, order)
+
+        started = time.perf_counter()
+        crawler.execute()
+
+        return time.perf_counter() - started
+
+def format_report(results: list) -> str:
+    '''計測結果を表形式の文字列にする関数。
+
+    :param list results: 処理毎の計測結果の辞書のリスト。
+    :rtype: str
+    :return: 表形式の計測結果。
+    '''
+
+    lines = ['{:<8}{:>9}{:>10}{:>8}{:>10}{:>8}{:>11}{:>14}{:>11}{:>10}'.format('phase', 'seconds', 'requests', 'pages', 'articles', 'rows', 'pages/sec', 'articles/sec', 'rows/sec', 'peak MiB')]
+
+    for result in results:
+        lines.append('{:<8}{:>9.2f}{:>10}{:>8}{:>10}{:>8}{:>11.1f}{:>14.1f}{:>11.1f}{:>10}'.format(
+                        result['phase'], result['seconds'], result['requests'], result['pages'], result['articles'], result['rows'],
+                        result['pages_per_sec'], result['articles_per_sec'], result['rows_per_sec'],
+                        '-' if result['peak_rss_mib'] is None else '{:.1f}'.format(result['peak_rss_mib'])))
+
+    return '\n'.join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline end-to-end benchmark of CrawlingHatena and UpdateBookmarksHatena.')
+    parser.add_argument('--words', type=int, default=4, help='number of search words to generate')
+    parser.add_argument('--pages', type=int, default=10, help='search result pages per word')
+    parser.add_argument('--articles', type=int, default=40, help='articles per generated page')
+    parser.add_argument('--latency', type=float, default=0.02, help='latency added to every response (sec)')
+    parser.add_argument('--jitter', type=float, default=0.01, help='maximum random jitter added to the latency (sec)')
+    parser.add_argument('--rate', type=float, default=0.0, help='requests per second per host (0: unlimited)')
+    parser.add_argument('--processes', type=int, default=1, help='crawler processes')
+    parser.add_argument('--fixtures', help='replay recorded pages from this directory instead of generating them')
+    parser.add_argument('--save-fixtures', help='write the generated pages to this directory and exit')
+    parser.add_argument('--telemetry', action='store_true', help='record telemetry and print its summary')
+    parser.add_argument('--json', help='also write the results to this file')
+    parser.add_argument('--verbose', action='store_true', help='show the output of the crawler')
+    args = parser.parse_args()
+
+    # 実行中にmetisディレクトリへ移動するため先に絶対パスにしておく
+    if args.json:
+        args.json = os.path.abspath(args.json)
+
+    if args.fixtures:
+        search_pages, bookmarks = load_fixtures(args.fixtures)
+        words = sorted({word for word, page in search_pages})
+        args.pages = max(page for word, page in search_pages)
+    else:
+        words = ['word{}'.format(i) for i in range(args.words)]
+        search_pages, bookmarks = create_fixtures(words, args.pages, args.articles)
+
+    if args.save_fixtures:
+        save_fixtures(args.save_fixtures, search_pages, bookmarks)
+        return
+
+    dir_work = tempfile.mkdtemp(prefix='metis_bench_')
+    server = HatenaStandInServer(bookmarks=bookmarks, pages=search_pages, latency=args.latency, jitter=args.jitter)
+
+    try:
+        path_database = prepare_workspace(dir_work, server.start(), words, processes=args.processes, pages=args.pages, rate=args.rate, telemetry=args.telemetry)
+
+        from crawler import CrawlingHatena, UpdateBookmarksHatena
+        from telemetry import get_telemetry, summarize, format_summary
+
+        results = []
+
+        # クローリング
+        seconds = run_phase(CrawlingHatena, '0', args.verbose)
+        crawled = select_bookmarks(path_database)
+        rows = len(crawled) + count_tags(path_database)
+        pages = server.hits['/search/tag']
+        results.append({'phase' : 'crawl', 'seconds' : seconds, 'requests' : sum(server.hits.values()), 'pages' : pages, 'articles' : len(crawled), 'rows' : rows, 'peak_rss_mib' : peak_rss_mib()})
+
+        # ブックマーク数が変化した状態で全件更新する
+        for url in server.bookmarks:
+            server.bookmarks[url] += 1
+        server.hits.clear()
+
+        seconds = run_phase(UpdateBookmarksHatena, '1', args.verbose)
+        updated = select_bookmarks(path_database)
+        rows = sum(1 for url, count in updated.items() if crawled.get(url) != count)
+        pages = server.hits['/entry.counts']
+        results.append({'phase' : 'update', 'seconds' : seconds, 'requests' : sum(server.hits.values()), 'pages' : pages, 'articles' : rows, 'rows' : rows, 'peak_rss_mib' : peak_rss_mib()})
+
+        for result in results:
+            result['pages_per_sec'] = result['pages'] / result['seconds']
+            result['articles_per_sec'] = result['articles'] / result['seconds']
+            result['rows_per_sec'] = result['rows'] / result['seconds']
+
+        print('words={} pages/word={} latency={}s jitter={}s processes={}'.format(len(words), args.pages, args.latency, args.jitter, args.processes))
+        print(format_report(results))
+
+        if args.telemetry:
+            get_telemetry().close()
+            print()
+            print(format_summary(*summarize(glob.glob(os.path.join(dir_work, 'telemetry', '*.jsonl')))))
+
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump({'args' : vars(args), 'results' : results}, f, indent=2)
+    finally:
+        server.stop()
+
+        if 'telemetry' in sys.modules:
+            # 一時ディレクトリの削除後に終了時の書き込みで再生成されないよう先に書き込む
+            sys.modules['telemetry'].get_telemetry().close()
+
+        shutil.rmtree(dir_work, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
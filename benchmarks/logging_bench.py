@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+'''
+
+Benchmark for the per-article debug logging on the scrape hot path.
+
+For every article the scraper emits a DEBUG start / end message and five DEBUG values.
+This compares, with the log level at INFO (so nothing is written):
+
+    eager   : the former Log API, which captured the caller frame with inspect and formatted the message before logging dropped it
+    lazy    : Log.normal / Log.debug, which return before touching frames or formatting when the level is disabled
+    guarded : the same calls behind a single Log.is_debug_enabled() check, as in the scraper
+
+The log file is written to a temporary directory.
+Run it from this directory:
+
+    python logging_bench.py [--articles 100000] [--repeat 5]
+
+:copyright: (c) 2018 by Kato Shinya.
+:license: MIT, see LICENSE for more details.
+'''
+
+import argparse
+import tempfile
+import timeit
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'metis'))
+
+from common import read_config_file
+from log import Log, LogLevel, _stop_writer
+from datetime import date
+
+__author__ = 'Kato Shinya'
+__date__ = '2018/04/21'
+
+class EagerLog(Log):
+    '''変更前のログ出力を再現するクラス。'''
+
+    def normal(self, level: int, id: str, class_name: str, location: list):
+        '''変更前の例外情報以外のログ出力。'''
+
+        self.logger.log(level, self.message[str(level)][id].format(location[0], location[1], class_name))
+
+    def debug(self, id: str, var_name: str, var_value, line_no: str):
+        '''変更前のデバッグ情報のログ出力。'''
+
+        self.logger.log(LogLevel.DEBUG.value, self.message['10'][id].format(line_no, var_name, var_value))
+
+def log_eager(log: EagerLog, article: tuple):
+    '''変更前の記事1件分のデバッグログ出力。'''
+
+    log.normal(LogLevel.DEBUG.value, 'LDEB0001', 'CrawlingHatena', log.location())
+    log.debug('LDEB0002', 'url', article[0], log.get_lineno())
+    log.debug('LDEB0002', 'title', article[1], log.get_lineno())
+    log.debug('LDEB0002', 'date', article[2], log.get_lineno())
+    log.debug('LDEB0002', 'tags', article[3], log.get_lineno())
+    log.debug('LDEB0002', 'last_index', article[4], log.get_lineno())
+    log.normal(LogLevel.DEBUG.value, 'LDEB0003', 'CrawlingHatena', log.location())
+
+def log_lazy(log: Log, article: tuple):
+    '''変更後の記事1件分のデバッグログ出力。'''
+
+    log.normal(LogLevel.DEBUG.value, 'LDEB0001', 'CrawlingHatena')
+    log.debug('LDEB0002', 'url', article[0])
+    log.debug('LDEB0002', 'title', article[1])
+    log.debug('LDEB0002', 'date', article[2])
+    log.debug('LDEB0002', 'tags', article[3])
+    log.debug('LDEB0002', 'last_index', article[4])
+    log.normal(LogLevel.DEBUG.value, 'LDEB0003', 'CrawlingHatena')
+
+def log_guarded(log: Log, article: tuple):
+    '''変更後のレベル判定を1度だけ行う記事1件分のデバッグログ出力。'''
+
+    if log.is_debug_enabled():
+        log_lazy(log, article)
+
+def main():
+    '''ベンチマークを実行する関数。'''
+
+    parser = argparse.ArgumentParser(description='Benchmark the per-article debug logging.')
+    parser.add_argument('--articles', type=int, default=100000, help='articles per run')
+    parser.add_argument('--repeat', type=int, default=5, help='number of runs (the best one is reported)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as dir_log:
+        # ログの出力先を一時ディレクトリへ変更し、DEBUGを出力しないレベルにする
+        config = read_config_file()
+        config['path']['dir_log'] = dir_log + os.sep
+        config['general']['log_level'] = LogLevel.INFO.value
+
+        lazy_log = Log()
+        eager_log = EagerLog()
+        article = ('http://example.com/entry/1', 'Title', '2018-06-01', 'python,sqlite', 1024)
+
+        cases = [
+            ('eager', lambda: log_eager(eager_log, article)),
+            ('lazy', lambda: log_lazy(lazy_log, article)),
+            ('guarded', lambda: log_guarded(lazy_log, article)),
+        ]
+
+        print('{} articles at INFO, best of {}'.format(args.articles, args.repeat))
+
+        for name, case in cases:
+            best = min(timeit.repeat(case, number=args.articles, repeat=args.repeat))
+            print('{:<10}{:>10.1f} ms{:>10.3f} us/article'.format(name, best * 1000, best * 1e6 / args.articles))
+
+        # DEBUGを出力する場合に呼び出し元の行番号とメソッド名が埋め込まれることを確認する
+        lazy_log.logger.setLevel(LogLevel.DEBUG.value)
+        log_guarded(lazy_log, article)
+
+        # 書き込みスレッドを停止して書き込み待ちのレコードを日付毎のログファイルへ書き込む
+        _stop_writer()
+        with open(os.path.join(dir_log, date.today().strftime('%Y%m%d') + '.mlog')) as f:
+            print('sample : {}'.format(f.readline().strip()))
+
+if __name__ == '__main__':
+    main()
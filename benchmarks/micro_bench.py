@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+
+'''
+
+timeit based micro-benchmarks for the hot paths of the crawler and the GUI.
+
+It measures
+
+* CrawlingHatena.__scrape_info_of_hatena on synthetic search pages of 40 to 10,000 articles,
+* common.split on parameter strings of 100 to 100,000 words,
+* Cowsay.cowsay on a short and a long message,
+* every query of ArticleInfoHatenaDao against databases of 10k, 100k and 1M articles.
+
+Each benchmark reports the best time per call over the repeats.
+Queries that write are rolled back after every call, and the rollback is part of the measured time.
+
+The results can be saved as a JSON baseline and later runs compared against it;
+a benchmark slower than the baseline by more than the threshold is flagged as a regression
+and the script exits with status 1, so it can gate a local CI-like run.
+Baselines depend on the machine, so they are kept out of version control.
+Run it from this directory:
+
+    python micro_bench.py [--sizes 10000,100000,1000000] [--filter REGEX] [--repeat 5]
+                          [--save [FILE]] [--compare [FILE]] [--threshold 0.2]
+
+:copyright: (c) 2018 by Kato Shinya.
+:license: MIT, see LICENSE for more details.
+'''
+
+from contextlib import redirect_stdout, redirect_stderr
+from datetime import date, timedelta
+import argparse
+import platform
+import tempfile
+import sqlite3
+import shutil
+import random
+import timeit
+import json
+import time
+import sys
+import os
+import re
+
+from crawl_bench import create_search_page, prepare_workspace, create_crawler
+
+__author__ = 'Kato Shinya'
+__date__ = '2018/04/21'
+
+# ベースラインの既定の保存先
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines', 'micro.json')
+# タグの語彙数
+TAG_VOCABULARY = 200
+
+def measure(function, repeat: int) -> float:
+    '''関数の1回あたりの最短実行時間を計測する関数。
+    1回の計測が0.2秒以上になるよう実行回数を自動で決定する。
+
+    :param function function: 計測対象の関数。
+    :param int repeat: 計測の繰り返し回数。
+    :rtype: float
+    :return: 1回あたりの最短実行時間(秒)。
+    '''
+
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+def scrape_benchmarks(crawler) -> dict:
+    '''スクレイピング処理のベンチマークを生成する関数。
+
+    :param crawler.CrawlingHatena crawler: クローラ。
+    :rtype: dict
+    :return: ベンチマーク名をキーとした計測対象の関数の辞書。
+    '''
+
+    benchmarks = {}
+    scrape = crawler._CrawlingHatena__scrape_info_of_hatena
+
+    for articles in (40, 1000, 10000):
+        html, urls = create_search_page('benchmark', 1, articles)
+        start, end = crawler.find_region(html, 'class="entrysearch-articles"', 'class="centerarticle-pager"')
+        benchmarks['scrape.articles_{}'.format(articles)] = lambda html=html, start=start, end=end: list(scrape(html, start, end))
+
+    return benchmarks
+
+def split_benchmarks() -> dict:
+    '''common.splitのベンチマークを生成する関数。
+
+    :rtype: dict
+    :return: ベンチマーク名をキーとした計測対象の関数の辞書。
+    '''
+
+    from common import split
+
+    benchmarks = {}
+
+    for words in (100, 10000, 100000):
+        target = ','.join('searchword{}'.format(i) for i in range(words))
+        benchmarks['split.words_{}'.format(words)] = lambda target=target: split(target, ',')
+
+    return benchmarks
+
+def cowsay_benchmarks() -> dict:
+    '''Cowsay.cowsayのベンチマークを生成する関数。
+
+    :rtype: dict
+    :return: ベンチマーク名をキーとした計測対象の関数の辞書。
+    '''
+
+    from cowsay import Cowsay
+
+    cowsay = Cowsay()
+    short = 'Crawling is done.'
+    long = ' '.join('Python {} records were inserted into the database.'.format(i) for i in range(20))
+
+    return {
+        'cowsay.short' : lambda: cowsay.cowsay(short),
+        'cowsay.long' : lambda: cowsay.cowsay(long),
+    }
+
+def create_database(path_template: str, path: str, rows: int):
+    '''指定件数の記事情報を登録したDBを生成する関数。
+    タイトルとタグはスクレイピング時と同様に正規化し、公開日はISO 8601形式(YYYY-MM-DD)で登録する。
+    削除予定日は約1割が期限切れとなるよう分散させる。
+
+    :param str path_template: 複製元の空のDBへのパス。複製後にスキーマを最新化する。
+    :param str path: 生成するDBへのパス。
+    :param int rows: 記事情報の件数。
+    '''
+
+    from common import read_config_file, normalize_fields
+    from sql import SchemaMigrator
+
+    shutil.copy(path_template, path)
+
+    storage_encoding = read_config_file()['database']['storage_encoding']
+    rnd = random.Random(rows)
+    today = date.today()
+
+    def generate():
+        for i in range(rows):
+            tags = ','.join('tag{}'.format(rnd.randrange(TAG_VOCABULARY)) for _ in range(rnd.randint(1, 5)))
+            title, tags = normalize_fields(['Benchmark article {} &amp; について'.format(i), tags], storage_encoding)
+            registered = today - timedelta(rnd.randint(0, 20))
+            yield ('http://example.com/entry/{:07d}'.format(i),
+                    title,
+                    registered.isoformat(),
+                    int(rnd.paretovariate(1.2)) - 1,
+                    tags,
+                    '{} 09:00:00'.format(registered.isoformat()),
+                    '{} 12:00:00'.format(registered.isoformat()),
+                    int((registered + timedelta(21 - rnd.randint(0, 2))).strftime('%Y%m%d')))
+
+    conn = sqlite3.connect(path)
+    # 全文検索インデックスは登録時のトリガで構築する
+    SchemaMigrator().migrate(conn)
+    conn.executemany('INSERT INTO ARTICLE_INFO_HATENA VALUES (?, ?, ?, ?, ?, ?, ?, ?)', generate())
+    conn.commit()
+    conn.execute('ANALYZE')
+    conn.close()
+
+def dao_benchmarks(path: str, rows: int) -> tuple:
+    '''ArticleInfoHatenaDaoの各クエリのベンチマークを生成する関数。
+
+    :param str path: 記事情報を登録したDBへのパス。
+    :param int rows: 登録した記事情報の件数。
+    :rtype: tuple
+    :return: ベンチマーク名をキーとした計測対象の関数の辞書と、DBとのコネクションのタプル。
+    '''
+
+    from common import connect_to_database
+    from sql import ArticleInfoHatenaDao, ArticleInfoHatenaFtsDao, WorkArticleInfoHatenaDao
+
+    dao = ArticleInfoHatenaDao()
+    fts_dao = ArticleInfoHatenaFtsDao()
+    conn, cursor = connect_to_database(path=path, shared=False)
+
+    rnd = random.Random(0)
+    today = int(date.today().strftime('%Y%m%d'))
+    search_word = '%tag7%'
+    url = 'http://example.com/entry/{:07d}'.format(rows // 2)
+    # 半数は未登録のURLとする
+    urls = ['http://example.com/entry/{:07d}'.format(rnd.randrange(rows * 2)) for _ in range(500)]
+    article_info = {'URL' : 'http://example.com/new', 'TITLE' : 'New article', 'PUBLISHED_DATE' : date.today().isoformat(), 'BOOKMARKS' : 1, 'TAG' : 'tag1,tag2', 'RESERVED_DEL_DATE' : today}
+
+    # 移行処理用にワークテーブルへ登録済みと未登録の記事情報を用意する
+    WorkArticleInfoHatenaDao().insert_article_infos_bulk(cursor, [dict(article_info, URL=work_url) for work_url in urls])
+    conn.commit()
+
+    def rollback(query):
+        def run():
+            query()
+            conn.rollback()
+        return run
+
+    benchmarks = {
+        'select_by_search_word' : lambda: dao.select_by_search_word(cursor, search_word),
+        'select_by_primary_key' : lambda: dao.select_by_primary_key(cursor, url),
+        'select_urls_by_primary_keys' : lambda: dao.select_urls_by_primary_keys(cursor, urls),
+        'select_url_after' : lambda: dao.select_url_after(cursor, url, 500),
+        'count_records_after_url' : lambda: dao.count_records_after_url(cursor, url),
+        'select_url_by_refresh_priority' : lambda: dao.select_url_by_refresh_priority(cursor, 6, 2000),
+        'count_records_by_refresh_priority' : lambda: dao.count_records_by_refresh_priority(cursor, 6),
+        'select_order_by_bookmarks_desc' : lambda: dao.select_order_by_bookmarks_desc(cursor, search_word),
+        'select_order_by_bookmarks_asc' : lambda: dao.select_order_by_bookmarks_asc(cursor, search_word),
+        'fts_search' : lambda: fts_dao.search(cursor, search_word.strip('%'), 500),
+        'fts_search_order_by_bookmarks_after' : lambda: fts_dao.search_order_by_bookmarks_after(cursor, search_word.strip('%'), None, 500),
+        'fts_count' : lambda: fts_dao.count(cursor, search_word.strip('%')),
+        'select_expired' : lambda: dao.select_expired(cursor, today, 1000),
+        'count_expired' : lambda: dao.count_expired(cursor, today),
+        'delete_by_primary_keys' : rollback(lambda: dao.delete_by_primary_keys(cursor, urls[:100])),
+        'update_bookmarks_by_primary_key' : rollback(lambda: dao.update_bookmarks_by_primary_key(cursor, 10, url)),
+        'update_bookmarks_by_primary_keys' : rollback(lambda: dao.update_bookmarks_by_primary_keys(cursor, [(10, target) for target in urls])),
+        'insert_article_infos' : rollback(lambda: dao.insert_article_infos(cursor, article_info)),
+        'transfer_article_info_from_work' : rollback(lambda: dao.transfer_article_info_from_work(cursor)),
+    }
+
+    return {'dao.{}.rows_{}'.format(name, rows) : function for name, function in benchmarks.items()}, conn
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    '''ベースラインと比較し、閾値を超えて遅くなったベンチマークを返す関数。
+
+    :param dict results: ベンチマーク名をキーとした1回あたりの実行時間の辞書。
+    :param dict baseline: ベースラインの同形式の辞書。
+    :param float threshold: 許容する増加率。0.2の場合は20%までの増加を許容する。
+    :rtype: list
+    :return: 劣化したベンチマーク名のリスト。
+    '''
+
+    return [name for name, seconds in results.items() if name in baseline and seconds > baseline[name] * (1 + threshold)]
+
+def format_report(results: dict, baseline: dict, regressions: list) -> str:
+    '''計測結果を表形式の文字列にする関数。
+
+    :param dict results: ベンチマーク名をキーとした1回あたりの実行時間の辞書。
+    :param dict baseline: ベースラインの同形式の辞書。比較しない場合は空の辞書。
+    :param list regressions: 劣化したベンチマーク名のリスト。
+    :rtype: str
+    :return: 表形式の計測結果。
+    '''
+
+    lines = ['{:<60}{:>14}{:>14}{:>9}'.format('benchmark', 'usec/call', 'baseline', 'ratio')]
+
+    for name, seconds in results.items():
+        if name in baseline:
+            lines.append('{:<60}{:>14.2f}{:>14.2f}{:>9.2f}{}'.format(name, seconds * 1e6, baseline[name] * 1e6, seconds / baseline[name], '  REGRESSION' if name in regressions else ''))
+        else:
+            lines.append('{:<60}{:>14.2f}{:>14}{:>9}'.format(name, seconds * 1e6, '-', '-'))
+
+    return '\n'.join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description='Micro-benchmarks for the scraper, split(), Cowsay and ArticleInfoHatenaDao.')
+    parser.add_argument('--sizes', default='10000,100000,1000000', help='comma separated row counts of the benchmark databases')
+    parser.add_argument('--filter', default='', help='run only the benchmarks whose name matches this regular expression')
+    parser.add_argument('--repeat', type=int, default=5, help='repeats of each measurement (the best one is reported)')
+    parser.add_argument('--save', nargs='?', const=DEFAULT_BASELINE, help='save the results as a baseline (default: baselines/micro.json)')
+    parser.add_argument('--compare', nargs='?', const=DEFAULT_BASELINE, help='compare with a baseline (default: baselines/micro.json)')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed slowdown against the baseline (0.2 = 20%%)')
+    args = parser.parse_args()
+
+    # 実行中にmetisディレクトリへ移動するため先に絶対パスにしておく
+    args.save = args.save and os.path.abspath(args.save)
+    args.compare = args.compare and os.path.abspath(args.compare)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+
+    pattern = re.compile(args.filter)
+    dir_work = tempfile.mkdtemp(prefix='metis_micro_')
+    results = {}
+    connections = []
+
+    try:
+        # 通信は行わないためURLは使用されない
+        path_template = prepare_workspace(dir_work, 'http://127.0.0.1:9', ['benchmark'])
+
+        from crawler import CrawlingHatena
+        from sql import ArticleInfoHatenaDao
+
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull), redirect_stderr(devnull):
+            # 生成時にテンプレートのDBのスキーマが最新化される
+            crawler = create_crawler(CrawlingHatena, '0', name='micro_bench')
+
+        suites = [lambda: scrape_benchmarks(crawler), split_benchmarks, cowsay_benchmarks]
+
+        for rows in [int(size) for size in args.sizes.split(',') if size]:
+            def suite(rows=rows):
+                path = os.path.join(dir_work, 'ARTICLES_{}.db'.format(rows))
+                started = time.perf_counter()
+                create_database(path_template, path, rows)
+                print('created a database of {} rows in {:.1f}s'.format(rows, time.perf_counter() - started), file=sys.stderr)
+
+                benchmarks, conn = dao_benchmarks(path, rows)
+                connections.append(conn)
+                return benchmarks
+
+            # 対象のベンチマークが含まれない場合はDBを生成しない
+            if any(pattern.search('dao.{}.rows_{}'.format(name, rows)) for name in vars(ArticleInfoHatenaDao) if not name.startswith('_')):
+                suites.append(suite)
+
+        for create_suite in suites:
+            for name, function in create_suite().items():
+                if pattern.search(name):
+                    results[name] = measure(function, args.repeat)
+                    print('{:<60}{:>14.2f} usec'.format(name, results[name] * 1e6), file=sys.stderr)
+    finally:
+        for conn in connections:
+            conn.close()
+
+        shutil.rmtree(dir_work, ignore_errors=True)
+
+    regressions = compare(results, baseline, args.threshold)
+    print(format_report(results, baseline, regressions))
+
+    if args.save:
+        os.makedirs(os.path.dirname(args.save), exist_ok=True)
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({'python' : platform.python_version(), 'sqlite' : sqlite3.sqlite_version, 'platform' : platform.platform(), 'results' : results}, f, indent=2)
+
+    if regressions:
+        print('{} benchmark(s) regressed by more than {:.0%}.'.format(len(regressions), args.threshold))
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
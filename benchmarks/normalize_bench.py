@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+'''
+
+Benchmark for the normalisation of scraped article fields.
+
+It compares the former per-article approach
+(a new HTMLParser per article, unescaping the title, and cp932 round-trips of the title once and of the tags twice)
+with common.normalize_fields, which unescapes and re-encodes all titles and tags of a page in one call,
+both with the cp932 storage encoding and with UTF-8 (no round-trip).
+
+Run it from this directory:
+
+    python normalize_bench.py [--articles 40] [--pages 200] [--repeat 5]
+
+:copyright: (c) 2018 by Kato Shinya.
+:license: MIT, see LICENSE for more details.
+'''
+
+from html.parser import HTMLParser
+import argparse
+import timeit
+import html
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'metis'))
+
+from common import normalize_fields
+
+__author__ = 'Kato Shinya'
+__date__ = '2018/04/21'
+
+def create_page(articles: int, seed: int) -> list:
+    '''ベンチマーク用の1ページ分の(タイトル, タグ)を生成する関数。
+    タイトルには文字参照、日本語およびcp932で表現できない文字を含める。
+
+    :param int articles: 1ページあたりの記事数。
+    :param int seed: タイトルを区別するための値。
+    :rtype: list
+    :return: (タイトル, タグ)のタプルのリスト。
+    '''
+
+    return [('Pythonで &quot;高速&quot; に処理する &amp; 計測する #{} &#x1F680;'.format(seed * articles + i),
+                ','.join('tag{}&amp;x'.format(j) for j in range(i % 6))) for i in range(articles)]
+
+def normalize_per_article(page: list) -> list:
+    '''変更前の記事単位の正規化処理。
+
+    :param list page: (タイトル, タグ)のタプルのリスト。
+    :rtype: list
+    :return: 正規化した(タイトル, タグ)のタプルのリスト。
+    '''
+
+    normalized = []
+
+    for title, tags in page:
+        # 変更前は記事毎にHTMLParserを生成してHTMLParser.unescape(html.unescapeと同等)を呼び出していた
+        HTMLParser()
+        title = html.unescape(title).encode('cp932', 'ignore').decode('cp932')
+        tags = tags.encode('cp932', 'ignore').decode('cp932')
+        tags = tags.encode('cp932', 'ignore').decode('cp932')
+        normalized.append((title, tags))
+
+    return normalized
+
+def normalize_per_page(page: list, encoding: str) -> list:
+    '''ページ単位の正規化処理。
+
+    :param list page: (タイトル, タグ)のタプルのリスト。
+    :param str encoding: 保存時の文字コード。
+    :rtype: list
+    :return: 正規化した(タイトル, タグ)のタプルのリスト。
+    '''
+
+    fields = normalize_fields([field for article in page for field in article], encoding)
+
+    return list(zip(fields[0::2], fields[1::2]))
+
+def main():
+    '''ベンチマークを実行する関数。'''
+
+    parser = argparse.ArgumentParser(description='Benchmark the normalisation of scraped fields.')
+    parser.add_argument('--articles', type=int, default=40, help='articles per page')
+    parser.add_argument('--pages', type=int, default=200, help='pages per run')
+    parser.add_argument('--repeat', type=int, default=5, help='number of runs (the best one is reported)')
+    args = parser.parse_args()
+
+    pages = [create_page(args.articles, seed) for seed in range(args.pages)]
+    cases = [
+        ('per article (cp932)', lambda: [normalize_per_article(page) for page in pages]),
+        ('per page (cp932)', lambda: [normalize_per_page(page, 'cp932') for page in pages]),
+        ('per page (utf-8)', lambda: [normalize_per_page(page, 'utf-8') for page in pages]),
+    ]
+
+    baseline = None
+    print('{} pages x {} articles, best of {}'.format(args.pages, args.articles, args.repeat))
+
+    for name, case in cases:
+        best = min(timeit.repeat(case, number=1, repeat=args.repeat))
+        baseline = baseline or best
+        print('{:<22}{:>10.2f} ms{:>10.2f} us/article{:>8.2f}x'.format(name, best * 1000, best * 1e6 / (args.pages * args.articles), baseline / best))
+
+if __name__ == '__main__':
+    main()
@@ -6,24 +6,48 @@
 '''
 
 import sqlite3
+import threading
+import html
+import atexit
 import json
 import string
 import random
 import hashlib
+import codecs
+import os
 
 __author__ = 'Kato Shinya'
 __date__ = '2018/04/21'
 
+# 構成情報のキャッシュ
+_config = None
+# スレッド毎に共有するDBコネクション
+# DBへアクセスするのは各プロセスのメインスレッドのみであり、通信用のスレッドプールはDBへアクセスしないため、
+# 実際に生成されるのはプロセス毎に1つとなる。
+# sqlite3のコネクションはスレッド間で共有するとトランザクションの境界が混在するため、スレッド毎に分けている。
+_shared_connections = threading.local()
+# 文字列を一括で正規化する際の区切り文字(文字参照からは生成されない制御文字)
+_FIELD_SEPARATOR = '\x1f'
+# 値に含まれる区切り文字を置き換える文字参照
+_FIELD_SEPARATOR_REFERENCE = '&#31;'
+
 def read_config_file():
     '''構成管理ファイルを読み込む関数。
+    ファイルの読み込みはプロセス内で初回のみ行い、以降はキャッシュを返す。
+    環境変数METIS_CONFIGが設定されている場合は、そのパスの構成管理ファイルを読み込む。
 
     :rtype: dict
     :return: 構成情報を格納した辞書。
     '''
 
-    # 構成管理ファイルの読み込み
-    with open('../env/userConfig.json', 'r') as f:
-        return json.load(f)
+    global _config
+
+    if _config is None:
+        # 構成管理ファイルの読み込み
+        with open(os.environ.get('METIS_CONFIG', '../env/userConfig.json'), 'r') as f:
+            _config = json.load(f)
+
+    return _config
 
 def read_log_message_file():
     '''ログメッセージ管理ファイルを読み込む関数。
@@ -76,11 +100,32 @@ def convert_to_hash_sha256(message: str) -> str:
 
     return hashlib.sha256(message.encode('cp932')).hexdigest()
 
-def connect_to_database(isolation_level='EXCLUSIVE'):
+class SharedConnection(sqlite3.Connection):
+    '''プロセス内で再利用されるDBコネクションクラス。
+    呼び出し元でのclose()では接続を閉じずに、未確定のトランザクションのみを破棄する。
+    '''
+
+    def close(self):
+        '''未確定のトランザクションを破棄するメソッド。接続は維持する。'''
+
+        if self.in_transaction:
+            self.rollback()
+
+    def close_shared(self):
+        '''接続を閉じるメソッド。'''
+
+        super().close()
+
+def connect_to_database(isolation_level=None, path=None, shared=None):
     '''データベースへ接続する関数。
     コネクションの開放処理は呼び出し元で別途行う。
+    共有コネクションが有効な場合は、スレッド毎に生成済みのコネクションを再利用する。
+    別スレッドのコネクションは返却しないため、ワーカースレッドからDBへアクセスしても他スレッドのトランザクションに混在しない。
+    新規に接続した場合は、構成管理ファイルのdatabaseセクションに定義されたPRAGMAを適用する。
 
-    :param str isolation_level: トランザクション分離レベルを指定する。初期値は'EXCLUSIVE'。
+    :param str isolation_level: トランザクション分離レベルを指定する。初期値はNone(構成管理ファイルの値)。
+    :param str path: DBファイルへのパス。初期値はNone(構成管理ファイルの値)。
+    :param bool shared: コネクションを再利用するか否か。初期値はNone(構成管理ファイルの値)。
     :rtype: sqlite3.Cursor
     :rtype: sqlite3.Connection
     :return: コネクション。
@@ -89,14 +134,77 @@ def connect_to_database(isolation_level='EXCLUSIVE'):
 
     # 設定ファイルの読み込み
     config = read_config_file()
+    database = config['database']
+
+    if isolation_level is None:
+        isolation_level = database['isolation_level']
+    if path is None:
+        path = config['path']['database']
+    if shared is None:
+        shared = database['shared_connection']
 
     # トレースバックの設定
     sqlite3.enable_callback_tracebacks(True)
 
-    conn = sqlite3.connect(config['path']['database'], isolation_level=isolation_level)
-    cursor = conn.cursor()
+    if not shared:
+        conn = sqlite3.connect(path, isolation_level=isolation_level, timeout=database['busy_timeout_sec'])
+        _apply_pragmas(conn, database)
+        return conn, conn.cursor()
+
+    # 子プロセスへ引き継がれたコネクションは使用しない
+    connections = getattr(_shared_connections, 'connections', None)
+    if getattr(_shared_connections, 'pid', None) != os.getpid() or connections is None:
+        connections = _shared_connections.connections = {}
+        _shared_connections.pid = os.getpid()
+
+    conn = connections.get(path)
+    if conn is None:
+        # 生成したスレッドのみが使用するが、終了時の切断はメインスレッドから行うため同一スレッドの検査を外す
+        conn = sqlite3.connect(path, isolation_level=isolation_level, timeout=database['busy_timeout_sec'], factory=SharedConnection, check_same_thread=False)
+        _apply_pragmas(conn, database)
+        connections[path] = conn
+        atexit.register(conn.close_shared)
+    elif conn.isolation_level != isolation_level:
+        conn.isolation_level = isolation_level
+
+    return conn, conn.cursor()
+
+def _apply_pragmas(conn: sqlite3.Connection, database: dict):
+    '''構成管理ファイルに定義されたPRAGMAをコネクションへ適用する関数。
+
+    :param sqlite3.Connection conn: DBとのコネクション。
+    :param dict database: 構成管理ファイルのdatabaseセクション。
+    '''
+
+    for pragma in ['journal_mode', 'synchronous', 'temp_store', 'cache_size', 'mmap_size']:
+        if pragma in database:
+            conn.execute('PRAGMA {} = {}'.format(pragma, database[pragma]))
+
+def normalize_fields(values: list, encoding='utf-8') -> list:
+    '''スクレイピングした文字列をまとめて正規化する関数。
+    文字参照を復元し、保存時の文字コードがUTF-8以外の場合はその文字コードで表現できない文字を除く。
+    全ての値を連結して1度で変換するため、値毎に変換するよりも変換処理の呼び出し回数が少ない。
+    値に含まれる区切り文字(U+001F)は文字参照へ置き換えてから連結する。
+    HTMLの本文で使用できない制御文字の文字参照は復元時に除かれるため、区切り文字は文字参照で記述された場合と同様に除かれる。
+
+    :param list values: 正規化する文字列のリスト。
+    :param str encoding: 保存時の文字コード。初期値は'utf-8'(文字を除かない)。
+    :rtype: list
+    :return: 正規化した文字列のリスト。
+
+    >>> normalize_fields(['A &amp; B', '&lt;tag&gt;'], 'cp932')
+    >>> ['A & B', '<tag>']
+    '''
+
+    if not values:
+        return []
+
+    joined = _FIELD_SEPARATOR.join(value.replace(_FIELD_SEPARATOR, _FIELD_SEPARATOR_REFERENCE) for value in values)
+    normalized = html.unescape(joined)
+    if codecs.lookup(encoding).name != 'utf-8':
+        normalized = normalized.encode(encoding, 'ignore').decode(encoding)
 
-    return conn, cursor
+    return normalized.split(_FIELD_SEPARATOR)
 
 def split(target: str, split_words: str) -> list:
     '''組み込みsplit関数の拡張関数。
@@ -25,20 +25,35 @@ typically into a central local database or spreadsheet, for later retrieval or a
 from urllib.request import Request, urlopen
 from urllib.error import URLError, HTTPError
 from urllib.parse import urlencode
-import html.parser as htmlparser
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+import multiprocessing
+import threading
+import json
+import gzip
 import warnings
 import time
 import sys
-from datetime import date, timedelta
+import os
+import os.path
+import glob
+from datetime import date, datetime, timedelta
 import sqlite3
 from tqdm import tqdm
 from log import LogLevel, Log
 from cowsay import Cowsay
 from common import *
 from message import ShowMessages
+from httpclient import HttpConnectionPool
+from httpcache import HttpCache
+from telemetry import get_telemetry
 from sql import MstParameterDao
 from sql import ArticleInfoHatenaDao
 from sql import WorkArticleInfoHatenaDao
+from sql import ArticleInfoHatenaFtsDao
+from sql import ArticleTagDao
+from sql import DatabaseMaintenanceDao
+from sql import DeadLetterHatenaDao
+from sql import SchemaMigrator
 from sql import ManageSerialDao
 
 warnings.filterwarnings('ignore')
@@ -83,6 +98,10 @@ class CrawlHandler:
             # ブックマークの更新処理を行う
             crawler = UpdateBookmarksHatena(args)
             crawler.execute()
+        elif self.__order == '2':
+            # 削除予定日を過ぎた記事情報の削除処理を行う
+            crawler = PurgeExpiredArticlesHatena(args)
+            crawler.execute()
         else:
             message = ShowMessages()
             message.showerror('MERR0009')
@@ -93,11 +112,13 @@ class CrawlHandler:
 class CommunicateBase:
     '''通信処理を定義する基底クラス。'''
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, check_internet=True, shards=1, **kwargs):
         '''コンストラクタ。
         コンストラクタ内で疎通確認に失敗した場合は後続処理を行わない。
 
         :param tuple args: タプルの可変長引数。
+        :param bool check_internet: インターネットとの疎通確認を行うか否か。初期値はTrue。
+        :param int shards: 同時に同じホストへ通信するワーカプロセス数。ホスト毎の制限値をプロセス数で分け合う。初期値は1。
         :param dict kwargs: 辞書の可変長引数。
         '''
 
@@ -108,9 +129,61 @@ class CommunicateBase:
         self.log = Log(child=True)
         # メッセージ出力のためインスタンス生成
         self.message = ShowMessages()
-
-        # インターネットとの疎通確認を行う
-        self.__check_internet_connection()
+        # 設定ファイルの読み込み
+        self.config = read_config_file()
+
+        # 並列取得時の最大スレッド数
+        self.CONCURRENCY = max(1, int(self.config['crawler']['concurrency']))
+        # ブックマーク数一括取得時の1リクエストあたりのURL数
+        self.BOOKMARK_BATCH_SIZE = max(1, int(self.config['crawler']['bookmark_batch_size']))
+        # ブックマーク数更新時の最大スレッド数
+        self.REFRESH_CONCURRENCY = max(1, int(self.config['crawler']['refresh_concurrency']))
+        # ブックマーク数更新時の1トランザクションあたりの件数
+        self.REFRESH_CHUNK_SIZE = max(1, int(self.config['crawler']['refresh_chunk_size']))
+        # ブックマーク数の更新方針('incremental' / 'full')
+        self.REFRESH_POLICY = self.config['crawler']['refresh_policy']
+        # 差分更新時に1回の処理で更新する最大件数
+        self.REFRESH_TOP_K = max(1, int(self.config['crawler']['refresh_top_k']))
+        # 差分更新時の処理時間の上限(秒)
+        self.REFRESH_TIME_BUDGET_SEC = float(self.config['crawler']['refresh_time_budget_sec'])
+        # 差分更新時に更新対象外とする最終更新日時からの経過時間
+        self.REFRESH_MIN_AGE_HOURS = int(self.config['crawler']['refresh_min_age_hours'])
+        # 失敗したリクエストを再投入する失敗回数の上限
+        self.DEAD_LETTER_MAX_ATTEMPTS = max(1, int(self.config['crawler']['dead_letter_max_attempts']))
+        # 処理終了時にコンソールの出力を確認できるよう待機する時間(秒)
+        self.EXIT_PAUSE_SEC = max(0.0, float(self.config['crawler']['exit_pause_sec']))
+        # 処理段階毎の所要時間とカウンタを記録するテレメトリ
+        self.telemetry = get_telemetry()
+        # ワーカプロセス毎にコネクションプールを持つため、ホスト毎の制限値は全プロセスの合計が設定値を超えないよう分割する
+        shards = max(1, shards)
+        # ホスト毎にKeep-Alive接続を再利用するコネクションプール
+        self.http = HttpConnectionPool(
+                        max_connections_per_host=max(1, int(self.config['crawler']['max_connections_per_host']) // shards),
+                        timeout=float(self.config['http']['timeout_sec']),
+                        retries=int(self.config['http']['retries']),
+                        backoff=float(self.config['http']['backoff_sec']),
+                        compression=bool(self.config['http']['compression']),
+                        rate_per_host=float(self.config['http']['rate_per_host']) / shards,
+                        burst_per_host=max(1, int(self.config['http']['burst_per_host']) // shards),
+                        max_backoff=float(self.config['http']['max_backoff_sec']),
+                        telemetry=self.telemetry
+                    )
+        # 再試行後も失敗したリクエスト(種別, 対象, 失敗理由)
+        self.dead_letters = []
+        # 上記リストの排他制御用ロック
+        self.dead_letters_lock = threading.Lock()
+        # HTTPレスポンスのキャッシュ
+        self.http_cache = None
+        if self.config['cache']['enabled']:
+            self.http_cache = HttpCache(
+                                self.config['path']['http_cache'],
+                                ttl=int(self.config['cache']['ttl_sec']),
+                                max_bytes=int(self.config['cache']['max_bytes'])
+                            )
+
+        if check_internet:
+            # インターネットとの疎通確認を行う
+            self.__check_internet_connection()
 
         # MANAGE_SERIAL.TBLのDAOクラス
         self.manage_serial_dao = ManageSerialDao()
@@ -119,8 +192,12 @@ class CommunicateBase:
 
         # UserAgent定義
         self.DEF_USER_AGENT = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/66.0.3359.181 Safari/537.36'}
+        # Hatena検索ページ
+        self.HATENA_SEARCH_URL = self.config['url']['hatena_search']
         # Hatenaブックマーク数取得API
-        self.HATENA_BOOKMARK_API = 'http://api.b.st-hatena.com/entry.count'
+        self.HATENA_BOOKMARK_API = self.config['url']['hatena_bookmark_api']
+        # Hatenaブックマーク数一括取得API
+        self.HATENA_BOOKMARKS_API = self.config['url']['hatena_bookmarks_api']
 
         # MST_PARAMETER.TBLのDAOクラス
         self.mst_parameter_dao = MstParameterDao()
@@ -128,40 +205,196 @@ class CommunicateBase:
         self.article_info_hatena_dao = ArticleInfoHatenaDao()
         # WORK_ARTICLE_INFO_HATENA.TBLのDAOクラス
         self.work_article_info_hatena_dao = WorkArticleInfoHatenaDao()
+        # ARTICLE_TAG.TBLのDAOクラス
+        self.article_tag_dao = ArticleTagDao()
+        # DEAD_LETTER_HATENA.TBLのDAOクラス
+        self.dead_letter_hatena_dao = DeadLetterHatenaDao()
 
-    def get_html(self, url: str, params={}, headers={}) -> str:
+        # 記事情報の登録前にスキーマを最新化する
+        self.__migrate_schema()
+
+    def get_html(self, url: str, params={}, headers={}, dead_letter=None) -> str:
         '''HTTP(s)通信を行いWebサイトからHTMLソースを取得するメソッド。
         decode時に引数として'ignore'を渡しているのは、
         APIからプレーンテキストを取得する際に文字コードを取得できないことによって、
         プログラムが異常終了するのを防ぐため。
-        接続エラー時には空文字を返す。
+        接続エラー時にはNoneを返し、失敗したリクエストの種別と対象が指定されている場合は再投入用に記録する。
+        キャッシュが有効な場合はキャッシュまたは条件付きリクエストでの再検証結果を返す。
+        接続はホスト毎にコネクションプールで再利用され、
+        複数スレッドから呼び出された場合でもホスト毎の同時接続数と送信間隔は設定ファイルで指定された上限を超えない。
 
         :param str url: 取得対象URL。
-        :param dict params: パラメータ生成用辞書。初期値は空の辞書。
+        :param dict params: パラメータ生成用辞書。同名パラメータを複数指定する場合はタプルのリスト。初期値は空の辞書。
         :param dict headers: ヘッダ生成用辞書。初期値は空の辞書。
+        :param tuple dead_letter: 失敗時に記録する(種別, 対象のリスト)のタプル。初期値はNone。
         :rtype: str
-        :return: 対象URLにHTTP(s)通信を行い取得したHTMLソース。
+        :return: 対象URLにHTTP(s)通信を行い取得したHTMLソース。接続エラー時はNone。
         '''
 
         # 接続先URL
         url = '{}?{}'.format(url, urlencode(params))
 
         # デバッグログ
-        self.log.normal(LogLevel.DEBUG.value, 'LDEB0001', self.BASE_CLASS_NAME, self.log.location())
-        self.log.debug('LDEB0002', 'url', url, self.log.get_lineno())
-        self.log.normal(LogLevel.DEBUG.value, 'LDEB0003', self.BASE_CLASS_NAME, self.log.location())
+        self.log.normal(LogLevel.DEBUG.value, 'LDEB0001', self.BASE_CLASS_NAME)
+        self.log.debug('LDEB0002', 'url', url)
+        self.log.normal(LogLevel.DEBUG.value, 'LDEB0003', self.BASE_CLASS_NAME)
 
         try:
-            with urlopen(Request(url=url, headers=headers)) as source:
-                # リソースから文字コードを取得
-                charset = source.headers.get_content_charset(failobj='utf-8')
-                # リソースをbytes型からString型にデコード
-                html = source.read().decode(charset, 'ignore')
+            source = None
+            if self.http_cache:
+                try:
+                    # キャッシュを確認し、必要な場合のみコネクションプールから接続を取得して通信する
+                    source = self.http_cache.fetch(self.http, url, headers=headers)
+                except sqlite3.Error as e:
+                    # キャッシュファイルを利用できない場合はキャッシュを使用せずに通信する
+                    self.log.normal(LogLevel.ERROR.value, 'LERR0001', self.BASE_CLASS_NAME)
+                    self.log.error(e)
+            if source is None:
+                # コネクションプールから接続を取得して通信する
+                source = self.http.request(url, headers=headers)
+            # 伸長済みのリソースをContent-Typeの文字コードでbytes型からString型にデコード
+            html = source.text('ignore')
             return html
         except URLError as e:
             # 接続エラー
             self.__handling_url_exception(e)
-            return ''
+
+            if dead_letter:
+                self.record_dead_letters(dead_letter[0], dead_letter[1], str(e))
+
+            return None
+
+    def get_bookmark_counts(self, urls: list) -> dict:
+        '''APIから複数URLのブックマーク数を一括で取得するメソッド。
+        設定ファイルで指定されたURL数毎にリクエストを分割する。
+        APIの返却値に含まれないURLはブックマーク数を0とする。
+        接続エラー時や返却値を解釈できない場合のURLは返却値に含めず、再投入用に記録する。
+
+        :param list urls: 取得対象URLのリスト。
+        :rtype: dict
+        :return: URLをキーとしたブックマーク数の辞書。
+
+        >>> get_bookmark_counts(['http://a.com', 'http://b.com'])
+        >>> {'http://a.com': 10, 'http://b.com': 0}
+        '''
+
+        # ブックマーク数が0の場合はAPIが値を返さないため初期値を設定しておく
+        counts = dict.fromkeys(urls, 0)
+
+        for i in range(0, len(urls), self.BOOKMARK_BATCH_SIZE):
+            batch = urls[i:i+self.BOOKMARK_BATCH_SIZE]
+            # 'url'パラメータを複数指定する
+            params = [('url', url) for url in batch]
+            with self.telemetry.timer('bookmark_api', urls=len(batch)):
+                response = self.get_html(url=self.HATENA_BOOKMARKS_API, params=params, headers=self.DEF_USER_AGENT, dead_letter=(DeadLetterHatenaDao.KIND_BOOKMARKS, batch))
+
+            try:
+                if response is not None:
+                    batch_counts = {url : int(count) for url, count in json.loads(response).items() if url in counts}
+                    counts.update(batch_counts)
+                    continue
+            except (ValueError, TypeError, AttributeError) as e:
+                self.log.normal(LogLevel.ERROR.value, 'LERR0001', self.BASE_CLASS_NAME)
+                self.log.error(e)
+                self.record_dead_letters(DeadLetterHatenaDao.KIND_BOOKMARKS, batch, str(e))
+
+            # 取得できなかったURLのブックマーク数は0で上書きしないよう返却値から除く
+            for url in batch:
+                counts.pop(url, None)
+
+        return counts
+
+    def record_dead_letters(self, kind: str, targets: list, reason: str):
+        '''再試行後も失敗したリクエストを記録するメソッド。
+        ワーカースレッドから呼び出されるため、DBへの登録はflush_dead_lettersで行う。
+
+        :param str kind: リクエストの種別。
+        :param list targets: リクエストの対象のリスト。
+        :param str reason: 失敗理由。
+        '''
+
+        with self.dead_letters_lock:
+            self.dead_letters.extend((kind, target, reason,) for target in targets)
+
+    def take_dead_letters(self) -> list:
+        '''記録した失敗したリクエストを取り出すメソッド。
+
+        :rtype: list
+        :return: (種別, 対象, 失敗理由)のタプルを格納したリスト。
+        '''
+
+        with self.dead_letters_lock:
+            dead_letters, self.dead_letters = self.dead_letters, []
+
+        return dead_letters
+
+    def flush_dead_letters(self, conn: sqlite3.Connection, cursor: sqlite3.Cursor):
+        '''記録した失敗したリクエストをDEAD_LETTER_HATENA.TBLへ登録するメソッド。
+
+        :param sqlite3.Connection conn: DBとのコネクション。
+        :param sqlite3.Cursor cursor: カーソルオブジェクト。
+        '''
+
+        # 同一処理内で複数回失敗したリクエストは1回の失敗として記録する
+        dead_letters = list({dead_letter[:2] : dead_letter for dead_letter in self.take_dead_letters()}.values())
+        if not dead_letters:
+            return
+
+        self.dead_letter_hatena_dao.upsert_dead_letters(cursor, dead_letters)
+        conn.commit()
+
+        print(self.message.get_echo('MECH0017', len(dead_letters), 'requests' if len(dead_letters) > 1 else 'request'))
+
+    def redrive_bookmark_counts(self, conn: sqlite3.Connection, cursor: sqlite3.Cursor):
+        '''ブックマーク数の取得に失敗した記事のブックマーク数を再取得するメソッド。
+        再取得に成功した記事はDEAD_LETTER_HATENA.TBLから削除し、再度失敗した記事は失敗回数を加算する。
+
+        :param sqlite3.Connection conn: DBとのコネクション。
+        :param sqlite3.Cursor cursor: カーソルオブジェクト。
+        '''
+
+        urls = self.dead_letter_hatena_dao.select_targets_by_kind(cursor, DeadLetterHatenaDao.KIND_BOOKMARKS, self.DEAD_LETTER_MAX_ATTEMPTS)
+        if not urls:
+            return
+
+        counts = self.get_bookmark_counts(urls)
+
+        # 削除済みの記事は更新されないまま再投入の対象から外れる
+        self.article_info_hatena_dao.update_bookmarks_by_primary_keys(cursor, [(count, url,) for url, count in counts.items()])
+        self.dead_letter_hatena_dao.delete_by_primary_keys(cursor, DeadLetterHatenaDao.KIND_BOOKMARKS, list(counts))
+        conn.commit()
+
+        # 失敗回数が上限に達したリクエストも含めて記録が残っている件数を出力する
+        print(self.message.get_echo('MECH0018', len(counts), len(urls), self.dead_letter_hatena_dao.count_records(cursor)[0]))
+
+    def close_http(self):
+        '''コネクションプールとキャッシュを閉じるメソッド。
+        キャッシュが有効な場合は利用状況を出力する。
+        '''
+
+        self.http.close()
+
+        if self.http_cache:
+            statistics = self.http_cache.statistics()
+            print(self.message.get_echo('MECH0012', statistics['hits'], statistics['revalidated'], statistics['misses']))
+            self.http_cache.close()
+
+    def find_region(self, html: str, start_name: str, end_name: str) -> tuple:
+        '''スクレイピング対象範囲の開始位置と終了位置を取得するメソッド。
+        edit_htmlと同じ範囲を文字列を複製せずにインデックスで返す。
+        終了名が見つからない場合は末尾までを範囲とする。
+
+        :param str html: 対象HTML。
+        :param str start_name: 対象範囲の開始名。
+        :param str end_name: 対象範囲の終了名。
+        :rtype: tuple
+        :return: 開始位置と終了位置のタプル。
+        '''
+
+        start_idx = html.find(start_name)
+        end_idx = html.find(end_name, start_idx)
+
+        return start_idx+1, end_idx if end_idx != -1 else len(html)
 
     def edit_html(self, html: str, start_name: str, end_name: str) -> str:
         '''取得したHTMLをスクレイピング用に加工するメソッド。
@@ -177,7 +410,7 @@ class CommunicateBase:
             start_idx = html.find(start_name)
             end_idx = html.find(end_name, start_idx)
         except Exception as e:
-            self.log.normal(LogLevel.ERROR.value, 'LERR0001', self.BASE_CLASS_NAME, self.log.location())
+            self.log.normal(LogLevel.ERROR.value, 'LERR0001', self.BASE_CLASS_NAME)
             self.log.error(e)
             return ''
 
@@ -190,10 +423,10 @@ class CommunicateBase:
         '''
 
         if hasattr(e, 'reason'):
-            self.log.normal(LogLevel.CRITICAL.value, 'LCRT0001', self.BASE_CLASS_NAME, self.log.location())
+            self.log.normal(LogLevel.CRITICAL.value, 'LCRT0001', self.BASE_CLASS_NAME)
             self.log.error(e.reason)
         elif hasattr(e, 'code'):
-            self.log.normal(LogLevel.CRITICAL.value, 'LCRT0002', self.BASE_CLASS_NAME, self.log.location())
+            self.log.normal(LogLevel.CRITICAL.value, 'LCRT0002', self.BASE_CLASS_NAME)
             self.log.error(e.code)
 
     def __check_internet_connection(self):
@@ -234,11 +467,23 @@ class CommunicateBase:
                 sys.exit()
 
         except sqlite3.Error as e:
-            self.log.normal(LogLevel.ERROR.value, 'LERR0001', self.BASE_CLASS_NAME, self.log.location())
+            self.log.normal(LogLevel.ERROR.value, 'LERR0001', self.BASE_CLASS_NAME)
+            self.log.error(e)
+        finally:
+            conn.close()
+            self.log.normal(LogLevel.INFO.value, 'LINF0005', self.BASE_CLASS_NAME)
+
+    def __migrate_schema(self):
+        '''未適用のスキーママイグレーションを適用するメソッド。'''
+
+        try:
+            conn, cursor = connect_to_database()
+            SchemaMigrator().migrate(conn)
+        except sqlite3.Error as e:
+            self.log.normal(LogLevel.ERROR.value, 'LERR0001', self.BASE_CLASS_NAME)
             self.log.error(e)
         finally:
             conn.close()
-            self.log.normal(LogLevel.INFO.value, 'LINF0005', self.BASE_CLASS_NAME, self.log.location())
 
     def flush_serial_number(self, conn: sqlite3.Connection, cursor: sqlite3.Cursor):
         '''シリアル番号管理テーブルから使用済みシリアル番号を削除するメソッド。
@@ -263,19 +508,46 @@ class CrawlingHatena(CommunicateBase):
         '''
 
         # 基底クラスのコンストラクタを実行
-        super().__init__(args[0])
+        super().__init__(args[0], **kwargs)
 
         # クラス名
         self.CLASS_NAME = 'CrawlingHatena'
 
+        # コマンドライン引数(ワーカプロセスへ引き継ぐ)
+        self.ARGV = list(args[0])
+        # 検索ワードを分担して処理するプロセス数
+        self.PROCESSES = max(1, int(self.config['crawler']['processes']))
+        # ワーカプロセス毎のステージングDBを格納するディレクトリへのパス
+        self.PATH_DIR_STAGING = self.config['path']['dir_staging']
+
+        # データベース保守用のDAOクラス
+        self.database_maintenance_dao = DatabaseMaintenanceDao()
+
+        # スクレイピングした文字列を保存する際の文字コード
+        self.STORAGE_ENCODING = self.config['database']['storage_encoding']
+
+        # 検索ワード毎の取得ページ数を保存するMST_PARAMETER.TBLのパラメータ名
+        self.PAGE_DEPTH_PARAM_NAME = 'PAGE_DEPTH_4_HATENA'
+        # 取得実績のない検索ワードの取得ページ数
+        self.PAGE_DEPTH_INITIAL = int(self.config['crawler']['page_depth_initial'])
+        # 検索ワード毎の取得ページ数の下限
+        self.PAGE_DEPTH_MIN = max(1, int(self.config['crawler']['page_depth_min']))
+        # 検索ワード毎の取得ページ数の上限
+        self.PAGE_DEPTH_MAX = max(self.PAGE_DEPTH_MIN, int(self.config['crawler']['page_depth_max']))
+        # 取得ページ数の算出に用いる直近の実行回数
+        self.PAGE_DEPTH_HISTORY = max(1, int(self.config['crawler']['page_depth_history']))
+
     def execute(self):
         '''クローリング処理を実行するメソッド。'''
 
-        self.log.normal(LogLevel.INFO.value, 'LINF0001', self.CLASS_NAME, self.log.location())
+        self.log.normal(LogLevel.INFO.value, 'LINF0001', self.CLASS_NAME)
 
         try:
             conn, cursor = connect_to_database()
 
+            # 前回処理のステージングDBが残っている場合はワークテーブルへ集約する
+            self.__fold_staging_databases(conn, cursor)
+
             # 処理開始時においてワークテーブルにレコードが残っている場合は、
             # 前回処理が異常終了したとみなしバックアップ情報の移行処理を行う
             count_records = self.work_article_info_hatena_dao.count_records(cursor)[0]
@@ -288,21 +560,28 @@ class CrawlingHatena(CommunicateBase):
 
                 print(self.message.get_echo('MECH0009', count_records, 'records' if count_records else 'record'))
 
+            # 前回までに失敗したリクエストを再投入する
+            self.__redrive_search_pages(conn, cursor)
+            self.redrive_bookmark_counts(conn, cursor)
+
             # hatenaへのクローリング処理を開始
             self.__crawl_hatena(conn, cursor)
+            # 失敗したリクエストを記録
+            self.flush_dead_letters(conn, cursor)
             # 管理テーブルからシリアル番号を消去
             self.flush_serial_number(conn, cursor)
 
         except sqlite3.Error as e:
             conn.rollback()
-            self.log.normal(LogLevel.ERROR.value, 'LERR0001', self.CLASS_NAME, self.log.location())
-            self.log.normal(LogLevel.INFO.value, 'LINF0004', self.CLASS_NAME, self.log.location())
+            self.log.normal(LogLevel.ERROR.value, 'LERR0001', self.CLASS_NAME)
+            self.log.normal(LogLevel.INFO.value, 'LINF0004', self.CLASS_NAME)
             self.log.error(e)
         finally:
             conn.close()
-            self.log.normal(LogLevel.INFO.value, 'LINF0005', self.CLASS_NAME, self.log.location())
-            self.log.normal(LogLevel.INFO.value, 'LINF0008', self.CLASS_NAME, self.log.location())
-            time.sleep(3)
+            self.close_http()
+            self.log.normal(LogLevel.INFO.value, 'LINF0005', self.CLASS_NAME)
+            self.log.normal(LogLevel.INFO.value, 'LINF0008', self.CLASS_NAME)
+            time.sleep(self.EXIT_PAUSE_SEC)
 
     def __crawl_hatena(self, conn: sqlite3.Connection, cursor: sqlite3.Cursor):
         '''Hatenaに対してクローリング処理を行うメソッド。
@@ -311,7 +590,7 @@ class CrawlingHatena(CommunicateBase):
         :param sqlite3.Cursor cursor: カーソル。
         '''
 
-        self.log.normal(LogLevel.INFO.value, 'LINF0002', self.CLASS_NAME, self.log.location())
+        self.log.normal(LogLevel.INFO.value, 'LINF0002', self.CLASS_NAME)
 
         cowsay = Cowsay()
         # 処理開始メッセージ
@@ -319,104 +598,439 @@ class CrawlingHatena(CommunicateBase):
 
         # DBから検索ワードの取得
         search_word = split(''.join(list(self.mst_parameter_dao.select_params_by_primary_key(cursor, 'SEARCH_WORDS_4_HATENA'))), ',')
-        for i, word in enumerate(tqdm(search_word, ncols=60, leave=False, ascii=True, desc='Main process')):
-            count_inserted = 0
-            for page in tqdm(range(1, 6), ncols=60, leave=False, ascii=True, desc='Sub process'):
 
-                # デバッグログ
-                self.log.normal(LogLevel.DEBUG.value, 'LDEB0001', self.CLASS_NAME, self.log.location())
-                self.log.debug('LDEB0002', 'word', word, self.log.get_lineno())
-                self.log.debug('LDEB0002', 'page', page, self.log.get_lineno())
-                self.log.normal(LogLevel.DEBUG.value, 'LDEB0003', self.CLASS_NAME, self.log.location())
-
-                # パラメータ生成用辞書
-                params = {
-                            'page' : page,
-                            'q' : word,
-                            'safe' : 'on',
-                            'sort' : 'recent',
-                            'users' : '1'
-                        }
-
-                # htmlを取得する
-                html = self.get_html(url='http://b.hatena.ne.jp/search/tag', params=params, headers=self.DEF_USER_AGENT)
+        # 検索ワード毎の取得ページ数と取得実績
+        page_depths = self.__load_page_depths(cursor)
+        depths = {word : page_depths.get(word, {}).get('depth', self.PAGE_DEPTH_INITIAL) for word in search_word}
+        # 検索ワード毎の新規の記事を含むページ数
+        pages_new = {}
+
+        if self.PROCESSES > 1 and len(search_word) > 1:
+            # 検索ワードを複数プロセスで分担する
+            pages_new = self.__crawl_hatena_sharded(conn, cursor, search_word, depths)
+        else:
+            # 検索結果ページとブックマーク数の取得は並列に行い、スクレイピングとDBへの登録は本スレッドのみで行う
+            with ThreadPoolExecutor(max_workers=self.CONCURRENCY) as executor, ThreadPoolExecutor(max_workers=self.CONCURRENCY) as count_executor:
+                # 全検索ワードの取得ページ数までの取得処理を予め投入する
+                futures = {(word, page) : executor.submit(self.__fetch_search_page, word, page) for word in search_word for page in range(1, depths[word] + 1)}
+
+                for word in tqdm(search_word, ncols=60, leave=False, ascii=True, desc='Main process'):
+                    # 検索ワードの記事情報をワークテーブルへ登録
+                    with self.telemetry.timer('word', word=word, depth=depths[word]) as fields:
+                        pages_new[word] = self.__crawl_word(conn, cursor, executor, count_executor, futures, word, depths[word])
+                        fields['pages_new'] = pages_new[word]
+                    # ワークテーブルから記事情報を移行させる
+                    with self.telemetry.timer('db.migrate', word=word) as fields:
+                        count_inserted = self.__migrate_article_info_from_work(conn, cursor)
+                        fields['new'] = count_inserted
+
+                    print(cowsay.cowsay(self.message.get_echo('MECH0005', word, count_inserted, 'records' if count_inserted > 1 else 'record')))
+
+        # 取得実績から次回の取得ページ数を算出して保存する
+        # 取得できなかった検索ワードは前回までの取得実績を引き継ぐ
+        self.__save_page_depths(conn, cursor, {word : self.__next_page_depth(page_depths.get(word, {}), pages_new[word]) if word in pages_new else page_depths[word] for word in search_word if word in pages_new or word in page_depths})
+
+        print(cowsay.cowsay(self.message.get_echo('MECH0006')))
+
+        self.log.normal(LogLevel.INFO.value, 'LINF0006', self.CLASS_NAME)
+
+    def __crawl_word(self, conn: sqlite3.Connection, cursor: sqlite3.Cursor, executor: ThreadPoolExecutor, count_executor: ThreadPoolExecutor, futures: dict, word: str, depth: int) -> int:
+        '''1つの検索ワードの検索結果ページをスクレイピングし、ワークテーブルへ登録するメソッド。
+        全記事が登録済みのページに達した時点で以降のページは取得せず、
+        取得ページ数の最終ページまで全記事が未登録の場合は上限まで1ページずつ追加で取得する。
+
+        :param sqlite3.Connection conn: DBとのコネクション。
+        :param sqlite3.Cursor cursor: カーソル。
+        :param concurrent.futures.ThreadPoolExecutor executor: 検索結果ページ取得用のスレッドプール。
+        :param concurrent.futures.ThreadPoolExecutor count_executor: ブックマーク数取得用のスレッドプール。
+        :param dict futures: (検索ワード, ページ番号)をキーとした検索結果ページの取得処理の辞書。
+        :param str word: 検索ワード。
+        :param int depth: 予め取得処理を投入したページ数。
+        :rtype: int
+        :return: 未登録の記事を含んでいたページ数。
+        '''
+
+        # ブックマーク数の取得待ちとなっている記事情報
+        pending_article_infos = []
+        # 未登録の記事を含んでいたページ数
+        pages_new = 0
+        page = 1
+
+        with tqdm(total=depth, ncols=60, leave=False, ascii=True, desc='Sub process') as progress:
+            while (word, page) in futures:
+                # 取得完了を待ちhtmlを受け取る
+                html = futures.pop((word, page)).result()
+                progress.update(1)
+
                 # htmlを取得した場合
                 if html:
-                    # 取得したhtmlをスクレイピング用に加工する
-                    html = self.edit_html(html, 'class="entrysearch-articles"', 'class="centerarticle-pager"')
-
                     # スクレイピング処理
-                    article_infos = self.__scrape_info_of_hatena(html)
-                    # ワークテーブルへ記事情報を登録
-                    count_inserted += self.__insert_article_info_to_work(conn, cursor, article_infos)
+                    with self.telemetry.timer('scrape', word=word, page=page) as fields:
+                        article_infos = self.__scrape_page(html)
+                        fields['articles'] = len(article_infos)
+                    # 記事が存在しない場合は検索結果の末尾に達したとみなす
+                    if not article_infos:
+                        break
 
-            # ワークテーブルから記事情報を移行させる
-            self.__migrate_article_info_from_work(conn, cursor)
+                    urls = [article_info[0] for article_info in article_infos]
+                    # ページ内の全URLのブックマーク数をまとめて取得する
+                    count_future = count_executor.submit(self.get_bookmark_counts, urls)
 
-            print(cowsay.cowsay(self.message.get_echo('MECH0005', word, count_inserted, 'records' if count_inserted > 1 else 'record')))
-        print(cowsay.cowsay(self.message.get_echo('MECH0006')))
+                    registered_urls = {row[0] for row in self.article_info_hatena_dao.select_urls_by_primary_keys(cursor, urls)}
+                    pending_article_infos.append((page, article_infos, registered_urls, count_future))
 
-        self.log.normal(LogLevel.INFO.value, 'LINF0006', self.CLASS_NAME, self.log.location())
+                    # 全記事が登録済みの場合は以降のページも登録済みとみなす
+                    if len(registered_urls) >= len(set(urls)):
+                        break
 
-    def __scrape_info_of_hatena(self, html: str) -> list:
-        '''HTMLソースに対してスクレイピング処理を行うメソッド。
+                    pages_new += 1
 
-        :param str html: スクレイピング対象HTML。
+                    # 全記事が未登録の場合は次ページにも未登録の記事があるとみなす
+                    if not registered_urls and page < self.PAGE_DEPTH_MAX and (word, page + 1) not in futures:
+                        futures[(word, page + 1)] = executor.submit(self.__fetch_search_page, word, page + 1)
+
+                page += 1
+
+        # 不要となった先読みの取得処理を取り消す
+        for key in [key for key in futures if key[0] == word]:
+            futures.pop(key).cancel()
+
+        for page, article_infos, registered_urls, count_future in pending_article_infos:
+            # 取得したブックマーク数を記事情報へ反映し、ワークテーブルへ登録
+            article_infos = self.__apply_bookmark_counts(article_infos, registered_urls, count_future.result())
+            with self.telemetry.timer('db.insert', word=word, page=page, rows=len(article_infos)) as fields:
+                fields['new'] = self.__insert_article_info_to_work(conn, cursor, article_infos)
+
+        return pages_new
+
+    def __apply_bookmark_counts(self, article_infos: list, registered_urls: set, counts: dict) -> list:
+        '''取得したブックマーク数を記事情報へ反映するメソッド。
+        ブックマーク数を取得できなかった登録済みの記事は、登録済みのブックマーク数を上書きしないよう除く。
+        未登録の記事はブックマーク数を0として登録し、再投入時に更新する。
+
+        :param list article_infos: 記事情報が格納されたリスト。
+        :param set registered_urls: 登録済みのURL。
+        :param dict counts: URLをキーとしたブックマーク数の辞書。
         :rtype: list
-        :return: スクレイピングした全記事情報を含むリスト。
+        :return: ワークテーブルへ登録する記事情報のリスト。
+        '''
 
-        >>> scrape_info_of_hatena(html)
-        >>> [[URL, TITLE, PUBILISHED_DATE, BOOKMARKS, TAG], [URL, TITLE, PUBILISHED_DATE, BOOKMARKS, TAG],...]
+        article_infos = [article_info for article_info in article_infos if article_info[0] in counts or article_info[0] not in registered_urls]
+        for article_info in article_infos:
+            article_info[3] = counts.get(article_info[0], 0)
+
+        return article_infos
+
+    def __redrive_search_pages(self, conn: sqlite3.Connection, cursor: sqlite3.Cursor):
+        '''取得に失敗した検索結果ページを再取得し、ワークテーブルを経由してメインテーブルへ登録するメソッド。
+        再取得に成功したページはDEAD_LETTER_HATENA.TBLから削除し、再度失敗したページは失敗回数を加算する。
+
+        :param sqlite3.Connection conn: DBとのコネクション。
+        :param sqlite3.Cursor cursor: カーソル。
         '''
 
-        self.log.normal(LogLevel.INFO.value, 'LINF0003', self.CLASS_NAME, self.log.location())
+        targets = self.dead_letter_hatena_dao.select_targets_by_kind(cursor, DeadLetterHatenaDao.KIND_SEARCH, self.DEAD_LETTER_MAX_ATTEMPTS)
+        if not targets:
+            return
 
-        if not html:
-            return []
+        # 再取得に成功したページ
+        redriven_targets = []
 
-        # 情報格納用リスト
-        list_infos = []
+        with ThreadPoolExecutor(max_workers=self.CONCURRENCY) as executor:
+            htmls = executor.map(lambda target: self.__fetch_search_page(*json.loads(target)), targets)
 
-        while True:
-            # 記事に関する情報を抽出
-            list_new_article_infos = self.__get_infos_of_article(html)
+            for target, html in zip(targets, htmls):
+                if html is None:
+                    continue
 
-            if len(list_new_article_infos) == 1:
-                # リストから探索処理の終了位置を取り出す
-                last_index_of_search = list_new_article_infos[0]
+                article_infos = self.__scrape_page(html)
 
-                if last_index_of_search != -1:
-                    # 記事情報を取得できなかった場合
-                    html = html[last_index_of_search:]
-                else:
-                    # ページ内の全情報を取得し終えた場合
-                    break
-            else:
-                # リストから探索処理の終了位置を取り出す
-                last_index_of_search = list_new_article_infos.pop()
-                list_infos.append(list_new_article_infos)
+                if article_infos:
+                    urls = [article_info[0] for article_info in article_infos]
+                    registered_urls = {row[0] for row in self.article_info_hatena_dao.select_urls_by_primary_keys(cursor, urls)}
+                    self.__insert_article_info_to_work(conn, cursor, self.__apply_bookmark_counts(article_infos, registered_urls, self.get_bookmark_counts(urls)))
 
-                if last_index_of_search != -1:
-                    # 未取得の記事がある場合
-                    html = html[last_index_of_search:]
-                else:
-                    # ページ内の全情報を取得し終えた場合
-                    break
+                redriven_targets.append(target)
 
-        self.log.normal(LogLevel.INFO.value, 'LINF0007', self.CLASS_NAME, self.log.location())
+        self.dead_letter_hatena_dao.delete_by_primary_keys(cursor, DeadLetterHatenaDao.KIND_SEARCH, redriven_targets)
+        # ワークテーブルから記事情報を移行させる
+        self.__migrate_article_info_from_work(conn, cursor)
 
-        return list_infos
+        # 失敗回数が上限に達したリクエストも含めて記録が残っている件数を出力する
+        print(self.message.get_echo('MECH0018', len(redriven_targets), len(targets), self.dead_letter_hatena_dao.count_records(cursor)[0]))
 
-    def __get_infos_of_article(self, html: str) -> list:
-        '''HTMLソースに対してスクレイピング処理を行い記事情報を取得するメソッド。
-        URLを取得できなかった場合は、URL取得以降の処理を行わず空のリストを返す。
+    def __load_page_depths(self, cursor: sqlite3.Cursor) -> dict:
+        '''MST_PARAMETER.TBLから検索ワード毎の取得ページ数と取得実績を取得するメソッド。
 
-        :param str html: スクレイピング対象HTML。
+        :param sqlite3.Cursor cursor: カーソル。
+        :rtype: dict
+        :return: 検索ワードをキーとし、取得ページ数('depth')と未登録の記事を含んでいたページ数の履歴('history')を格納した辞書。
+        '''
+
+        value = self.mst_parameter_dao.select_params_by_primary_key(cursor, self.PAGE_DEPTH_PARAM_NAME)
+        if not value:
+            return {}
+
+        try:
+            return json.loads(value[0])
+        except ValueError:
+            # 破損している場合は初期値から算出し直す
+            return {}
+
+    def __save_page_depths(self, conn: sqlite3.Connection, cursor: sqlite3.Cursor, page_depths: dict):
+        '''検索ワード毎の取得ページ数と取得実績をMST_PARAMETER.TBLへ保存するメソッド。
+        検索ワードから削除された語の取得実績は破棄する。
+
+        :param sqlite3.Connection conn: DBとのコネクション。
+        :param sqlite3.Cursor cursor: カーソル。
+        :param dict page_depths: 検索ワード毎の取得ページ数と取得実績。
+        '''
+
+        self.mst_parameter_dao.upsert_params_by_primary_key(cursor, json.dumps(page_depths, ensure_ascii=False), self.PAGE_DEPTH_PARAM_NAME)
+        conn.commit()
+
+    def __next_page_depth(self, page_depth: dict, pages_new: int) -> dict:
+        '''今回の取得実績から次回の取得ページ数を算出するメソッド。
+        直近の実行で未登録の記事を含んでいたページ数の最大値に、登録済みの境界を確認する1ページを加えた値とする。
+
+        :param dict page_depth: 前回までの取得ページ数と取得実績。
+        :param int pages_new: 今回未登録の記事を含んでいたページ数。
+        :rtype: dict
+        :return: 次回の取得ページ数と取得実績。
+        '''
+
+        history = (page_depth.get('history', []) + [pages_new])[-self.PAGE_DEPTH_HISTORY:]
+        depth = min(self.PAGE_DEPTH_MAX, max(self.PAGE_DEPTH_MIN, max(history) + 1))
+
+        return {'depth' : depth, 'history' : history}
+
+    def __crawl_hatena_sharded(self, conn: sqlite3.Connection, cursor: sqlite3.Cursor, search_word: list, depths: dict) -> dict:
+        '''検索ワードを複数のワーカプロセスで分担してクローリングするメソッド。
+        各ワーカプロセスは専用のステージングDBへ記事情報を登録し、
+        全ワーカプロセスの終了後に本プロセスのみがメインテーブルへ移行させる。
+        シリアル番号は全ワーカプロセスの終了後に本プロセスで消去するため、各ワーカプロセスでの整合性チェックも成功する。
+
+        :param sqlite3.Connection conn: DBとのコネクション。
+        :param sqlite3.Cursor cursor: カーソル。
+        :param list search_word: 検索ワードのリスト。
+        :param dict depths: 検索ワード毎の取得ページ数。
+        :rtype: dict
+        :return: 検索ワード毎の未登録の記事を含んでいたページ数。
+        '''
+
+        # 検索ワード毎の未登録の記事を含んでいたページ数
+        pages_new = {}
+
+        if not os.path.exists(self.PATH_DIR_STAGING):
+            os.makedirs(self.PATH_DIR_STAGING)
+
+        cowsay = Cowsay()
+        processes = min(self.PROCESSES, len(search_word))
+        # 検索ワードをプロセス数で分割する
+        shards = [search_word[i::processes] for i in range(processes)]
+
+        # ワーカプロセスはDBコネクションを引き継がないようspawnで起動する
+        with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn')) as executor:
+            futures = []
+            for i, shard in enumerate(shards):
+                path_staging = os.path.join(self.PATH_DIR_STAGING, 'STAGING_{}_{}.db'.format(os.getpid(), i))
+                futures.append(executor.submit(crawl_shard, self.ARGV, {word : depths[word] for word in shard}, path_staging, processes))
+
+            for future in tqdm(as_completed(futures), total=len(futures), ncols=60, leave=False, ascii=True, desc='Main process'):
+                try:
+                    counts_inserted, dead_letters = future.result()
+                    # ワーカプロセスで失敗したリクエストは本プロセスで記録する
+                    with self.dead_letters_lock:
+                        self.dead_letters.extend(dead_letters)
+
+                    for word, count_inserted, pages in counts_inserted:
+                        pages_new[word] = pages
+                        print(cowsay.cowsay(self.message.get_echo('MECH0005', word, count_inserted, 'records' if count_inserted > 1 else 'record')))
+                except Exception as e:
+                    # 異常終了したワーカプロセスのコミット済みの記事情報は集約対象とする
+                    self.log.normal(LogLevel.ERROR.value, 'LERR0001', self.CLASS_NAME)
+                    self.log.error(e)
+
+        # 全ステージングDBをワークテーブルへ集約し、1度でメインテーブルへ移行させる
+        self.__fold_staging_databases(conn, cursor)
+        with self.telemetry.timer('db.migrate', words=len(search_word)) as fields:
+            fields['new'] = self.__migrate_article_info_from_work(conn, cursor)
+
+        return pages_new
+
+    def crawl_to_staging(self, depths: dict, path_staging: str) -> list:
+        '''ワーカプロセスとして検索ワードをクローリングし、ステージングDBへ登録するメソッド。
+        ステージングDBのワークテーブルにページ単位でコミットするため、異常終了時もコミット済みの記事情報は集約できる。
+        新規の記事数と登録済みの記事を判定するためメインDBを読み取り用にアタッチする。
+
+        :param dict depths: 担当する検索ワードをキーとした取得ページ数の辞書。
+        :param str path_staging: ステージングDBへのパス。
+        :rtype: tuple
+        :return: (検索ワード, 新規の記事数, 未登録の記事を含んでいたページ数)のリストと、失敗したリクエストのリストのタプル。
+        '''
+
+        counts_inserted = []
+
+        conn, cursor = connect_to_database(path=path_staging, shared=False)
+
+        try:
+            self.work_article_info_hatena_dao.create_table(cursor)
+            conn.commit()
+            self.database_maintenance_dao.attach_database(cursor, self.config['path']['database'], 'METIS')
+
+            with ThreadPoolExecutor(max_workers=self.CONCURRENCY) as executor, ThreadPoolExecutor(max_workers=self.CONCURRENCY) as count_executor:
+                futures = {(word, page) : executor.submit(self.__fetch_search_page, word, page) for word, depth in depths.items() for page in range(1, depth + 1)}
+                # ステージングDBのメインテーブルに未登録の記事数
+                count_unregistered = 0
+
+                for word, depth in depths.items():
+                    with self.telemetry.timer('word', word=word, depth=depth) as fields:
+                        pages_new = self.__crawl_word(conn, cursor, executor, count_executor, futures, word, depth)
+                        fields['pages_new'] = pages_new
+
+                    # 検索ワード毎の新規の記事数は未登録の記事数の増分とする
+                    count_total = self.work_article_info_hatena_dao.count_unregistered_records(cursor)[0]
+                    counts_inserted.append((word, count_total - count_unregistered, pages_new))
+                    count_unregistered = count_total
+
+        except sqlite3.Error as e:
+            self.log.normal(LogLevel.ERROR.value, 'LERR0001', self.CLASS_NAME)
+            self.log.error(e)
+        finally:
+            conn.close()
+            self.close_http()
+
+        return counts_inserted, self.take_dead_letters()
+
+    def __fold_staging_databases(self, conn: sqlite3.Connection, cursor: sqlite3.Cursor) -> int:
+        '''ステージングDBの記事情報をワークテーブルへ集約し、集約済みのステージングDBを削除するメソッド。
+        ステージングDB毎にコミットするため、異常終了時も未集約のステージングDBは次回処理で集約される。
+
+        :param sqlite3.Connection conn: DBとのコネクション。
+        :param sqlite3.Cursor cursor: カーソル。
+        :rtype: int
+        :return: 集約したステージングDBの数。
+        '''
+
+        paths_staging = sorted(glob.glob(os.path.join(self.PATH_DIR_STAGING, 'STAGING_*.db')))
+
+        for path_staging in paths_staging:
+            # アタッチはトランザクション外で行う
+            if conn.in_transaction:
+                conn.commit()
+
+            self.database_maintenance_dao.attach_database(cursor, path_staging, 'STAGING')
+            try:
+                self.work_article_info_hatena_dao.transfer_from_attached(cursor, 'STAGING')
+                conn.commit()
+            finally:
+                self.database_maintenance_dao.detach_database(cursor, 'STAGING')
+
+            for path in [path_staging, path_staging + '-wal', path_staging + '-shm']:
+                if os.path.exists(path):
+                    os.remove(path)
+
+        return len(paths_staging)
+
+    def __fetch_search_page(self, word: str, page: int) -> str:
+        '''Hatenaの検索結果ページを取得するメソッド。
+        ワーカースレッドから呼び出されるため、DBへのアクセスは行わない。
+
+        :param str word: 検索ワード。
+        :param int page: 取得対象ページ番号。
+        :rtype: str
+        :return: 取得したHTMLソース。接続エラー時はNone。
+        '''
+
+        # デバッグログ
+        self.log.normal(LogLevel.DEBUG.value, 'LDEB0001', self.CLASS_NAME)
+        self.log.debug('LDEB0002', 'word', word)
+        self.log.debug('LDEB0002', 'page', page)
+        self.log.normal(LogLevel.DEBUG.value, 'LDEB0003', self.CLASS_NAME)
+
+        # パラメータ生成用辞書
+        params = {
+                    'page' : page,
+                    'q' : word,
+                    'safe' : 'on',
+                    'sort' : 'recent',
+                    'users' : '1'
+                }
+
+        # htmlを取得する
+        # 失敗した場合は検索ワードとページ番号で再投入する
+        dead_letter = (DeadLetterHatenaDao.KIND_SEARCH, [json.dumps([word, page], ensure_ascii=False)])
+
+        with self.telemetry.timer('search_page', word=word, page=page) as fields:
+            html = self.get_html(url=self.HATENA_SEARCH_URL, params=params, headers=self.DEF_USER_AGENT, dead_letter=dead_letter)
+            fields['chars'] = len(html) if html else 0
+
+        return html
+
+    def __scrape_page(self, html: str) -> list:
+        '''検索結果ページから記事情報を取得し、タイトルとタグをページ単位でまとめて正規化するメソッド。
+
+        :param str html: 検索結果ページのHTMLソース。
         :rtype: list
-        :return: スクレイピングした記事情報を含むリスト。
+        :return: 記事情報を格納したリストのリスト。
+        '''
+
+        # スクレイピング対象範囲を取得する
+        start, end = self.find_region(html, 'class="entrysearch-articles"', 'class="centerarticle-pager"')
+        article_infos = list(self.__scrape_info_of_hatena(html, start, end))
 
-        >>> get_infos_of_article(html)
-        >>> [URL, TITLE, PUBILISHED_DATE, BOOKMARKS, TAG, LAST_INDEX]
+        # タイトルとタグの文字参照の復元と文字コードの変換はページ内の全記事で1度だけ行う
+        fields = normalize_fields([field for article_info in article_infos for field in (article_info[1], article_info[4])], self.STORAGE_ENCODING)
+        for article_info, title, tags in zip(article_infos, fields[0::2], fields[1::2]):
+            article_info[1] = title
+            article_info[4] = tags
+
+        return article_infos
+
+    def __scrape_info_of_hatena(self, html: str, start=0, end=None):
+        '''HTMLソースに対してスクレイピング処理を行うジェネレータメソッド。
+        HTMLソースを複製せずに、探索位置を進めながら1度の走査で記事情報を順に返す。
+        タイトルとタグは正規化せずに返すため、__scrape_pageでまとめて正規化すること。
+
+        :param str html: スクレイピング対象HTML。
+        :param int start: 探索開始位置。初期値は0。
+        :param int end: 探索終了位置。初期値はNone(末尾まで)。
+        :rtype: generator
+        :return: 記事情報を格納したリストを順に返すジェネレータ。
+
+        >>> list(scrape_info_of_hatena(html))
+        >>> [[URL, TITLE, PUBILISHED_DATE, BOOKMARKS, TAG], [URL, TITLE, PUBILISHED_DATE, BOOKMARKS, TAG],...]
+        '''
+
+        self.log.normal(LogLevel.INFO.value, 'LINF0003', self.CLASS_NAME)
+
+        if end is None:
+            end = len(html)
+
+        # 探索位置
+        position = start
+
+        while 0 <= position < end:
+            # 記事に関する情報を抽出し、探索位置を次の記事へ進める
+            article_info, position = self.__get_infos_of_article(html, position, end)
+
+            if article_info:
+                yield article_info
+
+        self.log.normal(LogLevel.INFO.value, 'LINF0007', self.CLASS_NAME)
+
+    def __get_infos_of_article(self, html: str, start: int, end: int) -> tuple:
+        '''HTMLソースの指定範囲に対してスクレイピング処理を行い記事情報を1件取得するメソッド。
+        URLを取得できなかった場合は、URL取得以降の処理を行わず記事情報をNoneとして返す。
+
+        :param str html: スクレイピング対象HTML。
+        :param int start: 探索開始位置。
+        :param int end: 探索終了位置。
+        :rtype: tuple
+        :return: 記事情報を含むリストと次の記事の探索開始位置のタプル。次の記事がない場合は-1。
+
+        >>> get_infos_of_article(html, start, end)
+        >>> ([URL, TITLE, PUBILISHED_DATE, BOOKMARKS, TAG], NEXT_INDEX)
         '''
 
         # 記事情報格納用リスト
@@ -424,11 +1038,14 @@ class CrawlingHatena(CommunicateBase):
 
         try:
             # 探索開始インデックス
-            start_search_index = html.find('centerarticle-entry-title')
+            start_search_index = html.find('centerarticle-entry-title', start, end)
+            if start_search_index == -1:
+                # ページ内の全情報を取得し終えた場合
+                return None, -1
 
             # URL部の取得
-            start_index_of_url = html.find('"', html.find('<a', start_search_index))
-            end_index_of_url = html.find('"', start_index_of_url+1)
+            start_index_of_url = html.find('"', html.find('<a', start_search_index, end), end)
+            end_index_of_url = html.find('"', start_index_of_url+1, end)
             url = html[start_index_of_url+1:end_index_of_url]
 
             # 取得したURLが短縮化されていない場合
@@ -436,138 +1053,128 @@ class CrawlingHatena(CommunicateBase):
                 list_article_infos.append(url)
 
                 # タイトル部の取得
-                start_index_of_title = html.find('">', html.find('img', end_index_of_url+1))
-                end_index_of_title = html.find('</a', start_index_of_title+1)
+                start_index_of_title = html.find('">', html.find('img', end_index_of_url+1, end), end)
+                end_index_of_title = html.find('</a', start_index_of_title+1, end)
                 title = html[start_index_of_title+2:end_index_of_title].strip()
-
-                # 取得したタイトルをパースしてリストに格納
-                parser = htmlparser.HTMLParser()
-                # UnicodeDecodeError回避のために変換処理を行う
-                title = parser.unescape(title).encode('cp932', 'ignore').decode('cp932')
                 list_article_infos.append(title)
 
                 # 日付部の取得
-                start_index_of_date = html.find('>', html.find('class="entry-contents-date"', end_index_of_title+1))
-                end_index_of_date = html.find('</', start_index_of_date+1)
-                date = html[start_index_of_date+1:end_index_of_date]
+                start_index_of_date = html.find('>', html.find('class="entry-contents-date"', end_index_of_title+1, end), end)
+                end_index_of_date = html.find('</', start_index_of_date+1, end)
+                # 日付はISO 8601形式(YYYY-MM-DD)で保持する
+                date = html[start_index_of_date+1:end_index_of_date].strip().replace('/', '-')
                 list_article_infos.append(date)
 
-                # APIからブックマーク数の取得
-                params = {'url' : url}
-                count_bookmark = self.get_html(url=self.HATENA_BOOKMARK_API, params=params, headers=self.DEF_USER_AGENT)
-                # ブックマーク数が0の場合はAPIが空を返すため値の変換処理を行う
-                count_bookmark = count_bookmark if count_bookmark else '0'
-                list_article_infos.append(count_bookmark)
+                # ブックマーク数はページ単位で一括取得するため初期値を設定しておく
+                list_article_infos.append(0)
 
-                # 後続ループ処理のためタグ部分のみを抽出
-                start_index_of_tag_element = html.find('<ul class="entrysearch-entry-tags">', end_index_of_date)
-                html_of_tags = html[start_index_of_tag_element:html.find('</div>', start_index_of_tag_element)]
+                # 当該処理終了位置の取得
+                last_index = html.find('class="bookmark-item', end_index_of_title, end)
+                # タグのない記事で次の記事のタグを取得しないよう、タグ部分は当該記事の範囲内で探索する
+                end_index_of_article = last_index if last_index != -1 else end
+
+                # タグ部分の範囲を取得
+                start_index_of_tag_element = html.find('<ul class="entrysearch-entry-tags">', end_index_of_date, end_index_of_article)
+                end_index_of_tag_element = html.find('</div>', start_index_of_tag_element, end_index_of_article)
+                if end_index_of_tag_element == -1:
+                    end_index_of_tag_element = end_index_of_article
 
                 # タグ格納用リスト
                 list_of_tags = []
-                # タグ部終了位置
-                end_index_of_tag = ''
                 # 最初のアンカータグ開始インデックス
-                start_index_of_anchor = html_of_tags.find('<a')
+                start_index_of_anchor = html.find('<a', start_index_of_tag_element, end_index_of_tag_element) if start_index_of_tag_element != -1 else -1
 
                 while start_index_of_anchor != -1:
                     # タグの取得
-                    start_index_of_tag = html_of_tags.find('>', start_index_of_anchor+1)
-                    end_index_of_tag = html_of_tags.find('</a', start_index_of_tag+1)
-                    list_of_tags.append(html_of_tags[start_index_of_tag+1:end_index_of_tag])
+                    start_index_of_tag = html.find('>', start_index_of_anchor+1, end_index_of_tag_element)
+                    end_index_of_tag = html.find('</a', start_index_of_tag+1, end_index_of_tag_element)
+                    list_of_tags.append(html[start_index_of_tag+1:end_index_of_tag])
 
                     # アンカータグの開始インデックスを更新
-                    start_index_of_anchor = html_of_tags.find('<a', end_index_of_tag)
+                    start_index_of_anchor = html.find('<a', end_index_of_tag, end_index_of_tag_element) if end_index_of_tag != -1 else -1
                 else:
                     # タグの取得処理完了後処理
-                    tags = ','.join(list_of_tags).encode('cp932', 'ignore').decode('cp932')
-                    # UnicodeDecodeError回避のために変換処理を行う
-                    tags = tags.encode('cp932', 'ignore').decode('cp932')
+                    tags = ','.join(list_of_tags)
                     list_article_infos.append(tags)
 
-                # 当該処理終了位置の取得と保存
-                last_index = html.find('class="bookmark-item', end_index_of_title)
-                list_article_infos.append(last_index)
-
-                # デバッグログ
-                self.log.normal(LogLevel.DEBUG.value, 'LDEB0001', self.CLASS_NAME, self.log.location())
-                self.log.debug('LDEB0002', 'url', url, self.log.get_lineno())
-                self.log.debug('LDEB0002', 'title', title, self.log.get_lineno())
-                self.log.debug('LDEB0002', 'date', date, self.log.get_lineno())
-                self.log.debug('LDEB0002', 'tags', tags, self.log.get_lineno())
-                self.log.debug('LDEB0002', 'count_bookmark', count_bookmark, self.log.get_lineno())
-                self.log.debug('LDEB0002', 'last_index', last_index, self.log.get_lineno())
-                self.log.normal(LogLevel.DEBUG.value, 'LDEB0003', self.CLASS_NAME, self.log.location())
+                # デバッグログ(記事毎に呼び出されるためレベルを1度だけ判定する)
+                if self.log.is_debug_enabled():
+                    self.log.normal(LogLevel.DEBUG.value, 'LDEB0001', self.CLASS_NAME)
+                    self.log.debug('LDEB0002', 'url', url)
+                    self.log.debug('LDEB0002', 'title', title)
+                    self.log.debug('LDEB0002', 'date', date)
+                    self.log.debug('LDEB0002', 'tags', tags)
+                    self.log.debug('LDEB0002', 'last_index', last_index)
+                    self.log.normal(LogLevel.DEBUG.value, 'LDEB0003', self.CLASS_NAME)
 
             else:
                 # デバッグログ
-                self.log.normal(LogLevel.DEBUG.value, 'LDEB0001', self.CLASS_NAME, self.log.location())
-                self.log.debug('LDEB0002', 'url', url, self.log.get_lineno())
-                self.log.normal(LogLevel.DEBUG.value, 'LDEB0003', self.CLASS_NAME, self.log.location())
+                self.log.normal(LogLevel.DEBUG.value, 'LDEB0001', self.CLASS_NAME)
+                self.log.debug('LDEB0002', 'url', url)
+                self.log.normal(LogLevel.DEBUG.value, 'LDEB0003', self.CLASS_NAME)
 
-                # 次処理の探索開始位置をリストで返す
-                return [html.find('class="bookmark-item', start_search_index)]
+                # 次処理の探索開始位置を返す
+                return None, html.find('class="bookmark-item', start_search_index, end)
 
         except Exception as e:
-            self.log.normal(LogLevel.ERROR.value, 'LERR0001', self.CLASS_NAME, self.log.location())
+            self.log.normal(LogLevel.ERROR.value, 'LERR0001', self.CLASS_NAME)
             self.log.error(e)
-            return []
+            return None, -1
 
-        return list_article_infos
+        return list_article_infos, last_index
 
     def __insert_article_info_to_work(self, conn: sqlite3.Connection, cursor: sqlite3.Cursor, article_infos: list) -> int:
         '''ワークテーブルへ記事情報を登録するメソッド。
+        登録済みの記事情報もメインテーブルへの移行時にブックマーク数とタグを更新するため、全ての記事情報を一括で登録する。
+        ページ単位でコミットするため、異常終了時もコミット済みの記事情報はワークテーブルから復旧できる。
 
         :param sqlite3.Connection conn: DBとのコネクション。
         :param sqlite3.Cursor cursor: カーソルオブジェクト。
         :param list article_infos: 記事情報が格納されたリスト。
         :rtype: int
-        :return: ワークテーブルへの登録数。
+        :return: ワークテーブルへ登録した記事情報のうち、メインテーブルに未登録の記事情報の数。
         '''
 
         if not article_infos:
             return 0
 
-        # 登録数
-        count_inserted = 0
-        # 重複数
-        count_duplication = 0
+        # 登録済みの記事情報を除いた新規の記事数は、未登録のレコード数の増分とする
+        count_unregistered = self.work_article_info_hatena_dao.count_unregistered_records(cursor)[0]
 
         # ARTICLE_INFO_TBLの挿入用対応データ
         INSERT_COLUMNS_INFO_TECH_TBL = ['URL', 'TITLE', 'PUBLISHED_DATE', 'BOOKMARKS', 'TAG', 'RESERVED_DEL_DATE']
         # 削除予定日
         RESERVED_DEL_DATE = (date.today() + timedelta(21)).strftime('%Y%m%d')
 
-        for article_info in article_infos:
-            if count_duplication >= 10:
-                # 10回以上重複した場合は処理終了
-                break
-            else:
-                if not self.article_info_hatena_dao.select_by_primary_key(cursor, article_info[0]):
-                    article_info.append(RESERVED_DEL_DATE)
-                    # リストを結合し辞書を生成
-                    article_info = dict(zip(INSERT_COLUMNS_INFO_TECH_TBL, article_info))
-                    # ワークテーブルへ移行対象データを登録
-                    self.work_article_info_hatena_dao.insert_article_infos(cursor, article_info)
-
-                    # 移行用データ作成のため登録毎にコミット
-                    conn.commit()
+        # ワークテーブルへ移行対象データを一括で登録
+        self.work_article_info_hatena_dao.insert_article_infos_bulk(cursor, [dict(zip(INSERT_COLUMNS_INFO_TECH_TBL, article_info + [RESERVED_DEL_DATE])) for article_info in article_infos])
+        # ワークテーブルに登録済みのURLは無視されるため実際の登録数を取得する
+        count_inserted = cursor.rowcount
+        count_new = self.work_article_info_hatena_dao.count_unregistered_records(cursor)[0] - count_unregistered
+        self.telemetry.count('rows.inserted', count_inserted)
+        self.telemetry.count('rows.new', count_new)
+        self.telemetry.count('rows.duplicates', len(article_infos) - count_inserted)
 
-                    count_inserted += 1
-                    count_duplication = 0
-                else:
-                    # 重複している場合
-                    count_duplication += 1
+        # 移行用データ作成のためページ単位でコミット
+        conn.commit()
 
-        return count_inserted
+        return count_new
 
-    def __migrate_article_info_from_work(self, conn: sqlite3.Connection, cursor: sqlite3.Cursor):
+    def __migrate_article_info_from_work(self, conn: sqlite3.Connection, cursor: sqlite3.Cursor) -> int:
         '''ワークテーブルからメインテーブルへ記事情報を移行させるメソッド。
+        登録済みの記事情報は更新し、移行とワークテーブルの削除は1トランザクションで行う。
 
         :param sqlite3.Connection conn: DBとのコネクション。
         :param sqlite3.Cursor cursor: カーソルオブジェクト。
+        :rtype: int
+        :return: メインテーブルへ新規に登録した記事情報の数。
         '''
 
+        # 新規に登録される記事情報の数
+        count_new = self.work_article_info_hatena_dao.count_unregistered_records(cursor)[0]
+
+        # ワークテーブルの記事情報のタグをタグテーブルへ反映する
+        self.article_tag_dao.replace_tags_from_work(cursor)
         # ワークテーブルから記事情報を移行させる
         self.article_info_hatena_dao.transfer_article_info_from_work(cursor)
         # ワークテーブル内の情報を削除する
@@ -575,6 +1182,10 @@ class CrawlingHatena(CommunicateBase):
         # 移行処理終了
         conn.commit()
 
+        self.telemetry.count('articles.new', count_new)
+
+        return count_new
+
 class UpdateBookmarksHatena(CommunicateBase):
     '''Hatenaのクローリング済みブックマーク数を更新するクラス。'''
 
@@ -587,73 +1198,323 @@ class UpdateBookmarksHatena(CommunicateBase):
         '''
 
         # 基底クラスのコンストラクタを実行
-        super().__init__(args[0])
+        super().__init__(args[0], **kwargs)
 
         # クラス名
         self.CLASS_NAME = 'UpdateBookmarksHatena'
+        # チェックポイントを保存するMST_PARAMETER.TBLのパラメータ名
+        self.CHECKPOINT_PARAM_NAME = 'CHECKPOINT_UPDATE_BOOKMARKS_HATENA'
 
     def execute(self):
         '''ブックマーク数の更新処理を実行するメソッド。'''
 
-        self.log.normal(LogLevel.INFO.value, 'LINF0001', self.CLASS_NAME, self.log.location())
+        self.log.normal(LogLevel.INFO.value, 'LINF0001', self.CLASS_NAME)
 
         try:
             conn, cursor = connect_to_database()
 
+            # 前回までに取得に失敗したブックマーク数を再取得する
+            self.redrive_bookmark_counts(conn, cursor)
             # ブックマーク数の更新処理を開始
             self.__update_bookmarks(conn, cursor)
+            # 失敗したリクエストを記録
+            self.flush_dead_letters(conn, cursor)
             # 管理テーブルからシリアル番号を消去
             self.flush_serial_number(conn, cursor)
         except sqlite3.Error as e:
             conn.rollback()
-            self.log.normal(LogLevel.ERROR.value, 'LERR0001', self.CLASS_NAME, self.log.location())
-            self.log.normal(LogLevel.INFO.value, 'LINF0004', self.CLASS_NAME, self.log.location())
+            self.log.normal(LogLevel.ERROR.value, 'LERR0001', self.CLASS_NAME)
+            self.log.normal(LogLevel.INFO.value, 'LINF0004', self.CLASS_NAME)
             self.log.error(e)
         finally:
             conn.close()
-            self.log.normal(LogLevel.INFO.value, 'LINF0005', self.CLASS_NAME, self.log.location())
-            self.log.normal(LogLevel.INFO.value, 'LINF0008', self.CLASS_NAME, self.log.location())
-            time.sleep(3)
+            self.close_http()
+            self.log.normal(LogLevel.INFO.value, 'LINF0005', self.CLASS_NAME)
+            self.log.normal(LogLevel.INFO.value, 'LINF0008', self.CLASS_NAME)
+            time.sleep(self.EXIT_PAUSE_SEC)
 
     def __update_bookmarks(self, conn: sqlite3.Connection, cursor: sqlite3.Cursor):
         '''ブックマーク数の更新処理を行うメソッド。
+        設定ファイルの更新方針が'incremental'の場合は差分更新を行い、それ以外の場合は全件更新を行う。
 
         :param sqlite3.Connection conn: DBとのコネクション。
         :param sqlite3.Cursor cursor: カーソル。
         '''
 
-        # テーブルからURLの取得
-        urls = self.article_info_hatena_dao.select_all_url(cursor)
-        # tuple構造からリスト構造へと変換する
-        urls = [url for tuple_url in urls for url in tuple_url]
+        if not self.article_info_hatena_dao.count_records_after_url(cursor, '')[0]:
+            self.message.showerror('MERR0004')
+            return
 
-        if urls:
-            # デバッグ開始
-            self.log.normal(LogLevel.DEBUG.value, 'LDEB0001', self.CLASS_NAME, self.log.location())
+        # デバッグ開始
+        self.log.normal(LogLevel.DEBUG.value, 'LDEB0001', self.CLASS_NAME)
 
-            cowsay = Cowsay()
-            print(cowsay.cowsay(self.message.get_echo('MECH0007', len(urls), 'records' if len(urls) > 1 else 'record')))
+        with ThreadPoolExecutor(max_workers=self.REFRESH_CONCURRENCY) as executor:
+            if self.REFRESH_POLICY == 'incremental':
+                self.__update_bookmarks_incrementally(conn, cursor, executor)
+            else:
+                self.__update_all_bookmarks(conn, cursor, executor)
 
-            for url in tqdm(urls, ncols=60, leave=False, ascii=True, desc='Updating...'):
-                # APIからブックマーク数の取得
-                params = {'url' : url}
-                count_bookmark = self.get_html(url=self.HATENA_BOOKMARK_API, params=params, headers=self.DEF_USER_AGENT)
-                # ブックマーク数が0の場合はAPIが空を返すため値の変換処理を行う
-                count_bookmark = count_bookmark if count_bookmark else '0'
+        # デバッグ終了
+        self.log.normal(LogLevel.DEBUG.value, 'LDEB0003', self.CLASS_NAME)
+
+    def __update_all_bookmarks(self, conn: sqlite3.Connection, cursor: sqlite3.Cursor, executor: ThreadPoolExecutor):
+        '''全レコードのブックマーク数の更新処理を行うメソッド。
+        URL順に設定ファイルで指定された件数毎に更新し、その都度コミットする。
+        コミット毎に処理済みの最後のURLをチェックポイントとしてMST_PARAMETER.TBLへ保存し、
+        前回処理が異常終了していた場合はチェックポイントから処理を再開する。
+
+        :param sqlite3.Connection conn: DBとのコネクション。
+        :param sqlite3.Cursor cursor: カーソル。
+        :param concurrent.futures.ThreadPoolExecutor executor: ブックマーク数取得用のスレッドプール。
+        '''
+
+        # 前回処理のチェックポイントを取得
+        checkpoint = self.mst_parameter_dao.select_params_by_primary_key(cursor, self.CHECKPOINT_PARAM_NAME)
+        last_url = checkpoint[0] if checkpoint else ''
+        # 更新対象のレコード数
+        count_records = self.article_info_hatena_dao.count_records_after_url(cursor, last_url)[0]
+
+        cowsay = Cowsay()
+        if checkpoint:
+            print(cowsay.cowsay(self.message.get_echo('MECH0010')))
+        print(cowsay.cowsay(self.message.get_echo('MECH0007', count_records, 'records' if count_records > 1 else 'record')))
+
+        with tqdm(total=count_records, ncols=60, leave=False, ascii=True, desc='Updating...') as progress:
+            while True:
+                # チェックポイント以降のURLを取得
+                urls = [url for tuple_url in self.article_info_hatena_dao.select_url_after(cursor, last_url, self.REFRESH_CHUNK_SIZE) for url in tuple_url]
+
+                if not urls:
+                    break
 
                 # 更新処理
-                self.article_info_hatena_dao.update_bookmarks_by_primary_key(cursor, count_bookmark, url)
+                self.__update_bookmarks_of_chunk(cursor, executor, urls)
 
-                self.log.debug('LDEB0002', 'url', url, self.log.get_lineno())
-                self.log.debug('LDEB0002', 'count_bookmark', count_bookmark, self.log.get_lineno())
+                # チェックポイントを更新し、チャンク単位でコミットする
+                last_url = urls[-1]
+                self.mst_parameter_dao.upsert_params_by_primary_key(cursor, last_url, self.CHECKPOINT_PARAM_NAME)
+                conn.commit()
 
+                self.log.debug('LDEB0002', 'last_url', last_url)
+                progress.update(len(urls))
+
+        # 全件の更新が完了したためチェックポイントを削除する
+        self.mst_parameter_dao.delete_params_by_primary_key(cursor, self.CHECKPOINT_PARAM_NAME)
+        conn.commit()
+        print(cowsay.cowsay(self.message.get_echo('MECH0008')))
+
+    def __update_bookmarks_incrementally(self, conn: sqlite3.Connection, cursor: sqlite3.Cursor, executor: ThreadPoolExecutor):
+        '''更新優先度の高いレコードのみブックマーク数の更新処理を行うメソッド。
+        最終更新日時が新しいレコードは更新対象外とし、更新優先度の上位から設定ファイルで指定された件数のみを更新する。
+        処理時間が設定ファイルで指定された上限を超えた場合は、その時点のチャンクで処理を終了する。
+        更新したレコードは最終更新日時が更新されるため、処理が中断された場合も次回処理で重複して更新されない。
+
+        :param sqlite3.Connection conn: DBとのコネクション。
+        :param sqlite3.Cursor cursor: カーソル。
+        :param concurrent.futures.ThreadPoolExecutor executor: ブックマーク数取得用のスレッドプール。
+        '''
+
+        # 更新対象件数を取得
+        count_records = min(self.REFRESH_TOP_K, self.article_info_hatena_dao.count_records_by_refresh_priority(cursor, self.REFRESH_MIN_AGE_HOURS)[0])
+
+        cowsay = Cowsay()
+        if not count_records:
+            print(cowsay.cowsay(self.message.get_echo('MECH0011')))
+            return
+
+        print(cowsay.cowsay(self.message.get_echo('MECH0007', count_records, 'records' if count_records > 1 else 'record')))
+
+        # 更新すると最終更新日時が変わり優先度順が入れ替わるため、対象URLは更新前にまとめて取得する
+        urls = [url for url, in self.article_info_hatena_dao.select_url_by_refresh_priority(cursor, self.REFRESH_MIN_AGE_HOURS, self.REFRESH_TOP_K)]
+
+        # 処理開始時刻
+        started = time.monotonic()
+        with tqdm(total=count_records, ncols=60, leave=False, ascii=True, desc='Updating...') as progress:
+            for chunk in (urls[i:i+self.REFRESH_CHUNK_SIZE] for i in range(0, len(urls), self.REFRESH_CHUNK_SIZE)):
+                # 更新処理とチャンク単位でのコミット
+                self.__update_bookmarks_of_chunk(cursor, executor, chunk)
+                conn.commit()
+                progress.update(len(chunk))
+
+                if time.monotonic() - started > self.REFRESH_TIME_BUDGET_SEC:
+                    # 処理時間の上限を超えた場合
+                    self.log.debug('LDEB0002', 'count_updated', progress.n)
+                    break
+
+        print(cowsay.cowsay(self.message.get_echo('MECH0008')))
+
+    def __update_bookmarks_of_chunk(self, cursor: sqlite3.Cursor, executor: ThreadPoolExecutor, urls: list):
+        '''指定されたURLのブックマーク数をAPIから並列に取得し一括で更新するメソッド。
+        コミットは呼び出し元で行う。
+
+        :param sqlite3.Cursor cursor: カーソル。
+        :param concurrent.futures.ThreadPoolExecutor executor: ブックマーク数取得用のスレッドプール。
+        :param list urls: 更新対象URLのリスト。
+        '''
+
+        # APIからブックマーク数を並列に取得する
+        counts = {}
+        batches = [urls[i:i+self.BOOKMARK_BATCH_SIZE] for i in range(0, len(urls), self.BOOKMARK_BATCH_SIZE)]
+        for batch_counts in executor.map(self.get_bookmark_counts, batches):
+            counts.update(batch_counts)
+
+        # 更新処理(取得できなかったURLは登録済みのブックマーク数を維持する)
+        self.article_info_hatena_dao.update_bookmarks_by_primary_keys(cursor, [(counts[url], url) for url in urls if url in counts])
+
+class PurgeExpiredArticlesHatena(CommunicateBase):
+    '''削除予定日を過ぎたHatenaの記事情報を削除する処理を定義するクラス。'''
+
+    def __init__(self, *args, **kwargs):
+        '''コンストラクタ。
+        通信を行わないためインターネットとの疎通確認は行わない。
+
+        :param tuple args: タプルの可変長引数。
+        :param dict kwargs: 辞書の可変長引数。
+        '''
+
+        # 基底クラスのコンストラクタを実行
+        super().__init__(args[0], check_internet=False)
+
+        # クラス名
+        self.CLASS_NAME = 'PurgeExpiredArticlesHatena'
+
+        # 1トランザクションあたりの削除件数
+        self.PURGE_BATCH_SIZE = max(1, int(self.config['purge']['batch_size']))
+        # 削除した記事情報を保存するか否か
+        self.PURGE_ARCHIVE = bool(self.config['purge']['archive'])
+        # 削除後に解放する未使用ページ数(0の場合は全て)
+        self.PURGE_VACUUM_PAGES = max(0, int(self.config['purge']['vacuum_pages']))
+        # 削除した記事情報を保存するディレクトリへのパス
+        self.PATH_DIR_ARCHIVE = self.config['path']['dir_archive']
+
+        # ARTICLE_INFO_HATENA_FTS.TBLのDAOクラス
+        self.article_info_hatena_fts_dao = ArticleInfoHatenaFtsDao()
+        # データベース保守用のDAOクラス
+        self.database_maintenance_dao = DatabaseMaintenanceDao()
+
+    def execute(self):
+        '''削除処理を実行するメソッド。'''
+
+        self.log.normal(LogLevel.INFO.value, 'LINF0001', self.CLASS_NAME)
+
+        try:
+            conn, cursor = connect_to_database()
+
+            # 削除予定日を過ぎた記事情報の削除処理を開始
+            self.__purge_expired_articles(conn, cursor)
+            # 削除により生じた未使用領域を解放
+            self.__reclaim_free_pages(conn, cursor)
+            # 管理テーブルからシリアル番号を消去
+            self.flush_serial_number(conn, cursor)
+        except (sqlite3.Error, OSError) as e:
+            conn.rollback()
+            self.log.normal(LogLevel.ERROR.value, 'LERR0001', self.CLASS_NAME)
+            self.log.normal(LogLevel.INFO.value, 'LINF0004', self.CLASS_NAME)
+            self.log.error(e)
+        finally:
+            conn.close()
+            self.close_http()
+            self.log.normal(LogLevel.INFO.value, 'LINF0005', self.CLASS_NAME)
+            self.log.normal(LogLevel.INFO.value, 'LINF0008', self.CLASS_NAME)
+            time.sleep(self.EXIT_PAUSE_SEC)
+
+    def __purge_expired_articles(self, conn: sqlite3.Connection, cursor: sqlite3.Cursor):
+        '''削除予定日を過ぎた記事情報を設定ファイルで指定された件数毎に削除するメソッド。
+        削除はバッチ単位でコミットするため、処理中も他プロセスからの書き込みを長時間妨げない。
+        保存が有効な場合は、削除前に記事情報をgzip圧縮したJSON Lines形式のファイルへ追記する。
+
+        :param sqlite3.Connection conn: DBとのコネクション。
+        :param sqlite3.Cursor cursor: カーソル。
+        '''
+
+        # 削除予定日の基準日
+        today = int(date.today().strftime('%Y%m%d'))
+        # 削除対象のレコード数
+        count_records = self.article_info_hatena_dao.count_expired(cursor, today)[0]
+
+        cowsay = Cowsay()
+        if not count_records:
+            print(cowsay.cowsay(self.message.get_echo('MECH0013')))
+            return
+
+        print(cowsay.cowsay(self.message.get_echo('MECH0014', count_records, 'records' if count_records > 1 else 'record')))
+
+        archive = None
+        if self.PURGE_ARCHIVE:
+            if not os.path.exists(self.PATH_DIR_ARCHIVE):
+                os.makedirs(self.PATH_DIR_ARCHIVE)
+
+            path_archive = os.path.join(self.PATH_DIR_ARCHIVE, 'ARTICLE_INFO_HATENA_{}.jsonl.gz'.format(datetime.now().strftime('%Y%m%d%H%M%S')))
+            archive = gzip.open(path_archive, 'at', encoding='utf-8')
+
+        columns = ['URL', 'TITLE', 'PUBLISHED_DATE', 'BOOKMARKS', 'TAG', 'REGISTER_DATE', 'UPDATED_DATE', 'RESERVED_DEL_DATE']
+
+        try:
+            with tqdm(total=count_records, ncols=60, leave=False, ascii=True, desc='Purging...') as progress:
+                while True:
+                    article_infos = self.article_info_hatena_dao.select_expired(cursor, today, self.PURGE_BATCH_SIZE)
+
+                    if not article_infos:
+                        break
+
+                    if archive:
+                        # 削除前に保存し、削除のコミット前にファイルへ書き出す
+                        archive.writelines(json.dumps(dict(zip(columns, article_info)), ensure_ascii=False) + '\n' for article_info in article_infos)
+                        archive.flush()
+
+                    # 削除処理とバッチ単位でのコミット
+                    self.article_info_hatena_dao.delete_by_primary_keys(cursor, [article_info[0] for article_info in article_infos])
+                    conn.commit()
+
+                    progress.update(len(article_infos))
+        finally:
+            if archive:
+                archive.close()
+
+        if archive:
+            print(cowsay.cowsay(self.message.get_echo('MECH0015', path_archive)))
+
+        print(cowsay.cowsay(self.message.get_echo('MECH0016')))
+
+    def __reclaim_free_pages(self, conn: sqlite3.Connection, cursor: sqlite3.Cursor):
+        '''削除により生じた未使用ページをデータベースファイルから解放するメソッド。
+        auto_vacuumがINCREMENTALでない場合は、初回のみVACUUMを伴う設定変更と全文検索インデックスの再構築を行う。
+        未使用ページがない場合は何もしない。
+
+        :param sqlite3.Connection conn: DBとのコネクション。
+        :param sqlite3.Cursor cursor: カーソル。
+        '''
+
+        if conn.in_transaction:
             conn.commit()
-            print(cowsay.cowsay(self.message.get_echo('MECH0008')))
 
-            # デバッグ終了
-            self.log.normal(LogLevel.DEBUG.value, 'LDEB0003', self.CLASS_NAME, self.log.location())
-        else:
-            self.message.showerror('MERR0004')
+        if self.database_maintenance_dao.select_auto_vacuum(cursor)[0] != DatabaseMaintenanceDao.AUTO_VACUUM_INCREMENTAL:
+            self.database_maintenance_dao.enable_incremental_vacuum(cursor)
+            # VACUUMによりrowidが振り直されるため全文検索インデックスを再構築する
+            self.article_info_hatena_fts_dao.rebuild(cursor)
+            conn.commit()
+
+        if not self.database_maintenance_dao.select_freelist_count(cursor)[0]:
+            # VACUUM直後など未使用ページがない場合は解放しない
+            return
+
+        self.database_maintenance_dao.incremental_vacuum(cursor, self.PURGE_VACUUM_PAGES)
+
+def crawl_shard(argv: list, depths: dict, path_staging: str, shards: int) -> list:
+    '''ワーカプロセスで検索ワードの一部をクローリングする関数。
+    インターネットとの疎通確認は親プロセスで実施済みのため行わない。
+
+    :param list argv: 親プロセスのコマンドライン引数。
+    :param dict depths: 担当する検索ワードをキーとした取得ページ数の辞書。
+    :param str path_staging: ステージングDBへのパス。
+    :param int shards: 同時に起動するワーカプロセス数。
+    :rtype: tuple
+    :return: (検索ワード, 新規の記事数, 未登録の記事を含んでいたページ数)のリストと、失敗したリクエストのリストのタプル。
+    '''
+
+    crawler = CrawlingHatena(argv, check_internet=False, shards=shards)
+
+    return crawler.crawl_to_staging(depths, path_staging)
 
 if __name__ == '__main__':
     CrawlHandler(sys.argv)
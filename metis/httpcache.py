@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+
+'''
+
+An on-disk HTTP response cache for the crawler.
+
+Responses are stored in a SQLite file keyed by URL, together with their ETag and Last-Modified validators.
+A response younger than the configured TTL is served from disk without touching the network;
+an older one is revalidated with a conditional request (If-None-Match / If-Modified-Since)
+and a 304 reply refreshes it in place.
+The cache is bounded by size and evicts the least recently used entries first.
+The total size is kept in a one-row table updated in the same transaction as each store,
+so processes sharing the file agree on it without summing every entry.
+Hit / revalidation / miss counters are kept for the run.
+
+:copyright: (c) 2018 by Kato Shinya.
+:license: MIT, see LICENSE for more details.
+'''
+
+from email.message import Message
+from httpclient import HttpResponse
+import threading
+import sqlite3
+import time
+import zlib
+import os.path
+import os
+
+__author__ = 'Kato Shinya'
+__date__ = '2018/04/21'
+
+class HttpCache:
+    '''SQLiteファイルにHTTPレスポンスを保存するキャッシュクラス。'''
+
+    def __init__(self, path: str, ttl=3600, max_bytes=100 * 1024 * 1024):
+        '''コンストラクタ。
+        キャッシュファイルおよび格納ディレクトリが存在しない場合は生成する。
+
+        :param str path: キャッシュファイルへのパス。
+        :param int ttl: 再検証せずにキャッシュを返却する期間(秒)。初期値は3600。
+        :param int max_bytes: キャッシュ全体の最大サイズ(バイト)。初期値は100MiB。
+        '''
+
+        self.TTL = ttl
+        self.MAX_BYTES = max_bytes
+
+        # ヒット数
+        self.hits = 0
+        # 条件付きリクエストで再検証した数
+        self.revalidated = 0
+        # ミス数
+        self.misses = 0
+
+        dir_cache = os.path.dirname(path)
+        if dir_cache and not os.path.exists(dir_cache):
+            os.makedirs(dir_cache)
+
+        # 複数スレッドから利用するためロックで排他制御する
+        self.__lock = threading.Lock()
+        self.__conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.__conn.execute('''
+                            CREATE TABLE IF NOT EXISTS HTTP_CACHE (
+                                URL TEXT NOT NULL PRIMARY KEY,
+                                CONTENT_TYPE TEXT,
+                                ETAG TEXT,
+                                LAST_MODIFIED TEXT,
+                                STORED_AT REAL NOT NULL,
+                                ACCESSED_AT REAL NOT NULL,
+                                SIZE INTEGER NOT NULL,
+                                BODY BLOB NOT NULL
+                            )
+                            ''')
+        self.__conn.execute('''
+                            CREATE INDEX IF NOT EXISTS INDEX_HTTP_CACHE_ACCESSED_AT ON HTTP_CACHE (
+                                ACCESSED_AT
+                            )
+                            ''')
+
+        self.__conn.execute('''
+                            CREATE TABLE IF NOT EXISTS HTTP_CACHE_META (
+                                ID INTEGER NOT NULL PRIMARY KEY CHECK (ID = 0),
+                                TOTAL_BYTES INTEGER NOT NULL
+                            )
+                            ''')
+        # キャッシュサイズの管理行がない場合のみ、保存済みのキャッシュから集計して生成する
+        self.__conn.execute('''
+                            INSERT OR IGNORE INTO
+                                HTTP_CACHE_META
+                            SELECT
+                                0,
+                                IFNULL(SUM(SIZE), 0)
+                            FROM
+                                HTTP_CACHE
+                            ''')
+
+        # 最後に参照したキャッシュサイズ
+        self.__total_bytes = self.__conn.execute('SELECT TOTAL_BYTES FROM HTTP_CACHE_META').fetchone()[0]
+
+    def fetch(self, http, url: str, headers={}) -> HttpResponse:
+        '''キャッシュを考慮してレスポンスを取得するメソッド。
+        TTL内のキャッシュはそのまま返却し、TTLを過ぎたキャッシュは条件付きリクエストで再検証する。
+
+        :param httpclient.HttpConnectionPool http: 通信に使用するコネクションプール。
+        :param str url: 取得対象URL。
+        :param dict headers: リクエストヘッダ。初期値は空の辞書。
+        :rtype: HttpResponse
+        :return: レスポンス。
+        '''
+
+        entry = self.__select(url)
+        now = time.time()
+
+        if entry and now - entry['STORED_AT'] < self.TTL:
+            # TTL内のキャッシュを返却する
+            self.__touch(url, now, refresh=False)
+            return self.__to_response(url, entry)
+
+        conditional_headers = dict(headers)
+        if entry and entry['ETAG']:
+            conditional_headers['If-None-Match'] = entry['ETAG']
+        if entry and entry['LAST_MODIFIED']:
+            conditional_headers['If-Modified-Since'] = entry['LAST_MODIFIED']
+
+        response = http.request(url, headers=conditional_headers)
+
+        if entry and response.status == 304:
+            # 変更がないためキャッシュを延命して返却する
+            self.__touch(url, now, refresh=True)
+            return self.__to_response(url, entry)
+
+        with self.__lock:
+            self.misses += 1
+
+        if response.status == 200:
+            self.__store(url, response, now)
+
+        return response
+
+    def statistics(self) -> dict:
+        '''キャッシュの利用状況を返すメソッド。
+
+        :rtype: dict
+        :return: ヒット数、再検証数、ミス数および現在のキャッシュサイズを格納した辞書。
+        '''
+
+        with self.__lock:
+            return {'hits' : self.hits, 'revalidated' : self.revalidated, 'misses' : self.misses, 'bytes' : self.__total_bytes}
+
+    def close(self):
+        '''キャッシュファイルとのコネクションを閉じるメソッド。'''
+
+        with self.__lock:
+            self.__conn.close()
+
+    def __select(self, url: str) -> dict:
+        '''URLに対応するキャッシュを取得するメソッド。
+
+        :param str url: 取得対象URL。
+        :rtype: dict
+        :return: キャッシュ情報を格納した辞書。存在しない場合はNone。
+        '''
+
+        with self.__lock:
+            row = self.__conn.execute('''
+                                      SELECT
+                                          CONTENT_TYPE,
+                                          ETAG,
+                                          LAST_MODIFIED,
+                                          STORED_AT,
+                                          BODY
+                                      FROM
+                                          HTTP_CACHE
+                                      WHERE
+                                          URL = ?
+                                      ''', (url,)).fetchone()
+
+        if not row:
+            return None
+
+        return dict(zip(['CONTENT_TYPE', 'ETAG', 'LAST_MODIFIED', 'STORED_AT', 'BODY'], row))
+
+    def __touch(self, url: str, now: float, refresh: bool):
+        '''キャッシュの最終参照日時を更新し、ヒット数または再検証数を加算するメソッド。
+
+        :param str url: 対象URL。
+        :param float now: 現在時刻。
+        :param bool refresh: 保存日時も更新しTTLを延長するか否か。
+        '''
+
+        with self.__lock:
+            if refresh:
+                self.revalidated += 1
+                self.__conn.execute('UPDATE HTTP_CACHE SET STORED_AT = ?, ACCESSED_AT = ? WHERE URL = ?', (now, now, url,))
+            else:
+                self.hits += 1
+                self.__conn.execute('UPDATE HTTP_CACHE SET ACCESSED_AT = ? WHERE URL = ?', (now, url,))
+
+    def __store(self, url: str, response: HttpResponse, now: float):
+        '''レスポンスをキャッシュへ保存し、最大サイズを超えた分を参照日時の古い順に削除するメソッド。
+
+        :param str url: 対象URL。
+        :param HttpResponse response: 保存するレスポンス。
+        :param float now: 現在時刻。
+        '''
+
+        body = zlib.compress(response.body)
+
+        with self.__lock:
+            # 同一ファイルを共有する他プロセスの書き込みと直列化する
+            self.__conn.execute('BEGIN IMMEDIATE')
+            try:
+                # 置き換える場合は置き換え前のサイズを差し引く
+                replaced = self.__conn.execute('SELECT SIZE FROM HTTP_CACHE WHERE URL = ?', (url,)).fetchone()
+                self.__conn.execute('''
+                                    INSERT OR REPLACE INTO
+                                        HTTP_CACHE
+                                    VALUES (
+                                        ?, ?, ?, ?, ?, ?, ?, ?
+                                    )
+                                    ''', (url, response.headers.get('Content-Type'), response.headers.get('ETag'), response.headers.get('Last-Modified'), now, now, len(body), body,))
+
+                # 他プロセスが保存した分も含めるため、キャッシュサイズはトランザクション内で管理行から取得して更新する
+                total_bytes = self.__conn.execute('SELECT TOTAL_BYTES FROM HTTP_CACHE_META').fetchone()[0]
+                total_bytes += len(body) - (replaced[0] if replaced else 0)
+                if total_bytes > self.MAX_BYTES:
+                    total_bytes -= self.__evict(total_bytes - self.MAX_BYTES)
+                self.__conn.execute('UPDATE HTTP_CACHE_META SET TOTAL_BYTES = ?', (total_bytes,))
+
+                self.__conn.execute('COMMIT')
+            except BaseException:
+                self.__conn.execute('ROLLBACK')
+                raise
+
+            self.__total_bytes = total_bytes
+
+    def __evict(self, excess: int) -> int:
+        '''最終参照日時の古いキャッシュから指定サイズ以上を削除するメソッド。
+        呼び出し元でロックを取得し、トランザクションを開始していること。
+
+        :param int excess: 削除する必要のあるサイズ(バイト)。
+        :rtype: int
+        :return: 削除したサイズ(バイト)。
+        '''
+
+        urls = []
+        evicted = 0
+        for url, size in self.__conn.execute('SELECT URL, SIZE FROM HTTP_CACHE ORDER BY ACCESSED_AT'):
+            urls.append((url,))
+            evicted += size
+            if evicted >= excess:
+                break
+
+        self.__conn.executemany('DELETE FROM HTTP_CACHE WHERE URL = ?', urls)
+
+        return evicted
+
+    def __to_response(self, url: str, entry: dict) -> HttpResponse:
+        '''キャッシュ情報からレスポンスを復元するメソッド。
+
+        :param str url: 対象URL。
+        :param dict entry: キャッシュ情報を格納した辞書。
+        :rtype: HttpResponse
+        :return: 復元したレスポンス。
+        '''
+
+        headers = Message()
+        if entry['CONTENT_TYPE']:
+            headers['Content-Type'] = entry['CONTENT_TYPE']
+
+        return HttpResponse(url, 200, 'OK', headers, zlib.decompress(entry['BODY']))
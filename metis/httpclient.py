@@ -0,0 +1,549 @@
+# -*- coding: utf-8 -*-
+
+'''
+
+A small HTTP/1.1 client built on http.client for the crawler.
+
+Connections are kept alive and reused per host instead of being opened for every request,
+so repeated requests against the same host do not pay the TCP and TLS handshakes again.
+The number of connections per host is bounded, which also acts as a politeness cap,
+and the pool can be shared safely between threads.
+
+Requests are paced per host with a token bucket.
+Connection errors, 429 and 5xx replies are retried with exponential backoff and full jitter,
+and a Retry-After header from the server takes precedence over the computed delay
+and holds back every thread that talks to the same host.
+
+Responses are requested with compression (gzip / deflate, and br when the optional brotli package is installed)
+and decompressed incrementally while being read.
+
+Failures are reported with the same exception types as urllib (URLError / HTTPError)
+so that callers can handle them in the same way as urlopen.
+
+When a telemetry.Telemetry is given, the pool records the time spent resolving host names
+and opening connections (TCP and TLS handshakes) separately, each request with its status and body size,
+and counts retries and failed requests.
+
+:copyright: (c) 2018 by Kato Shinya.
+:license: MIT, see LICENSE for more details.
+'''
+
+from urllib.error import URLError, HTTPError
+from urllib.parse import urlparse, urljoin
+from http.client import HTTPConnection, HTTPSConnection, HTTPException
+from queue import LifoQueue, Empty, Full
+from email.utils import parsedate_to_datetime
+from functools import partial
+import threading
+import socket
+import random
+import codecs
+import time
+import zlib
+from telemetry import Telemetry
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+__author__ = 'Kato Shinya'
+__date__ = '2018/04/21'
+
+class HttpResponse:
+    '''HTTPレスポンスを保持するクラス。'''
+
+    def __init__(self, url: str, status: int, reason: str, headers, body: bytes):
+        '''コンストラクタ。
+
+        :param str url: リダイレクト後の最終的なURL。
+        :param int status: ステータスコード。
+        :param str reason: ステータスの説明。
+        :param http.client.HTTPMessage headers: レスポンスヘッダ。
+        :param bytes body: レスポンスボディ。
+        '''
+
+        self.url = url
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+
+    def text(self, errors='ignore') -> str:
+        '''レスポンスボディをContent-Typeヘッダの文字コードで文字列へデコードするメソッド。
+        文字コードが指定されていない場合はUTF-8とみなす。
+
+        :param str errors: デコードエラー時の処理方法。初期値は'ignore'。
+        :rtype: str
+        :return: デコードしたレスポンスボディ。
+        '''
+
+        charset = self.headers.get_content_charset(failobj='utf-8')
+
+        try:
+            decoder = codecs.getincrementaldecoder(charset)(errors)
+        except LookupError:
+            decoder = codecs.getincrementaldecoder('utf-8')(errors)
+
+        return decoder.decode(self.body, final=True)
+
+class ContentDecoder:
+    '''Content-Encodingに応じてレスポンスボディを逐次伸長するクラス。'''
+
+    def __init__(self, encoding: str):
+        '''コンストラクタ。
+
+        :param str encoding: Content-Encodingヘッダの値。
+        '''
+
+        self.encoding = (encoding or 'identity').strip().lower()
+
+        if self.encoding in ('gzip', 'x-gzip'):
+            self.__decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif self.encoding == 'deflate':
+            self.__decompressor = zlib.decompressobj()
+        elif self.encoding == 'br' and brotli:
+            self.__decompressor = brotli.Decompressor()
+        else:
+            self.__decompressor = None
+
+        # deflateにおいてzlibヘッダの有無を判定済みか否か
+        self.__first_chunk = True
+
+    def decompress(self, chunk: bytes) -> bytes:
+        '''受信したチャンクを伸長するメソッド。
+
+        :param bytes chunk: 受信したチャンク。
+        :rtype: bytes
+        :return: 伸長したデータ。
+        '''
+
+        if self.__decompressor is None:
+            return chunk
+
+        if self.encoding == 'br':
+            return self.__decompressor.process(chunk)
+
+        if self.encoding == 'deflate' and self.__first_chunk:
+            self.__first_chunk = False
+            try:
+                return self.__decompressor.decompress(chunk)
+            except zlib.error:
+                # zlibヘッダのない生のdeflateを送るサーバに対応する
+                self.__decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+
+        return self.__decompressor.decompress(chunk)
+
+    def flush(self) -> bytes:
+        '''伸長処理の残りを取り出すメソッド。
+
+        :rtype: bytes
+        :return: 伸長したデータの残り。
+        '''
+
+        if self.__decompressor is None or self.encoding == 'br':
+            return b''
+
+        return self.__decompressor.flush()
+
+class TokenBucket:
+    '''リクエストの送信間隔を制御するトークンバケットクラス。
+    トークンは毎秒一定数ずつ容量まで補充され、1リクエストにつき1トークンを消費する。
+    補充数が0の場合は送信間隔を制限せず、pauseによる停止のみを行う。
+    '''
+
+    def __init__(self, rate: float, capacity: int):
+        '''コンストラクタ。
+
+        :param float rate: 毎秒補充するトークン数。0の場合は制限しない。
+        :param int capacity: バケットの容量(連続して送信できるリクエスト数)。
+        '''
+
+        self.RATE = rate
+        self.CAPACITY = max(1, capacity)
+
+        # 残りのトークン数
+        self.__tokens = float(self.CAPACITY)
+        # 最後にトークンを補充した時刻
+        self.__updated = time.monotonic()
+        # この時刻まではトークンを払い出さない
+        self.__paused_until = 0.0
+        self.__lock = threading.Lock()
+
+    def acquire(self):
+        '''トークンを1つ消費するメソッド。トークンがない場合は補充されるまで待機する。'''
+
+        while True:
+            with self.__lock:
+                now = time.monotonic()
+                if self.RATE > 0:
+                    self.__tokens = min(self.CAPACITY, self.__tokens + (now - self.__updated) * self.RATE)
+                self.__updated = now
+
+                if now < self.__paused_until:
+                    wait = self.__paused_until - now
+                elif self.RATE <= 0:
+                    return
+                elif self.__tokens >= 1:
+                    self.__tokens -= 1
+                    return
+                else:
+                    wait = (1 - self.__tokens) / self.RATE
+
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        '''指定秒数の間トークンの払い出しを停止するメソッド。
+
+        :param float seconds: 停止する秒数。
+        '''
+
+        with self.__lock:
+            self.__paused_until = max(self.__paused_until, time.monotonic() + seconds)
+            self.__tokens = 0.0
+
+class HttpConnectionPool:
+    '''ホスト毎にKeep-Alive接続を再利用するコネクションプールクラス。'''
+
+    # 受信時の読み込み単位
+    CHUNK_SIZE = 64 * 1024
+    # 再試行対象とする4xxのステータスコード
+    RETRY_STATUSES = (408, 429)
+
+    def __init__(self, max_connections_per_host=2, timeout=10.0, retries=3, backoff=0.5, max_redirects=5, compression=True, rate_per_host=0.0, burst_per_host=1, max_backoff=60.0, telemetry=None):
+        '''コンストラクタ。
+
+        :param int max_connections_per_host: ホスト毎の最大同時接続数。初期値は2。
+        :param float timeout: 接続および受信のタイムアウト(秒)。初期値は10.0。
+        :param int retries: 接続エラー、429および5xx応答時の最大再試行回数。初期値は3。
+        :param float backoff: 再試行時の待機時間の基準値(秒)。試行毎に上限を2倍にし、その範囲で無作為に待機する。初期値は0.5。
+        :param int max_redirects: リダイレクトを追跡する最大回数。初期値は5。
+        :param bool compression: 圧縮転送を要求するか否か。初期値はTrue。
+        :param float rate_per_host: ホスト毎の毎秒の最大リクエスト数。0の場合は制限しない。初期値は0.0。
+        :param int burst_per_host: ホスト毎に連続して送信できるリクエスト数。初期値は1。
+        :param float max_backoff: 再試行時の待機時間の上限(秒)。Retry-Afterがこれを超える場合は再試行しない。初期値は60.0。
+        :param telemetry.Telemetry telemetry: 接続と通信の所要時間を記録するテレメトリ。初期値はNone(記録しない)。
+        '''
+
+        self.MAX_CONNECTIONS_PER_HOST = max(1, max_connections_per_host)
+        self.TIMEOUT = timeout
+        self.RETRIES = max(0, retries)
+        self.BACKOFF = backoff
+        self.MAX_REDIRECTS = max_redirects
+        self.RATE_PER_HOST = max(0.0, rate_per_host)
+        self.BURST_PER_HOST = max(1, burst_per_host)
+        self.MAX_BACKOFF = max_backoff
+        # 要求する圧縮形式
+        self.ACCEPT_ENCODING = ('gzip, deflate, br' if brotli else 'gzip, deflate') if compression else 'identity'
+        # 所要時間とカウンタを記録するテレメトリ
+        self.telemetry = telemetry or Telemetry()
+
+        # ホスト毎の待機中コネクション
+        self.__idle_connections = {}
+        # ホスト毎の同時接続数を制御するセマフォ
+        self.__host_semaphores = {}
+        # ホスト毎の送信間隔を制御するトークンバケット
+        self.__host_buckets = {}
+        # 上記辞書の排他制御用ロック
+        self.__lock = threading.Lock()
+
+    def request(self, url: str, headers={}) -> HttpResponse:
+        '''GETリクエストを送信しレスポンスを取得するメソッド。
+        リダイレクトは追跡し、接続エラー、429および5xx応答時は待機時間を延ばしながら再試行する。
+
+        :param str url: 取得対象URL。
+        :param dict headers: リクエストヘッダ。初期値は空の辞書。
+        :rtype: HttpResponse
+        :return: レスポンス。
+        :raises urllib.error.HTTPError: 4xx応答時、または再試行後も429もしくは5xx応答だった場合。
+        :raises urllib.error.URLError: 再試行後も接続に失敗した場合。
+        '''
+
+        for redirect in range(self.MAX_REDIRECTS + 1):
+            response = self.__request_with_retry(url, headers)
+
+            location = response.headers.get('Location')
+            if response.status in (301, 302, 303, 307, 308) and location:
+                # リダイレクト先を追跡する
+                url = urljoin(url, location)
+                continue
+
+            if response.status >= 400:
+                self.telemetry.count('http.errors')
+                raise HTTPError(url, response.status, response.reason, response.headers, None)
+
+            return response
+
+        raise URLError('too many redirects: {}'.format(url))
+
+    def close(self):
+        '''待機中のコネクションを全て切断するメソッド。'''
+
+        with self.__lock:
+            idle_connections = list(self.__idle_connections.values())
+
+        for queue in idle_connections:
+            while True:
+                try:
+                    queue.get_nowait().close()
+                except Empty:
+                    break
+
+    def __request_with_retry(self, url: str, headers: dict) -> HttpResponse:
+        '''再試行を伴うリクエストの送信を行うメソッド。
+
+        :param str url: 取得対象URL。
+        :param dict headers: リクエストヘッダ。
+        :rtype: HttpResponse
+        :return: レスポンス。
+        '''
+
+        parsed = urlparse(url)
+        key = (parsed.scheme, parsed.netloc)
+
+        for attempt in range(self.RETRIES + 1):
+            retry_after = None
+
+            try:
+                response = self.__send(url, headers)
+
+                if (response.status < 500 and response.status not in self.RETRY_STATUSES) or attempt == self.RETRIES:
+                    return response
+
+                retry_after = self.__parse_retry_after(response.headers.get('Retry-After'))
+                if retry_after is not None and retry_after > self.MAX_BACKOFF:
+                    # 待機時間の上限を超える場合は再試行しない
+                    return response
+            except (OSError, HTTPException) as e:
+                if attempt == self.RETRIES:
+                    self.telemetry.count('http.errors')
+                    raise URLError(e)
+
+            self.telemetry.count('http.retries')
+
+            if retry_after is not None:
+                # サーバの指定に従い、同一ホストへの全てのリクエストを待機させる
+                self.__get_host_bucket(key).pause(retry_after)
+                time.sleep(retry_after)
+            else:
+                # 待機時間の上限を試行毎に2倍にし、その範囲で無作為に待機して再試行が集中しないようにする
+                time.sleep(random.uniform(0, min(self.MAX_BACKOFF, self.BACKOFF * (2 ** attempt))))
+
+    def __parse_retry_after(self, value: str) -> float:
+        '''Retry-Afterヘッダの値を待機秒数へ変換するメソッド。
+
+        :param str value: Retry-Afterヘッダの値。秒数またはHTTP日付。
+        :rtype: float
+        :return: 待機秒数。ヘッダがない場合や解釈できない場合はNone。
+        '''
+
+        if not value:
+            return None
+
+        value = value.strip()
+        if value.isdigit():
+            return float(value)
+
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    def __send(self, url: str, headers: dict) -> HttpResponse:
+        '''プールから取得したコネクションでリクエストを1回送信するメソッド。
+        再利用したコネクションがサーバ側で切断されていた場合は、新しいコネクションで1度だけ送り直す。
+
+        :param str url: 取得対象URL。
+        :param dict headers: リクエストヘッダ。
+        :rtype: HttpResponse
+        :return: レスポンス。
+        '''
+
+        parsed = urlparse(url)
+        key = (parsed.scheme, parsed.netloc)
+        headers = dict(headers)
+        if not any(name.lower() == 'accept-encoding' for name in headers):
+            # 呼び出し元が指定していない場合のみ既定の圧縮形式を要求する
+            headers['Accept-Encoding'] = self.ACCEPT_ENCODING
+        path = parsed.path or '/'
+        if parsed.query:
+            path = '{}?{}'.format(path, parsed.query)
+
+        # ホスト毎の送信間隔を守る
+        self.__get_host_bucket(key).acquire()
+
+        with self.__get_host_semaphore(key), self.telemetry.timer('http.request', host=parsed.netloc) as fields:
+            conn, reused = self.__acquire(key)
+            fields['reused'] = reused
+
+            try:
+                try:
+                    conn.request('GET', path, headers=headers)
+                    source = conn.getresponse()
+                except (ConnectionError, HTTPException):
+                    if not reused:
+                        raise
+
+                    # Keep-Alive切れの場合は新しいコネクションで送り直す
+                    conn.close()
+                    conn, reused = self.__connect(key), False
+                    conn.request('GET', path, headers=headers)
+                    source = conn.getresponse()
+
+                body = self.__read_body(source)
+                fields['status'] = source.status
+                fields['bytes'] = len(body)
+            except BaseException:
+                conn.close()
+                raise
+
+            if source.will_close:
+                conn.close()
+            else:
+                self.__release(key, conn)
+
+        return HttpResponse(url, source.status, source.reason, source.headers, body)
+
+    def __read_body(self, source) -> bytes:
+        '''レスポンスボディをチャンク単位で読み込みながら伸長するメソッド。
+
+        :param http.client.HTTPResponse source: レスポンス。
+        :rtype: bytes
+        :return: 伸長したレスポンスボディ。
+        '''
+
+        decoder = ContentDecoder(source.headers.get('Content-Encoding'))
+        chunks = []
+
+        while True:
+            chunk = source.read(self.CHUNK_SIZE)
+            if not chunk:
+                break
+            chunks.append(decoder.decompress(chunk))
+
+        chunks.append(decoder.flush())
+
+        return b''.join(chunks)
+
+    def __acquire(self, key: tuple) -> tuple:
+        '''待機中のコネクションを取得するメソッド。待機中のコネクションがない場合は新規に生成する。
+
+        :param tuple key: (スキーム, ホスト)のタプル。
+        :rtype: tuple
+        :return: コネクションと再利用したか否かのタプル。
+        '''
+
+        try:
+            return self.__get_idle_queue(key).get_nowait(), True
+        except Empty:
+            return self.__connect(key), False
+
+    def __release(self, key: tuple, conn: HTTPConnection):
+        '''使用済みのコネクションをプールへ戻すメソッド。プールが上限に達している場合は切断する。
+
+        :param tuple key: (スキーム, ホスト)のタプル。
+        :param http.client.HTTPConnection conn: コネクション。
+        '''
+
+        try:
+            self.__get_idle_queue(key).put_nowait(conn)
+        except Full:
+            conn.close()
+
+    def __connect(self, key: tuple) -> HTTPConnection:
+        '''新規コネクションを生成するメソッド。
+
+        :param tuple key: (スキーム, ホスト)のタプル。
+        :rtype: http.client.HTTPConnection
+        :return: コネクション。
+        '''
+
+        scheme, netloc = key
+        if scheme == 'https':
+            conn = HTTPSConnection(netloc, timeout=self.TIMEOUT)
+        else:
+            conn = HTTPConnection(netloc, timeout=self.TIMEOUT)
+
+        if self.telemetry.enabled:
+            # 名前解決とハンドシェイクの所要時間を分けて記録するため、先に名前解決してからリクエスト送信前に接続する
+            with self.telemetry.timer('http.dns', host=netloc):
+                addresses = socket.getaddrinfo(conn.host, conn.port, 0, socket.SOCK_STREAM)
+            conn._create_connection = partial(self.__create_connection, addresses)
+
+            with self.telemetry.timer('http.connect', host=netloc):
+                conn.connect()
+
+        return conn
+
+    def __create_connection(self, addresses: list, address: tuple, timeout=None, source_address=None) -> socket.socket:
+        '''名前解決済みのアドレスへ順に接続するメソッド。socket.create_connectionの代わりに使用する。
+        TLSのSNIと証明書の検証にはコネクションのホスト名がそのまま使用される。
+
+        :param list addresses: socket.getaddrinfoの結果。
+        :param tuple address: (ホスト, ポート)のタプル。名前解決済みのため使用しない。
+        :param float timeout: タイムアウト(秒)。初期値はNone。
+        :param tuple source_address: 接続元のアドレス。初期値はNone。
+        :rtype: socket.socket
+        :return: 接続済みのソケット。
+        '''
+
+        error = OSError('getaddrinfo returns an empty list')
+
+        for family, type, proto, _, sockaddr in addresses:
+            sock = socket.socket(family, type, proto)
+            try:
+                if timeout is not None:
+                    sock.settimeout(timeout)
+                if source_address:
+                    sock.bind(source_address)
+                sock.connect(sockaddr)
+
+                return sock
+            except OSError as e:
+                error = e
+                sock.close()
+
+        raise error
+
+    def __get_idle_queue(self, key: tuple) -> LifoQueue:
+        '''ホスト毎の待機中コネクションのキューを取得するメソッド。
+
+        :param tuple key: (スキーム, ホスト)のタプル。
+        :rtype: queue.LifoQueue
+        :return: 待機中コネクションのキュー。
+        '''
+
+        with self.__lock:
+            if key not in self.__idle_connections:
+                self.__idle_connections[key] = LifoQueue(maxsize=self.MAX_CONNECTIONS_PER_HOST)
+
+            return self.__idle_connections[key]
+
+    def __get_host_semaphore(self, key: tuple) -> threading.BoundedSemaphore:
+        '''ホスト毎の同時接続数を制御するセマフォを取得するメソッド。
+
+        :param tuple key: (スキーム, ホスト)のタプル。
+        :rtype: threading.BoundedSemaphore
+        :return: 当該ホストに対応するセマフォ。
+        '''
+
+        with self.__lock:
+            if key not in self.__host_semaphores:
+                self.__host_semaphores[key] = threading.BoundedSemaphore(self.MAX_CONNECTIONS_PER_HOST)
+
+            return self.__host_semaphores[key]
+
+    def __get_host_bucket(self, key: tuple) -> TokenBucket:
+        '''ホスト毎の送信間隔を制御するトークンバケットを取得するメソッド。
+        毎秒の最大リクエスト数が0の場合は、Retry-Afterによる待機のみを行うバケットを返す。
+
+        :param tuple key: (スキーム, ホスト)のタプル。
+        :rtype: TokenBucket
+        :return: 当該ホストに対応するトークンバケット。
+        '''
+
+        with self.__lock:
+            if key not in self.__host_buckets:
+                self.__host_buckets[key] = TokenBucket(self.RATE_PER_HOST, self.BURST_PER_HOST)
+
+            return self.__host_buckets[key]
@@ -6,13 +6,20 @@
 '''
 
 from logging import getLogger
-from logging import FileHandler
+from logging import Handler
 from logging import StreamHandler
 from logging import Formatter
-from datetime import datetime
+from logging import Filter
+from logging.handlers import QueueHandler, QueueListener
+from datetime import datetime, timedelta
+from queue import SimpleQueue, Empty
+from multiprocessing import util
 from enum import Enum
 from common import *
+import threading
 import inspect
+import locale
+import atexit
 import os.path
 import os
 
@@ -29,11 +36,210 @@ class LogLevel(Enum):
     ERROR = 40
     CRITICAL = 50
 
+# プロセス内で共有するログ書き込みスレッド
+_writer = None
+# 上記の生成を排他制御するロック
+_writer_lock = threading.Lock()
+
+class DailyLogFileHandler(Handler):
+    '''日付毎のログファイル(yyyymmdd.mlog)へ書き込むハンドラクラス。
+    レコードはメモリ上に蓄積し、flushの呼び出し時または蓄積件数が上限に達した時点でまとめて書き込む。
+    1回の書き込みで追記するため、複数プロセスから同一ファイルへ書き込んでも行が混在しない。
+    当日のログファイルは生成時に作成し、以降は日付が変わった後の最初のレコードで切り替える。
+    文字コードと改行コードはlogging.FileHandlerと同じくプラットフォームの既定値を用いる。
+    '''
+
+    def __init__(self, path_dir_log: str, capacity=256, encoding=None):
+        '''コンストラクタ。
+
+        :param str path_dir_log: ログファイルを格納するディレクトリへのパス。
+        :param int capacity: まとめて書き込むまでに蓄積する最大件数。初期値は256。
+        :param str encoding: ログファイルの文字コード。初期値はNone(プラットフォームの既定値)。
+        '''
+
+        super().__init__()
+
+        self.PATH_DIR_LOG = path_dir_log
+        self.CAPACITY = max(1, capacity)
+        # ログビューアはプラットフォームの既定の文字コードで読み込む
+        self.ENCODING = encoding or locale.getpreferredencoding(False)
+
+        # 書き込み待ちの行
+        self.__buffer = []
+        # 書き込み中のログファイル
+        self.__stream = None
+        # ログファイルを切り替える日時
+        self.__rollover_at = None
+
+        # ログビューアが参照できるよう、レコードの有無によらず当日のログファイルを生成する
+        self.__open(datetime.now())
+
+    def emit(self, record):
+        '''レコードを書き込み待ちの行として蓄積するメソッド。
+        日付が変わった場合は蓄積済みの行を書き込んでからログファイルを切り替える。
+
+        :param logging.LogRecord record: ログレコード。
+        '''
+
+        try:
+            if self.__rollover_at is None or record.created >= self.__rollover_at:
+                self.flush()
+                self.__open(datetime.fromtimestamp(record.created))
+
+            self.__buffer.append(self.format(record) + '\n')
+
+            if len(self.__buffer) >= self.CAPACITY:
+                self.flush()
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        '''蓄積した行をまとめてログファイルへ書き込むメソッド。'''
+
+        self.acquire()
+        try:
+            if self.__buffer and self.__stream:
+                # テキストモードでの書き込みと同様に改行コードを変換する
+                self.__stream.write(''.join(self.__buffer).replace('\n', os.linesep).encode(self.ENCODING, 'backslashreplace'))
+            self.__buffer = []
+        finally:
+            self.release()
+
+    def close(self):
+        '''蓄積した行を書き込み、ログファイルを閉じるメソッド。'''
+
+        self.flush()
+
+        self.acquire()
+        try:
+            if self.__stream:
+                self.__stream.close()
+                self.__stream = None
+        finally:
+            self.release()
+
+        super().close()
+
+    def __open(self, now: datetime):
+        '''指定日時のログファイルを開くメソッド。
+        格納ディレクトリが存在しない場合は生成する。
+
+        :param datetime now: レコードの生成日時。
+        '''
+
+        if self.__stream:
+            self.__stream.close()
+
+        if not os.path.exists(self.PATH_DIR_LOG):
+            os.makedirs(self.PATH_DIR_LOG)
+
+        # バッファリングせず、flush毎に1回の書き込みで追記する
+        self.__stream = open(self.PATH_DIR_LOG + now.strftime('%Y%m%d') + '.mlog', 'ab', buffering=0)
+        self.__rollover_at = datetime.combine(now.date() + timedelta(1), datetime.min.time()).timestamp()
+
+class BatchingQueueListener(QueueListener):
+    '''キューが空になった時点でハンドラをflushするキューリスナクラス。
+    キューにレコードが溜まっている間は書き込みをまとめる。
+    '''
+
+    def dequeue(self, block: bool):
+        '''キューからレコードを取り出すメソッド。
+        キューが空の場合は待機する前にハンドラをflushする。
+
+        :param bool block: レコードを待機するか否か。
+        :rtype: logging.LogRecord
+        :return: 取り出したレコード。
+        '''
+
+        try:
+            return self.queue.get(block=False)
+        except Empty:
+            if not block:
+                raise
+
+            for handler in self.handlers:
+                handler.flush()
+
+            return self.queue.get(block=True)
+
+def _install_writer(path_dir_log: str, capacity: int) -> QueueHandler:
+    '''プロセス内で1つのログ書き込みスレッドを起動する関数。
+    起動済みの場合は何もせず、起動済みのキューへ書き込むハンドラを返す。
+
+    :param str path_dir_log: ログファイルを格納するディレクトリへのパス。
+    :param int capacity: まとめて書き込むまでに蓄積する最大件数。
+    :rtype: logging.handlers.QueueHandler
+    :return: 書き込みスレッドへレコードを渡すハンドラ。
+    '''
+
+    global _writer
+
+    with _writer_lock:
+        # fork後の子プロセスでは書き込みスレッドが存在しないため起動し直す
+        if _writer is None or _writer[0] != os.getpid():
+            queue = SimpleQueue()
+            file_handler = DailyLogFileHandler(path_dir_log, capacity)
+            file_handler.setFormatter(Formatter('%(asctime)s:%(levelname)s:%(message)s'))
+
+            listener = BatchingQueueListener(queue, file_handler)
+            listener.start()
+
+            _writer = (os.getpid(), QueueHandler(queue), listener, file_handler)
+
+            # 終了時に書き込み待ちのレコードを書き込む(multiprocessingの子プロセスではatexitが呼ばれない)
+            atexit.register(_stop_writer)
+            util.Finalize(None, _stop_writer, exitpriority=10)
+
+        return _writer[1]
+
+def _stop_writer():
+    '''ログ書き込みスレッドを停止し、書き込み待ちのレコードを書き込む関数。'''
+
+    global _writer
+
+    with _writer_lock:
+        if _writer is None or _writer[0] != os.getpid():
+            return
+
+        pid, queue_handler, listener, file_handler = _writer
+        _writer = None
+
+    listener.stop()
+    file_handler.close()
+
+class CallerInfoFilter(Filter):
+    '''出力対象となったレコードに対してのみメッセージを組み立てるフィルタクラス。
+    行番号とメソッド名/関数名はloggingモジュールが呼び出し元から取得した値を用いる。
+    '''
+
+    def filter(self, record) -> bool:
+        '''Log.normal/Log.debugで出力されたレコードのメッセージを組み立てるメソッド。
+
+        :param logging.LogRecord record: ログレコード。
+        :rtype: bool
+        :return: 常にTrue(レコードを破棄しない)。
+        '''
+
+        template = getattr(record, 'template', None)
+
+        if template is not None:
+            # 呼び出し元の情報が明示されていない場合はレコードの値を用いる
+            caller = record.caller if record.caller is not None else [getattr(record, name) for name in record.caller_names]
+            record.msg = template.format(*caller, *record.template_args)
+            record.args = ()
+
+        return True
+
 class Log:
-    '''ログ出力を行うクラス。'''
+    '''ログ出力を行うクラス。
+    出力されないレベルのログは、呼び出し元の情報の取得とメッセージの組み立てを行わずに破棄する。
+    ファイルへの書き込みはプロセス内で共有する書き込みスレッドが行うため、呼び出し元のスレッドはディスクI/Oを待たない。
+    '''
 
     def __init__(self, child=False):
-        '''コンストラクタ。'''
+        '''コンストラクタ。
+        インスタンスを複数生成してもハンドラは追加しない。
+        '''
 
         # config情報の取得
         config = read_config_file()
@@ -41,42 +247,65 @@ class Log:
         self.message = read_log_message_file()
 
         self.PATH_DIR_LOG = config['path']['dir_log']
-        # ログファイルへのパスを生成
-        PATH_TO_LOG_FILE = self.PATH_DIR_LOG + datetime.today().strftime('%Y%m%d') + '.mlog'
-        # ログファイルの有効性チェック
-        self.__check_status_of_log_file(PATH_TO_LOG_FILE)
+
+        # プロセス内で1つの書き込みスレッドへレコードを渡すハンドラ
+        queue_handler = _install_writer(self.PATH_DIR_LOG, int(config['general']['log_buffer_records']))
+
+        root_logger = getLogger(__name__)
+        if queue_handler not in root_logger.handlers:
+            root_logger.addHandler(queue_handler)
 
         if child:
-            self.logger = getLogger(__name__).getChild(__name__)
+            # 子ロガーのレコードは親ロガーのハンドラへ伝播させる
+            self.logger = root_logger.getChild(__name__)
         else:
-            self.logger = getLogger(__name__)
+            self.logger = root_logger
 
         self.logger.setLevel(config['general']['log_level'])
-        fh = FileHandler(PATH_TO_LOG_FILE)
-        self.logger.addHandler(fh)
-        fh.setFormatter(Formatter('%(asctime)s:%(levelname)s:%(message)s'))
+        if not any(isinstance(f, CallerInfoFilter) for f in self.logger.filters):
+            self.logger.addFilter(CallerInfoFilter())
 
-    def normal(self, level: int, id: str, class_name: str, location: list):
+    def normal(self, level: int, id: str, class_name: str, location=None):
         '''例外情報以外のログ出力を行うメソッド。
+        出力されないレベルの場合は何もしない。
 
         :param int level: ログレベル。
         :param str id: メッセージ管理番号。
         :param str class_name: クラス名。
-        :param list location: メソッド名/関数名と行番号が格納されたリスト。
+        :param list location: 行番号とメソッド名/関数名が格納されたリスト。初期値はNone(呼び出し元から取得する)。
         '''
 
-        self.logger.log(level, self.message[str(level)][id].format(location[0], location[1], class_name))
+        if not self.logger.isEnabledFor(level):
+            return
 
-    def debug(self, id: str, var_name: str, var_value, line_no: str):
+        extra = {'template' : self.message[str(level)][id], 'template_args' : (class_name,), 'caller' : location, 'caller_names' : ('lineno', 'funcName')}
+        self.logger.log(level, id, extra=extra, stacklevel=2)
+
+    def debug(self, id: str, var_name: str, var_value, line_no=None):
         '''デバッグ情報のログ出力を行うメソッド。
+        DEBUGレベルが出力されない場合は何もしない。
 
         :param str id: メッセージ管理番号。
         :param str var_name: デバッグ対象の変数名。
         :param inferred-type var_value: デバッグ対象の値。
-        :param str line_no: 実行中の行番号。
+        :param str line_no: 実行中の行番号。初期値はNone(呼び出し元から取得する)。
+        '''
+
+        if not self.logger.isEnabledFor(LogLevel.DEBUG.value):
+            return
+
+        extra = {'template' : self.message['10'][id], 'template_args' : (var_name, var_value), 'caller' : None if line_no is None else [line_no], 'caller_names' : ('lineno',)}
+        self.logger.log(LogLevel.DEBUG.value, id, extra=extra, stacklevel=2)
+
+    def is_debug_enabled(self) -> bool:
+        '''DEBUGレベルのログが出力されるか否かを返すメソッド。
+        デバッグ用の値の算出自体に負荷がかかる場合の判定に用いる。
+
+        :rtype: bool
+        :return: DEBUGレベルのログが出力される場合はTrue。
         '''
 
-        self.logger.log(LogLevel.DEBUG.value, self.message['10'][id].format(line_no, var_name, var_value))
+        return self.logger.isEnabledFor(LogLevel.DEBUG.value)
 
     def error(self, error_info):
         '''例外情報のログ出力を行うメソッド。
@@ -113,22 +342,3 @@ class Log:
         '''
 
         return inspect.currentframe().f_back.f_code.co_name
-
-    def __check_status_of_log_file(self, path_to_log: str):
-        '''ログファイルの有効性を判定するメソッド。
-        格納ディレクトリとログファイルが存在しない場合には生成処理を行う。
-
-        :param str path_to_log: ログファイルへのパス。
-        '''
-
-        if not os.path.exists(self.PATH_DIR_LOG):
-            # ディレクトリの作成
-            os.mkdir(self.PATH_DIR_LOG)
-            # logファイルの作成
-            with open(path_to_log, 'w'):
-                pass
-        else:
-            if not os.path.exists(path_to_log):
-                # logファイルの作成
-                with open(path_to_log, 'w'):
-                    pass
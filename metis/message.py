@@ -17,18 +17,16 @@ class ShowMessages:
     '''メッセージの出力を行うクラス。'''
 
     def __init__(self):
-        '''コンストラクタ。'''
+        '''コンストラクタ。
+        ダイアログの親ウィンドウは初めてダイアログを出力する際に生成するため、
+        エコーメッセージのみを使用する場合は画面を持たない環境でも動作する。
+        '''
 
         # メッセージ情報の取得
         self.message = read_message_file()
 
-        # メッセージダイアログの設定
-        self.root = tkinter.Tk()
-        self.root.withdraw()
-        self.root.iconbitmap('../common/icon/python_icon.ico')
-
-        # 高DPIに対応させる
-        make_tk_dpi_aware(self.root)
+        # メッセージダイアログの親ウィンドウ
+        self.root = None
 
         # キー : タイトル
         self.KEY_TITLE = 'title'
@@ -48,6 +46,8 @@ class ShowMessages:
         :param tuple option_words: メッセージ中にバインドする単語を含むタプル。
         '''
 
+        self.__create_root()
+
         if option_words:
             messagebox.showinfo(self.message[self.KEY_TITLE][self.KEY_INFO][id], self.message[self.KEY_MESSAGE ][self.KEY_INFO][id].format(option_words))
         else:
@@ -59,6 +59,8 @@ class ShowMessages:
         :param str id: タイトル / メッセージ管理番号。
         '''
 
+        self.__create_root()
+
         messagebox.showerror(self.message[self.KEY_TITLE][self.KEY_ERROR][id], self.message[self.KEY_MESSAGE ][self.KEY_ERROR][id])
 
     def askyesno(self, id: str):
@@ -69,6 +71,8 @@ class ShowMessages:
         :return: True / False
         '''
 
+        self.__create_root()
+
         return messagebox.askyesno(self.message[self.KEY_TITLE][self.KEY_INFO][id], self.message[self.KEY_MESSAGE ][self.KEY_INFO][id])
 
     def get_echo(self, id: str, *option_words: tuple):
@@ -87,3 +91,19 @@ class ShowMessages:
             echo_msg = self.message[self.KEY_ECHO][id]
 
         return echo_msg
+
+    def __create_root(self):
+        '''メッセージダイアログの親ウィンドウを生成するメソッド。
+        生成済みの場合は何もしない。
+        '''
+
+        if self.root is not None:
+            return
+
+        # メッセージダイアログの設定
+        self.root = tkinter.Tk()
+        self.root.withdraw()
+        self.root.iconbitmap('../common/icon/python_icon.ico')
+
+        # 高DPIに対応させる
+        make_tk_dpi_aware(self.root)
@@ -39,6 +39,7 @@ from common import *
 from message import ShowMessages
 from sql import MstParameterDao
 from sql import ArticleInfoHatenaDao
+from sql import ArticleInfoHatenaFtsDao
 from sql import ManageSerialDao
 from tkutils import SearchForm, CustomText
 from dpi_awareness import *
@@ -78,6 +79,8 @@ class MetisBase(TkWinBase):
         self.manage_serial_dao = ManageSerialDao()
         # ARTICLE_INFO_HATENA.TBLのDAOクラス
         self.article_info_hatena_dao = ArticleInfoHatenaDao()
+        # ARTICLE_INFO_HATENA_FTS.TBLのDAOクラス
+        self.article_info_hatena_fts_dao = ArticleInfoHatenaFtsDao()
 
 class CommandBase(MetisBase):
     '''基本コマンド処理を定義する基底クラス。'''
@@ -172,7 +175,7 @@ class CommandBase(MetisBase):
         :param tkinter.Tk master: 画面のフレーム。
         '''
 
-        self.log.normal(LogLevel.INFO.value, 'LINF0008', self.CLASS_NAME_COMMAND_BASE, self.log.location())
+        self.log.normal(LogLevel.INFO.value, 'LINF0008', self.CLASS_NAME_COMMAND_BASE)
 
         # 処理終了
         master.destroy()
@@ -252,6 +255,15 @@ class Command(CommandBase):
         # 降順オーダ
         self.SORT_DESC = 'DESC'
 
+        # ツリービューへ1回に読み込む件数
+        self.PAGE_SIZE = self.config['gui']['page_size']
+        # 最後に読み込んだ行のキー
+        self.last_loaded_key = None
+        # 読み込み済みの件数
+        self.count_loaded = 0
+        # 次のページの読み込み予約
+        self.page_loading_job = None
+
         # ログファイルを格納したファイルへのパス
         self.PATH_DIR_LOG = self.config['path']['dir_log']
         # クローラモジュールを格納したファイルへのパス
@@ -277,6 +289,8 @@ class Command(CommandBase):
         :param tkinter.ttk.Treeview treeview: 情報取得元ツリービュー。
         '''
 
+        # 読み込み中のページを破棄する
+        self.cancel_page_loading()
         # ツリービューの初期化
         treeview.delete(*treeview.get_children())
         # ソート状態を初期化
@@ -284,6 +298,13 @@ class Command(CommandBase):
         # ソート用検索ワードを初期化
         self.search_word_for_sort = None
 
+    def cancel_page_loading(self):
+        '''予約済みの次のページの読み込みを取り消すメソッド。'''
+
+        if self.page_loading_job:
+            self.master.after_cancel(self.page_loading_job)
+            self.page_loading_job = None
+
     def copy_url(self, treeview):
         '''URLをクリップボードに追加する処理を定義。
 
@@ -418,11 +439,11 @@ class Command(CommandBase):
             conn.commit()
 
         except sqlite3.Error as e:
-            self.log.normal(LogLevel.ERROR.value, 'LERR0001', self.CLASS_NAME_COMMAND, self.log.location())
+            self.log.normal(LogLevel.ERROR.value, 'LERR0001', self.CLASS_NAME_COMMAND)
             self.log.error(e)
         finally:
             conn.close()
-            self.log.normal(LogLevel.INFO.value, 'LINF0005', self.CLASS_NAME_COMMAND, self.log.location())
+            self.log.normal(LogLevel.INFO.value, 'LINF0005', self.CLASS_NAME_COMMAND)
 
         if self.message.askyesno('MINF0001'):
             cmd = 'python {} {} {}'
@@ -506,11 +527,13 @@ class Application(Command):
         self.ORDER_CRAWLING = '0'
         # 処理オーダ : ブックマーク更新
         self.ORDER_UPDATE_BOOKMARKS = '1'
+        # 処理オーダ : 期限切れ記事の削除
+        self.ORDER_PURGE_EXPIRED_ARTICLES = '2'
 
     def execute_application(self):
         '''アプリケーションを実行するメソッド。'''
 
-        self.log.normal(LogLevel.INFO.value, 'LINF0001', self.CLASS_NAME, self.log.location())
+        self.log.normal(LogLevel.INFO.value, 'LINF0001', self.CLASS_NAME)
 
         # セットアップ開始時間
         start = time.time()
@@ -573,6 +596,7 @@ class Application(Command):
         crawler_menu = Menu(menubar, tearoff=0)
         crawler_menu.add_command(label='Start Crawling', command=partial(self.execute_crawler, self.ORDER_CRAWLING))
         crawler_menu.add_command(label='Update Bookmarks', command=partial(self.execute_crawler, self.ORDER_UPDATE_BOOKMARKS))
+        crawler_menu.add_command(label='Purge Expired Articles', command=partial(self.execute_crawler, self.ORDER_PURGE_EXPIRED_ARTICLES))
         crawler_menu.add_separator()
         crawler_menu.add_command(label='Settings', command=self.__create_params_window)
         menubar.add_cascade(label='Crawler', menu=crawler_menu)
@@ -621,7 +645,7 @@ class Application(Command):
         '''
 
         # 検索フォームのフレーム
-        frame_search_terms = LabelFrame(parent, labelanchor=N, relief=FLAT, text='Enter search terms')
+        frame_search_terms = LabelFrame(parent, labelanchor=N, relief=FLAT, text='Enter search terms (tag:<name> matches a tag exactly)')
         frame_search_terms.pack(pady=20)
 
         # 入力フォームの設定
@@ -726,71 +750,37 @@ class Application(Command):
 
         # 検索時とヘッダーのbookmarks押下によるソート時で処理が異なる
         if search_word or (self.search_word_for_sort and is_sort):
-            # ツリービューの初期化
+            # 読み込み中のページを破棄し、ツリービューを初期化
+            self.cancel_page_loading()
             self.treeview.delete(*self.treeview.get_children())
+            self.last_loaded_key = None
+            self.count_loaded = 0
 
-            try:
-                # データベースへ接続
-                conn, cursor = connect_to_database()
-                # 記事情報
-                article_infos = None
-
-                if is_sort:
-                    # ソートする場合
-                    if self.current_sort_state == self.SORT_ASC or not self.current_sort_state:
-                        # 降順にソートしたレコードを取得
-                        article_infos = self.article_info_hatena_dao.select_order_by_bookmarks_desc(cursor, '%{}%'.format(self.search_word_for_sort))
-                        self.current_sort_state = self.SORT_DESC
-                    else:
-                        # 昇順にソートしたレコードを取得
-                        article_infos = self.article_info_hatena_dao.select_order_by_bookmarks_asc(cursor, '%{}%'.format(self.search_word_for_sort))
-                        self.current_sort_state = self.SORT_ASC
-                else:
-                    # ソートしない場合
-                    article_infos = self.article_info_hatena_dao.select_by_search_word(cursor, '%{}%'.format(search_word))
-                    # ソート状態を初期化
-                    self.current_sort_state = None
-                    # ソート用検索ワードを更新
-                    self.search_word_for_sort = search_word
-
-                if article_infos:
-                    # TreeViewに記事情報を反映させる
-                    for i, infos in enumerate(article_infos):
-                        value = (str(i+1), infos[1], infos[3], infos[0])
-                        self.treeview.insert('', END, tags=i, values=value)
-
-                        if i & 1:
-                            # 偶数行の背景色を変更
-                            self.treeview.tag_configure(i, background='#CCFFFF')
-
-                    self.treeview.pack(fill=BOTH, expand=True)
-
-                    # 取得数
-                    count_records = len(article_infos)
-                    # 処理完了時間
-                    elapsed_time = time.time() - start
-                    # ステータスバーに反映する文言を更新
-                    status_msg = 'Sort elapsed time : {} [sec] | {} {}' if is_sort else 'Search elapsed time : {} [sec] | {} {}'
-
-                    # ソート時の処理時間をステータスバーに反映
-                    self.status['text'] = status_msg.format(elapsed_time, count_records, 'records' if count_records > 1 else 'record')
+            if is_sort:
+                # ソートする場合は降順と昇順を切り替える
+                if self.current_sort_state == self.SORT_ASC or not self.current_sort_state:
+                    self.current_sort_state = self.SORT_DESC
                 else:
-                    # ソート用検索ワードを初期化
-                    self.search_word_for_sort = None
-
-                    # 処理完了時間
-                    elapsed_time = time.time() - start
-                    # ステータスバーに反映
-                    self.status['text'] = status_msg.format(elapsed_time)
+                    self.current_sort_state = self.SORT_ASC
+            else:
+                # ソート状態を初期化
+                self.current_sort_state = None
+                # ソート用検索ワードを更新
+                self.search_word_for_sort = search_word
+
+            # 最初のページを読み込み、残りのページは画面を操作可能なまま順に読み込む
+            if self.__load_next_page(start, is_sort):
+                self.treeview.pack(fill=BOTH, expand=True)
+            else:
+                # ソート用検索ワードを初期化
+                self.search_word_for_sort = None
 
-                    self.message.showinfo('MINF0002', search_word)
+                # 処理完了時間
+                elapsed_time = time.time() - start
+                # ステータスバーに反映
+                self.status['text'] = status_msg.format(elapsed_time)
 
-            except sqlite3.Error as e:
-                self.log.normal(LogLevel.ERROR.value, 'LERR0001', self.CLASS_NAME, self.log.location())
-                self.log.error(e)
-            finally:
-                conn.close()
-                self.log.normal(LogLevel.INFO.value, 'LINF0005', self.CLASS_NAME, self.log.location())
+                self.message.showinfo('MINF0002', search_word)
         else:
             # 処理完了時間
             elapsed_time = time.time() - start
@@ -804,6 +794,70 @@ class Application(Command):
                 # 検索時
                 self.message.showerror('MERR0008')
 
+    def __load_next_page(self, start: float, is_sort: bool) -> int:
+        '''記事情報を1ページ分取得してツリービューへ追加するメソッド。
+        検索ワードはタイトルおよびタグの全文検索インデックスを用いて検索する。
+        ソート時は前回読み込んだ最終行のキーから続きを取得するため、ページ数によらず取得にかかる時間と使用メモリは一定となる。
+        ページの件数が上限に達している場合は次のページの読み込みを予約する。
+
+        :param float start: 処理開始時間。
+        :param bool is_sort: ソート可否フラグ (True/ False)。
+        :rtype: int
+        :return: 取得した件数。
+        '''
+
+        self.page_loading_job = None
+        # 記事情報
+        article_infos = []
+
+        try:
+            # データベースへ接続
+            conn, cursor = connect_to_database()
+
+            if self.current_sort_state:
+                # ブックマーク数順にソートしたレコードを前回の最終行の続きから取得
+                article_infos = self.article_info_hatena_fts_dao.search_order_by_bookmarks_after(cursor, self.search_word_for_sort, self.last_loaded_key, self.PAGE_SIZE, self.current_sort_state == self.SORT_DESC)
+            else:
+                # ソートしない場合は関連度順のレコードを読み込み済みの件数の続きから取得
+                article_infos = self.article_info_hatena_fts_dao.search(cursor, self.search_word_for_sort, self.PAGE_SIZE, offset=self.count_loaded)
+
+        except sqlite3.Error as e:
+            self.log.normal(LogLevel.ERROR.value, 'LERR0001', self.CLASS_NAME)
+            self.log.error(e)
+        finally:
+            conn.close()
+            self.log.normal(LogLevel.INFO.value, 'LINF0005', self.CLASS_NAME)
+
+        if not article_infos:
+            return 0
+
+        # TreeViewに記事情報を反映させる
+        for i, infos in enumerate(article_infos, self.count_loaded):
+            value = (str(i+1), infos[1], infos[3], infos[0])
+            self.treeview.insert('', END, tags=i, values=value)
+
+            if i & 1:
+                # 偶数行の背景色を変更
+                self.treeview.tag_configure(i, background='#CCFFFF')
+
+        # 次のページの開始位置を保持
+        last_infos = article_infos[-1]
+        self.last_loaded_key = (last_infos[3], last_infos[0])
+        self.count_loaded += len(article_infos)
+
+        # 処理完了時間
+        elapsed_time = time.time() - start
+        # ステータスバーに反映する文言を更新
+        status_msg = 'Sort elapsed time : {} [sec] | {} {}' if is_sort else 'Search elapsed time : {} [sec] | {} {}'
+        # 処理時間と読み込み済みの件数をステータスバーに反映
+        self.status['text'] = status_msg.format(elapsed_time, self.count_loaded, 'records' if self.count_loaded > 1 else 'record')
+
+        if len(article_infos) == self.PAGE_SIZE:
+            # 続きのページがある場合は画面の描画後に読み込む
+            self.page_loading_job = self.master.after(1, self.__load_next_page, start, is_sort)
+
+        return len(article_infos)
+
     def __create_log_gui(self, parent: Frame):
         '''Log検索画面の出力を定義するメソッド。
 
@@ -930,11 +984,11 @@ class Application(Command):
             # ツリービューのリフレッシュ処理
             self.__refresh_param_tree_view(conn, cursor)
         except sqlite3.Error as e:
-            self.log.normal(LogLevel.ERROR.value, 'LERR0001', self.CLASS_NAME, self.log.location())
+            self.log.normal(LogLevel.ERROR.value, 'LERR0001', self.CLASS_NAME)
             self.log.error(e)
         finally:
             conn.close()
-            self.log.normal(LogLevel.INFO.value, 'LINF0005', self.CLASS_NAME, self.log.location())
+            self.log.normal(LogLevel.INFO.value, 'LINF0005', self.CLASS_NAME)
 
         # ウィンドウの設定
         self.set_window_basic_config(master=params_window, title='Config', expand=False, width=600, height=300)
@@ -1009,11 +1063,11 @@ class Application(Command):
                 # ツリービューのリフレッシュ処理
                 self.__refresh_param_tree_view(conn, cursor)
             except sqlite3.Error as e:
-                self.log.normal(LogLevel.ERROR.value, 'LERR0001', self.CLASS_NAME, self.log.location())
+                self.log.normal(LogLevel.ERROR.value, 'LERR0001', self.CLASS_NAME)
                 self.log.error(e)
             finally:
                 conn.close()
-                self.log.normal(LogLevel.INFO.value, 'LINF0005', self.CLASS_NAME, self.log.location())
+                self.log.normal(LogLevel.INFO.value, 'LINF0005', self.CLASS_NAME)
         else:
             # フォームが空の場合はエラーメッセージを出力する
             self.message.showerror('MERR0008')
@@ -1060,11 +1114,11 @@ class Application(Command):
                         # 削除対象は一つのみのため、繰り返し処理を終了させる
                         break
             except sqlite3.Error as e:
-                self.log.normal(LogLevel.ERROR.value, 'LERR0001', self.CLASS_NAME, self.log.location())
+                self.log.normal(LogLevel.ERROR.value, 'LERR0001', self.CLASS_NAME)
                 self.log.error(e)
             finally:
                 conn.close()
-                self.log.normal(LogLevel.INFO.value, 'LINF0005', self.CLASS_NAME, self.log.location())
+                self.log.normal(LogLevel.INFO.value, 'LINF0005', self.CLASS_NAME)
         else:
             # フォームが空の場合はエラーメッセージを出力する
             self.message.showerror('MERR0008')
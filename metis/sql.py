@@ -22,10 +22,14 @@ SQLite has bindings to many programming languages.
 '''
 
 import sqlite3
+import shlex
+import sys
+from telemetry import timed_dao
 
 __author__ = 'Kato Shinya'
 __date__ = '2018/04/21'
 
+@timed_dao
 class MstParameterDao:
     '''MST_PARAMETER.TBLへのトランザクション処理を定義するDAOクラス。'''
 
@@ -67,6 +71,39 @@ class MstParameterDao:
                             PARAM_NAME = ?
                         ''', (update_value, primary_key,))
 
+    def upsert_params_by_primary_key(self, cursor: sqlite3.Cursor, value: str, primary_key: str):
+        '''主キーを用いてMST_PARAMETER.TBLへ値を登録するクエリ。
+        既に登録されている場合は値を更新する。
+
+        :param sqlite3.Cursor cursor: カーソル。
+        :param str value: 登録値。
+        :param str primary_key: プライマリーキー。
+        '''
+
+        cursor.execute('''
+                        INSERT OR REPLACE INTO
+                            MST_PARAMETER
+                        VALUES (
+                            ?,
+                            ?
+                        )
+                        ''', (primary_key, value,))
+
+    def delete_params_by_primary_key(self, cursor: sqlite3.Cursor, primary_key: str):
+        '''主キーを用いてMST_PARAMETER.TBLからレコードを削除するクエリ。
+
+        :param sqlite3.Cursor cursor: カーソル。
+        :param str primary_key: プライマリーキー。
+        '''
+
+        cursor.execute('''
+                        DELETE FROM
+                            MST_PARAMETER
+                        WHERE
+                            PARAM_NAME = ?
+                        ''', (primary_key,))
+
+@timed_dao
 class ManageSerialDao:
     '''MANAGE_SERIAL.TBLへのトランザクション処理を定義するDAOクラス。'''
 
@@ -135,6 +172,7 @@ class ManageSerialDao:
                             MANAGE_SERIAL
                         ''')
 
+@timed_dao
 class ArticleInfoHatenaDao:
     '''ARTICLE_INFO_HATENA.TBLへのトランザクション処理を定義するDAOクラス。'''
 
@@ -196,13 +234,42 @@ class ArticleInfoHatenaDao:
 
         return cursor.fetchone()
 
-    def select_all_url(self, cursor: sqlite3.Cursor) -> tuple:
-        '''ARTICLE_INFO_HATENA.TBLから全URLを取得するクエリ。
+    def select_urls_by_primary_keys(self, cursor: sqlite3.Cursor, urls: list) -> list:
+        '''主キーの一覧を用いてARTICLE_INFO_HATENA.TBLに登録済みのURLを取得するクエリ。
+        バインド変数の上限を超えないよう500件毎に分割して検索する。
+
+        :param sqlite3.Cursor cursor: カーソル。
+        :param list urls: 検索対象URLのリスト。
+        :rtype: list
+        :return: 登録済みのURL。
+        '''
+
+        registered_urls = []
+
+        for i in range(0, len(urls), 500):
+            chunk = urls[i:i+500]
+            cursor.execute('''
+                            SELECT
+                                URL
+                            FROM
+                                ARTICLE_INFO_HATENA
+                            WHERE
+                                URL IN ({})
+                            '''.format(','.join('?' * len(chunk))), chunk)
+
+            registered_urls.extend(cursor.fetchall())
+
+        return registered_urls
+
+    def select_url_after(self, cursor: sqlite3.Cursor, after_url: str, limit: int) -> tuple:
+        '''ARTICLE_INFO_HATENA.TBLから指定URLより後ろのURLをURL順に指定件数だけ取得するクエリ。
         返り値はtuple型。
 
         :param sqlite3.Cursor cursor: カーソル。
+        :param str after_url: 取得開始位置となるURL。このURL自体は含まない。
+        :param int limit: 取得件数。
         :rtype: tuple
-        :return: 登録されている全URL。
+        :return: URL順に並べられたURL。
         '''
 
         cursor.execute('''
@@ -210,10 +277,97 @@ class ArticleInfoHatenaDao:
                             URL
                         FROM
                             ARTICLE_INFO_HATENA
-                        ''')
+                        WHERE
+                            URL > ?
+                        ORDER BY
+                            URL
+                        LIMIT
+                            ?
+                        ''', (after_url, limit,))
+
+        return cursor.fetchall()
+
+    def count_records_after_url(self, cursor: sqlite3.Cursor, after_url: str) -> tuple:
+        '''ARTICLE_INFO_HATENA.TBLから指定URLより後ろのレコード数を取得するクエリ。
+
+        :param sqlite3.Cursor cursor: カーソル。
+        :param str after_url: 基準となるURL。このURL自体は含まない。
+        :rtype: tuple
+        :return: 取得件数。
+        '''
+
+        cursor.execute('''
+                        SELECT
+                            COUNT(1)
+                        FROM
+                            ARTICLE_INFO_HATENA
+                        WHERE
+                            URL > ?
+                        ''', (after_url,))
+
+        return cursor.fetchone()
+
+    def select_url_by_refresh_priority(self, cursor: sqlite3.Cursor, min_age_hours: int, limit: int) -> list:
+        '''ARTICLE_INFO_HATENA.TBLからブックマーク数の更新優先度が高い順にURLを取得するクエリ。
+        最終更新日時から指定時間が経過していないレコードと削除予定日を過ぎたレコードは対象外とする。
+        優先度は以下の積で算出する。
+
+        * 最終更新日時からの経過日数
+        * 登録日時から最終更新日時までの1日あたりのブックマーク数の増加量
+        * 削除予定日までの残り日数(7日以上は一律)
+
+        取得件数は指定件数までに限られるため、更新中に並び順が変わらないよう全件をまとめて取得する。
+
+        :param sqlite3.Cursor cursor: カーソル。
+        :param int min_age_hours: 更新対象とする最終更新日時からの経過時間。
+        :param int limit: 取得件数。
+        :rtype: list
+        :return: 更新優先度順に並べられたURL。
+        '''
+
+        cursor.execute('''
+                        SELECT
+                            URL
+                        FROM
+                            ARTICLE_INFO_HATENA
+                        WHERE
+                            UPDATED_DATE <= datetime('now', 'localtime', ?)
+                        AND
+                            RESERVED_DEL_DATE >= CAST(strftime('%Y%m%d', 'now', 'localtime') AS INTEGER)
+                        ORDER BY
+                            (julianday('now', 'localtime') - julianday(UPDATED_DATE))
+                            * (1.0 + CAST(BOOKMARKS AS REAL) / (julianday(UPDATED_DATE) - julianday(REGISTER_DATE) + 1.0))
+                            * MIN(7.0, julianday(substr(RESERVED_DEL_DATE, 1, 4) || '-' || substr(RESERVED_DEL_DATE, 5, 2) || '-' || substr(RESERVED_DEL_DATE, 7, 2)) - julianday('now', 'localtime') + 1.0)
+                            DESC
+                        LIMIT
+                            ?
+                        ''', ('-{} hours'.format(min_age_hours), limit,))
 
         return cursor.fetchall()
 
+    def count_records_by_refresh_priority(self, cursor: sqlite3.Cursor, min_age_hours: int) -> tuple:
+        '''ARTICLE_INFO_HATENA.TBLからブックマーク数の更新対象となるレコード数を取得するクエリ。
+        対象の条件はselect_url_by_refresh_priorityと同一。
+
+        :param sqlite3.Cursor cursor: カーソル。
+        :param int min_age_hours: 更新対象とする最終更新日時からの経過時間。
+        :rtype: tuple
+        :return: 取得件数。
+        '''
+
+        cursor.execute('''
+                        SELECT
+                            COUNT(1)
+                        FROM
+                            ARTICLE_INFO_HATENA
+                        WHERE
+                            UPDATED_DATE <= datetime('now', 'localtime', ?)
+                        AND
+                            RESERVED_DEL_DATE >= CAST(strftime('%Y%m%d', 'now', 'localtime') AS INTEGER)
+                        ''', ('-{} hours'.format(min_age_hours),))
+
+        return cursor.fetchone()
+
     def select_order_by_bookmarks_desc(self, cursor: sqlite3.Cursor, search_word: str) -> tuple:
         '''ARTICLE_INFO_HATENA.TBLからブックマーク数を基準に降順でソートされたレコードを取得するクエリ。
         返り値はtuple型。
@@ -278,12 +432,81 @@ class ArticleInfoHatenaDao:
 
         return cursor.fetchall()
 
-    def update_bookmarks_by_primary_key(self, cursor: sqlite3.Cursor, bookmarks: str, primary_key: str):
-        '''主キーを用いてARTICLE_INFO_HATENA.TBLのブックマーク数を更新するクエリ。
+    def select_expired(self, cursor: sqlite3.Cursor, today: int, limit: int) -> tuple:
+        '''ARTICLE_INFO_HATENA.TBLから削除予定日を過ぎた記事情報を削除予定日の古い順に指定件数だけ取得するクエリ。
+        INDEX_ARTICLE_INFO_HATENA_RESERVED_DEL_DATEを走査して取得する。
         返り値はtuple型。
 
         :param sqlite3.Cursor cursor: カーソル。
-        :param str bookmarks: ブックマーク数。
+        :param int today: 基準日(YYYYMMDD)。削除予定日が基準日より前の記事情報を対象とする。
+        :param int limit: 取得件数。
+        :rtype: tuple
+        :return: 削除予定日を過ぎた記事情報。
+        '''
+
+        cursor.execute('''
+                        SELECT
+                            URL,
+                            TITLE,
+                            PUBLISHED_DATE,
+                            BOOKMARKS,
+                            TAG,
+                            REGISTER_DATE,
+                            UPDATED_DATE,
+                            RESERVED_DEL_DATE
+                        FROM
+                            ARTICLE_INFO_HATENA
+                        WHERE
+                            RESERVED_DEL_DATE < ?
+                        ORDER BY
+                            RESERVED_DEL_DATE
+                        LIMIT
+                            ?
+                        ''', (today, limit,))
+
+        return cursor.fetchall()
+
+    def count_expired(self, cursor: sqlite3.Cursor, today: int) -> tuple:
+        '''ARTICLE_INFO_HATENA.TBLから削除予定日を過ぎたレコード数を取得するクエリ。
+
+        :param sqlite3.Cursor cursor: カーソル。
+        :param int today: 基準日(YYYYMMDD)。
+        :rtype: tuple
+        :return: 取得件数。
+        '''
+
+        cursor.execute('''
+                        SELECT
+                            COUNT(1)
+                        FROM
+                            ARTICLE_INFO_HATENA
+                        WHERE
+                            RESERVED_DEL_DATE < ?
+                        ''', (today,))
+
+        return cursor.fetchone()
+
+    def delete_by_primary_keys(self, cursor: sqlite3.Cursor, urls: list):
+        '''主キーを用いてARTICLE_INFO_HATENA.TBLから記事情報を一括で削除するクエリ。
+        全文検索インデックスおよびタグテーブルはトリガにより同期される。
+
+        :param sqlite3.Cursor cursor: カーソル。
+        :param list urls: 削除対象URLのリスト。
+        '''
+
+        cursor.executemany('''
+                            DELETE FROM
+                                ARTICLE_INFO_HATENA
+                            WHERE
+                                URL = ?
+                            ''', [(url,) for url in urls])
+
+    def update_bookmarks_by_primary_key(self, cursor: sqlite3.Cursor, bookmarks: int, primary_key: str):
+        '''主キーを用いてARTICLE_INFO_HATENA.TBLのブックマーク数を更新するクエリ。
+        最終更新日時も併せて更新する。
+
+        :param sqlite3.Cursor cursor: カーソル。
+        :param int bookmarks: ブックマーク数。
         :param str primary_key: 主キー。
         '''
 
@@ -291,11 +514,29 @@ class ArticleInfoHatenaDao:
                         UPDATE
                             ARTICLE_INFO_HATENA
                         SET
-                            BOOKMARKS = ?
+                            BOOKMARKS = ?,
+                            UPDATED_DATE = datetime('now', 'localtime')
                         WHERE
                             URL = ?
                         ''',(bookmarks, primary_key,))
 
+    def update_bookmarks_by_primary_keys(self, cursor: sqlite3.Cursor, bookmarks_and_keys: list):
+        '''主キーを用いてARTICLE_INFO_HATENA.TBLのブックマーク数を一括で更新するクエリ。
+        最終更新日時も併せて更新する。
+
+        :param sqlite3.Cursor cursor: カーソル。
+        :param list bookmarks_and_keys: (ブックマーク数, 主キー)のタプルを格納したリスト。
+        '''
+
+        cursor.executemany('''
+                        UPDATE
+                            ARTICLE_INFO_HATENA
+                        SET
+                            BOOKMARKS = ?,
+                            UPDATED_DATE = datetime('now', 'localtime')
+                        WHERE
+                            URL = ?
+                        ''', bookmarks_and_keys)
 
     def insert_article_infos(self, cursor: sqlite3.Cursor, article_infos: dict):
         '''取得した記事情報をARTICLE_INFO_HATENA.TBLへ挿入するクエリ。
@@ -321,11 +562,12 @@ class ArticleInfoHatenaDao:
 
     def transfer_article_info_from_work(self, cursor: sqlite3.Cursor):
         '''WORK_ARTICLE_INFO_HATENA.TBLからARTICLE_INFO_HATENA.TBLへ記事情報を移行させるクエリ。
+        登録済みのURLはブックマーク数、タグおよび最終更新日時のみを更新する。
 
         :param sqlite3.Cursor cursor: カーソル。
-        :param dict article_infos: カラムと挿入する記事情報の対応辞書。
         '''
 
+        # ON CONFLICT句との構文の曖昧さを避けるためWHERE句を付与する
         cursor.execute('''
                         INSERT INTO
                             ARTICLE_INFO_HATENA
@@ -340,55 +582,1080 @@ class ArticleInfoHatenaDao:
                             RESERVED_DEL_DATE
                         FROM
                             WORK_ARTICLE_INFO_HATENA
+                        WHERE
+                            true
+                        ON CONFLICT (URL) DO UPDATE SET
+                            BOOKMARKS = excluded.BOOKMARKS,
+                            TAG = excluded.TAG,
+                            UPDATED_DATE = excluded.UPDATED_DATE
                         ''')
 
-class WorkArticleInfoHatenaDao:
-    '''WORK_ARTICLE_INFO_HATENA.TBLへのトランザクション処理を定義するDAOクラス。'''
+@timed_dao
+class ArticleInfoHatenaFtsDao:
+    '''ARTICLE_INFO_HATENA_FTS.TBL(ARTICLE_INFO_HATENA.TBLの全文検索インデックス)へのトランザクション処理を定義するDAOクラス。
+    インデックスはARTICLE_INFO_HATENA.TBLを外部コンテンツとするFTS5仮想テーブルであり、
+    ARTICLE_INFO_HATENA.TBLへの登録、TITLE/TAGの更新および削除時にトリガで同期される。
+    '''
 
-    def count_records(self, cursor: sqlite3.Cursor):
-        '''WORK_ARTICLE_INFO_HATENA.TBLのレコード数を取得するクエリ。
+    def create_table(self, cursor: sqlite3.Cursor) -> bool:
+        '''ARTICLE_INFO_HATENA_FTS.TBLと同期用トリガを作成するクエリ。
+        新規に作成した場合は登録済みの記事情報からインデックスを構築する。
 
         :param sqlite3.Cursor cursor: カーソル。
+        :rtype: bool
+        :return: 新規に作成した場合はTrue。
         '''
 
         cursor.execute('''
                         SELECT
                             COUNT(1)
                         FROM
-                            WORK_ARTICLE_INFO_HATENA
+                            sqlite_master
+                        WHERE
+                            name = 'ARTICLE_INFO_HATENA_FTS'
                         ''')
 
-        return cursor.fetchone()
+        if cursor.fetchone()[0]:
+            return False
 
-    def insert_article_infos(self, cursor: sqlite3.Cursor, article_infos: dict):
-        '''取得した記事情報をWORK_ARTICLE_INFO_HATENA.TBLへ挿入するクエリ。
+        cursor.execute('''
+                        CREATE VIRTUAL TABLE ARTICLE_INFO_HATENA_FTS USING fts5 (
+                            TITLE,
+                            TAG,
+                            content = 'ARTICLE_INFO_HATENA',
+                            content_rowid = 'rowid',
+                            tokenize = 'trigram'
+                        )
+                        ''')
+
+        cursor.execute('''
+                        CREATE TRIGGER IF NOT EXISTS ARTICLE_INFO_HATENA_FTS_AI AFTER INSERT ON ARTICLE_INFO_HATENA
+                        BEGIN
+                            INSERT INTO
+                                ARTICLE_INFO_HATENA_FTS (rowid, TITLE, TAG)
+                            VALUES (
+                                new.rowid,
+                                new.TITLE,
+                                new.TAG
+                            );
+                        END
+                        ''')
+
+        cursor.execute('''
+                        CREATE TRIGGER IF NOT EXISTS ARTICLE_INFO_HATENA_FTS_AD AFTER DELETE ON ARTICLE_INFO_HATENA
+                        BEGIN
+                            INSERT INTO
+                                ARTICLE_INFO_HATENA_FTS (ARTICLE_INFO_HATENA_FTS, rowid, TITLE, TAG)
+                            VALUES (
+                                'delete',
+                                old.rowid,
+                                old.TITLE,
+                                old.TAG
+                            );
+                        END
+                        ''')
+
+        self.create_update_trigger(cursor)
+
+        self.rebuild(cursor)
+
+        return True
+
+    def create_update_trigger(self, cursor: sqlite3.Cursor):
+        '''ARTICLE_INFO_HATENA.TBLの更新時にインデックスを同期するトリガを作成するクエリ。
+        ブックマーク数のみの更新や、TITLE/TAGに変更がない更新ではインデックスを更新しない。
+
+        :param sqlite3.Cursor cursor: カーソル。
+        '''
+
+        cursor.execute('''
+                        CREATE TRIGGER IF NOT EXISTS ARTICLE_INFO_HATENA_FTS_AU AFTER UPDATE OF TITLE, TAG ON ARTICLE_INFO_HATENA
+                        WHEN
+                            old.TITLE IS NOT new.TITLE
+                        OR
+                            old.TAG IS NOT new.TAG
+                        BEGIN
+                            INSERT INTO
+                                ARTICLE_INFO_HATENA_FTS (ARTICLE_INFO_HATENA_FTS, rowid, TITLE, TAG)
+                            VALUES (
+                                'delete',
+                                old.rowid,
+                                old.TITLE,
+                                old.TAG
+                            );
+                            INSERT INTO
+                                ARTICLE_INFO_HATENA_FTS (rowid, TITLE, TAG)
+                            VALUES (
+                                new.rowid,
+                                new.TITLE,
+                                new.TAG
+                            );
+                        END
+                        ''')
+
+    def rebuild(self, cursor: sqlite3.Cursor):
+        '''ARTICLE_INFO_HATENA.TBLの内容からインデックスを再構築するクエリ。
+        VACUUMによりARTICLE_INFO_HATENA.TBLのrowidが振り直された場合にも使用する。
 
         :param sqlite3.Cursor cursor: カーソル。
-        :param dict article_infos: カラムと挿入する記事情報の対応辞書。
         '''
 
         cursor.execute('''
                         INSERT INTO
-                            WORK_ARTICLE_INFO_HATENA
+                            ARTICLE_INFO_HATENA_FTS (ARTICLE_INFO_HATENA_FTS)
                         VALUES (
-                            :URL,
-                            :TITLE,
-                            :PUBLISHED_DATE,
-                            :BOOKMARKS,
-                            :TAG,
-                            datetime('now', 'localtime'),
-                            datetime('now', 'localtime'),
-                            :RESERVED_DEL_DATE
+                            'rebuild'
                         )
-                        ''',(article_infos))
+                        ''')
 
-    def delete_records(self, cursor: sqlite3.Cursor):
-        '''WORK_ARTICLE_INFO_HATENA.TBLから全レコードを削除するクエリ。
+    def search(self, cursor: sqlite3.Cursor, search_word: str, limit: int, offset=0, bookmark_weight=1.0) -> tuple:
+        '''全文検索インデックスを用いてARTICLE_INFO_HATENA.TBLから記事情報を取得するクエリ。
+        検索ワードは空白区切りの全単語をタイトルまたはタグに含む記事を部分一致で検索する。
+        ダブルクォートで囲んだ単語は空白を含めて1単語として扱う。
+        'tag:'で始まる単語はARTICLE_TAG.TBLを用いてタグの完全一致で絞り込む。
+        BM25によるスコアをブックマーク数で補正した順に並べ、指定範囲のみを返す。
+        3文字未満の単語はトライグラムで検索できないためLIKEで絞り込み、
+        全単語が3文字未満の場合はブックマーク数の降順に並べる。
+        返り値はtuple型。
+
+        :param sqlite3.Cursor cursor: カーソル。
+        :param str search_word: 検索ワード。
+        :param int limit: 取得件数。
+        :param int offset: 取得開始位置。初期値は0。
+        :param float bookmark_weight: ブックマーク数による補正の重み。0の場合は補正しない。初期値は1.0。
+        :rtype: tuple
+        :return: 検索結果。
+
+        >>> search(cursor, 'python "machine learning" データ tag:django', 50)
+        '''
+
+        match_query, filter_condition, filter_params = self.__to_conditions(search_word)
+        if not match_query and not filter_condition:
+            return []
+
+        if not match_query:
+            cursor.execute('''
+                            SELECT
+                                A.URL,
+                                A.TITLE,
+                                A.PUBLISHED_DATE,
+                                A.BOOKMARKS,
+                                A.TAG,
+                                A.REGISTER_DATE,
+                                A.UPDATED_DATE,
+                                A.RESERVED_DEL_DATE
+                            FROM
+                                ARTICLE_INFO_HATENA A
+                            WHERE
+                                true
+                                {}
+                            ORDER BY
+                                A.BOOKMARKS DESC,
+                                A.URL
+                            LIMIT
+                                ?
+                            OFFSET
+                                ?
+                            '''.format(filter_condition), filter_params + [limit, offset])
+
+            return cursor.fetchall()
+
+        cursor.execute('''
+                        SELECT
+                            A.URL,
+                            A.TITLE,
+                            A.PUBLISHED_DATE,
+                            A.BOOKMARKS,
+                            A.TAG,
+                            A.REGISTER_DATE,
+                            A.UPDATED_DATE,
+                            A.RESERVED_DEL_DATE
+                        FROM
+                            ARTICLE_INFO_HATENA_FTS F
+                        INNER JOIN
+                            ARTICLE_INFO_HATENA A
+                        ON
+                            A.rowid = F.rowid
+                        WHERE
+                            ARTICLE_INFO_HATENA_FTS MATCH ?
+                            {}
+                        ORDER BY
+                            bm25(ARTICLE_INFO_HATENA_FTS, 2.0, 1.0) * (1.0 + ? * A.BOOKMARKS / (A.BOOKMARKS + 100.0))
+                        LIMIT
+                            ?
+                        OFFSET
+                            ?
+                        '''.format(filter_condition), [match_query] + filter_params + [bookmark_weight, limit, offset])
+
+        return cursor.fetchall()
+
+    def search_order_by_bookmarks_after(self, cursor: sqlite3.Cursor, search_word: str, after_key: tuple, limit: int, descending=True) -> tuple:
+        '''全文検索インデックスを用いてARTICLE_INFO_HATENA.TBLからブックマーク数順にソートされた記事情報を指定位置の後ろから指定件数だけ取得するクエリ。
+        検索ワードの扱いはsearchと同じとする。
+        降順の場合はブックマーク数の降順、URLの昇順とし、昇順の場合はブックマーク数の昇順、URLの降順とする。
+        前回取得した最終行の(ブックマーク数, URL)を渡すことで次のページを取得する。
+        返り値はtuple型。
 
         :param sqlite3.Cursor cursor: カーソル。
+        :param str search_word: 検索ワード。
+        :param tuple after_key: 取得開始位置となる(ブックマーク数, URL)。この行自体は含まない。最初のページはNoneを指定する。
+        :param int limit: 取得件数。
+        :param bool descending: ブックマーク数の降順に並べるか否か。初期値はTrue。
+        :rtype: tuple
+        :return: ブックマーク数を基準にソートされた検索結果。
         '''
 
+        match_query, filter_condition, filter_params = self.__to_conditions(search_word)
+        if not match_query and not filter_condition:
+            return []
+
+        params = filter_params
+        if match_query:
+            filter_condition = '''
+                            AND
+                                A.rowid IN (
+                                    SELECT
+                                        rowid
+                                    FROM
+                                        ARTICLE_INFO_HATENA_FTS
+                                    WHERE
+                                        ARTICLE_INFO_HATENA_FTS MATCH ?
+                                )
+                            ''' + filter_condition
+            params = [match_query] + filter_params
+
+        if descending:
+            # 最初のページは全レコードが条件を満たす最大値から開始する
+            bookmarks, url = after_key if after_key else (sys.maxsize, '')
+            keyset_condition = '''
+                            AND
+                                A.BOOKMARKS <= ?
+                            AND (
+                                A.BOOKMARKS < ?
+                            OR
+                                A.URL > ?
+                            )
+                            ORDER BY
+                                A.BOOKMARKS DESC,
+                                A.URL
+                            '''
+        else:
+            # 最初のページは全レコードが条件を満たす最小値から開始する
+            bookmarks, url = after_key if after_key else (-sys.maxsize - 1, '')
+            keyset_condition = '''
+                            AND
+                                A.BOOKMARKS >= ?
+                            AND (
+                                A.BOOKMARKS > ?
+                            OR
+                                A.URL < ?
+                            )
+                            ORDER BY
+                                A.BOOKMARKS ASC,
+                                A.URL DESC
+                            '''
+
         cursor.execute('''
-                        DELETE FROM
-                            WORK_ARTICLE_INFO_HATENA
+                        SELECT
+                            A.URL,
+                            A.TITLE,
+                            A.PUBLISHED_DATE,
+                            A.BOOKMARKS,
+                            A.TAG,
+                            A.REGISTER_DATE,
+                            A.UPDATED_DATE,
+                            A.RESERVED_DEL_DATE
+                        FROM
+                            ARTICLE_INFO_HATENA A
+                        WHERE
+                            true
+                            {}
+                            {}
+                        LIMIT
+                            ?
+                        '''.format(filter_condition, keyset_condition), params + [bookmarks, bookmarks, url, limit])
+
+        return cursor.fetchall()
+
+    def count(self, cursor: sqlite3.Cursor, search_word: str) -> tuple:
+        '''全文検索インデックスを用いて検索ワードに該当する記事数を取得するクエリ。
+
+        :param sqlite3.Cursor cursor: カーソル。
+        :param str search_word: 検索ワード。
+        :rtype: tuple
+        :return: 取得件数。
+        '''
+
+        match_query, filter_condition, filter_params = self.__to_conditions(search_word)
+        if not match_query and not filter_condition:
+            return (0,)
+
+        if not match_query:
+            cursor.execute('''
+                            SELECT
+                                COUNT(1)
+                            FROM
+                                ARTICLE_INFO_HATENA A
+                            WHERE
+                                true
+                                {}
+                            '''.format(filter_condition), filter_params)
+
+            return cursor.fetchone()
+
+        cursor.execute('''
+                        SELECT
+                            COUNT(1)
+                        FROM
+                            ARTICLE_INFO_HATENA_FTS F
+                        INNER JOIN
+                            ARTICLE_INFO_HATENA A
+                        ON
+                            A.rowid = F.rowid
+                        WHERE
+                            ARTICLE_INFO_HATENA_FTS MATCH ?
+                            {}
+                        '''.format(filter_condition), [match_query] + filter_params)
+
+        return cursor.fetchone()
+
+    def __to_conditions(self, search_word: str) -> tuple:
+        '''検索ワードをFTS5のMATCH構文と絞り込み条件へ変換するメソッド。
+        'tag:'で始まる単語はARTICLE_TAG.TBLに正規化したタグを持つ記事に絞り込む条件とする。
+        3文字以上の単語はダブルクォートで囲み、FTS5の演算子として解釈されないようにしてMATCH構文へ含める。
+        3文字未満の単語はタイトルまたはタグへのLIKEによる部分一致の条件とする。
+        末尾の'*'はトライグラムによる部分一致に包含されるため除去する。
+
+        :param str search_word: 検索ワード。
+        :rtype: tuple
+        :return: (MATCH構文の文字列, 絞り込み条件, 絞り込み条件のバインド変数のリスト)のタプル。
+
+        >>> __to_conditions('python "machine learning" js* tag:Django')
+        >>> ('"python" "machine learning"', "AND (A.TITLE LIKE ? ESCAPE '\\' OR A.TAG LIKE ? ESCAPE '\\') AND A.URL IN (...)", ['%js%', '%js%', 'django'])
+        '''
+
+        try:
+            words = shlex.split(search_word)
+        except ValueError:
+            # ダブルクォートが閉じられていない場合は空白区切りとみなす
+            words = search_word.replace('"', ' ').split()
+
+        terms = []
+        filter_conditions = []
+        filter_params = []
+        for word in words:
+            word = word.rstrip('*')
+
+            if word.startswith('tag:'):
+                tag = ArticleTagDao.normalize_tag(word[len('tag:'):])
+                if tag:
+                    filter_conditions.append('''
+                            AND
+                                A.URL IN (
+                                    SELECT
+                                        URL
+                                    FROM
+                                        ARTICLE_TAG
+                                    WHERE
+                                        TAG = ?
+                                )
+                            ''')
+                    filter_params.append(tag)
+            elif len(word) >= 3:
+                terms.append('"{}"'.format(word.replace('"', '""')))
+            elif word:
+                # トライグラムに満たない単語はワイルドカードをエスケープして部分一致で検索する
+                pattern = '%{}%'.format(word.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_'))
+                filter_conditions.append("AND (A.TITLE LIKE ? ESCAPE '\\' OR A.TAG LIKE ? ESCAPE '\\')")
+                filter_params.extend([pattern, pattern])
+
+        return ' '.join(terms), ' '.join(filter_conditions), filter_params
+
+@timed_dao
+class ArticleTagDao:
+    '''ARTICLE_TAG.TBL(記事毎のタグ)へのトランザクション処理を定義するDAOクラス。
+    ARTICLE_INFO_HATENA.TAGにカンマ区切りで格納されたタグを正規化して1タグ1行で保持し、
+    タグによる完全一致検索をインデックス経由で行う。
+    '''
+
+    def create_table(self, cursor: sqlite3.Cursor) -> bool:
+        '''ARTICLE_TAG.TBLと削除同期用トリガを作成するクエリ。
+        新規に作成した場合は登録済みの記事情報のタグを移行する。
+
+        :param sqlite3.Cursor cursor: カーソル。
+        :rtype: bool
+        :return: 新規に作成した場合はTrue。
+        '''
+
+        cursor.execute('''
+                        SELECT
+                            COUNT(1)
+                        FROM
+                            sqlite_master
+                        WHERE
+                            name = 'ARTICLE_TAG'
+                        ''')
+
+        if cursor.fetchone()[0]:
+            return False
+
+        cursor.execute('''
+                        CREATE TABLE ARTICLE_TAG (
+                            URL TEXT NOT NULL,
+                            TAG TEXT NOT NULL,
+                            PRIMARY KEY (URL, TAG)
+                        ) WITHOUT ROWID
                         ''')
+
+        cursor.execute('''
+                        CREATE INDEX IF NOT EXISTS INDEX_ARTICLE_TAG_TAG ON ARTICLE_TAG (
+                            TAG,
+                            URL
+                        )
+                        ''')
+
+        cursor.execute('''
+                        CREATE TRIGGER IF NOT EXISTS ARTICLE_TAG_AD AFTER DELETE ON ARTICLE_INFO_HATENA
+                        BEGIN
+                            DELETE FROM
+                                ARTICLE_TAG
+                            WHERE
+                                URL = old.URL;
+                        END
+                        ''')
+
+        cursor.execute('''
+                        SELECT
+                            URL,
+                            TAG
+                        FROM
+                            ARTICLE_INFO_HATENA
+                        ''')
+
+        self.replace_tags(cursor, cursor.fetchall())
+
+        return True
+
+    def replace_tags(self, cursor: sqlite3.Cursor, urls_and_tags: list):
+        '''カンマ区切りのタグを分割し、URL毎にARTICLE_TAG.TBLのタグを置き換えるクエリ。
+
+        :param sqlite3.Cursor cursor: カーソル。
+        :param list urls_and_tags: (URL, カンマ区切りのタグ)のリスト。
+        '''
+
+        urls_and_tags = list(urls_and_tags)
+
+        cursor.executemany('''
+                            DELETE FROM
+                                ARTICLE_TAG
+                            WHERE
+                                URL = ?
+                            ''', [(url,) for url, _ in urls_and_tags])
+
+        cursor.executemany('''
+                            INSERT OR IGNORE INTO
+                                ARTICLE_TAG
+                            VALUES (
+                                ?,
+                                ?
+                            )
+                            ''', [(url, tag) for url, tags in urls_and_tags for tag in self.split_tags(tags)])
+
+    def replace_tags_from_work(self, cursor: sqlite3.Cursor):
+        '''WORK_ARTICLE_INFO_HATENA.TBLの記事情報のタグでARTICLE_TAG.TBLを置き換えるクエリ。
+        ワークテーブルからの記事情報の移行と同一トランザクション内で実行すること。
+
+        :param sqlite3.Cursor cursor: カーソル。
+        '''
+
+        cursor.execute('''
+                        SELECT
+                            URL,
+                            TAG
+                        FROM
+                            WORK_ARTICLE_INFO_HATENA
+                        ''')
+
+        self.replace_tags(cursor, cursor.fetchall())
+
+    @staticmethod
+    def normalize_tag(tag: str) -> str:
+        '''タグを比較用に正規化するメソッド。
+        前後の空白を除去し、非ASCII文字を含めて大文字小文字を区別しないようcasefoldする。
+        ARTICLE_TAG.TBLへの登録と検索の両方でこのメソッドを用いること。
+
+        :param str tag: タグ。
+        :rtype: str
+        :return: 正規化したタグ。
+        '''
+
+        return tag.strip().casefold()
+
+    @staticmethod
+    def split_tags(tags: str) -> list:
+        '''カンマ区切りのタグを分割して正規化するメソッド。空のタグは除外する。
+
+        :param str tags: カンマ区切りのタグ。
+        :rtype: list
+        :return: 正規化したタグのリスト。
+        '''
+
+        return [ArticleTagDao.normalize_tag(tag) for tag in (tags or '').split(',') if tag.strip()]
+
+@timed_dao
+class WorkArticleInfoHatenaDao:
+    '''WORK_ARTICLE_INFO_HATENA.TBLへのトランザクション処理を定義するDAOクラス。'''
+
+    def create_table(self, cursor: sqlite3.Cursor, table_name='WORK_ARTICLE_INFO_HATENA'):
+        '''WORK_ARTICLE_INFO_HATENA.TBLと同一定義のテーブルが存在しない場合に作成するクエリ。
+
+        :param sqlite3.Cursor cursor: カーソル。
+        :param str table_name: 作成するテーブル名。初期値は'WORK_ARTICLE_INFO_HATENA'。
+        '''
+
+        cursor.execute('''
+                        CREATE TABLE IF NOT EXISTS {} (
+                            URL TEXT NOT NULL,
+                            TITLE TEXT NOT NULL,
+                            PUBLISHED_DATE TEXT NOT NULL,
+                            BOOKMARKS INTEGER NOT NULL,
+                            TAG TEXT NOT NULL,
+                            REGISTER_DATE TEXT NOT NULL,
+                            UPDATED_DATE TEXT NOT NULL,
+                            RESERVED_DEL_DATE INTEGER NOT NULL,
+                            PRIMARY KEY (URL)
+                        )
+                        '''.format(table_name))
+
+    def transfer_from_attached(self, cursor: sqlite3.Cursor, schema_name: str):
+        '''アタッチしたデータベースのWORK_ARTICLE_INFO_HATENA.TBLから記事情報を集約するクエリ。
+        登録済みのURLは無視する。
+
+        :param sqlite3.Cursor cursor: カーソル。
+        :param str schema_name: アタッチしたデータベースのスキーマ名。
+        '''
+
+        cursor.execute('''
+                        INSERT OR IGNORE INTO
+                            main.WORK_ARTICLE_INFO_HATENA
+                        SELECT
+                            URL,
+                            TITLE,
+                            PUBLISHED_DATE,
+                            BOOKMARKS,
+                            TAG,
+                            REGISTER_DATE,
+                            UPDATED_DATE,
+                            RESERVED_DEL_DATE
+                        FROM
+                            {}.WORK_ARTICLE_INFO_HATENA
+                        '''.format(schema_name))
+
+    def count_records(self, cursor: sqlite3.Cursor):
+        '''WORK_ARTICLE_INFO_HATENA.TBLのレコード数を取得するクエリ。
+
+        :param sqlite3.Cursor cursor: カーソル。
+        '''
+
+        cursor.execute('''
+                        SELECT
+                            COUNT(1)
+                        FROM
+                            WORK_ARTICLE_INFO_HATENA
+                        ''')
+
+        return cursor.fetchone()
+
+    def count_unregistered_records(self, cursor: sqlite3.Cursor) -> tuple:
+        '''WORK_ARTICLE_INFO_HATENA.TBLのうちARTICLE_INFO_HATENA.TBLに未登録のレコード数を取得するクエリ。
+
+        :param sqlite3.Cursor cursor: カーソル。
+        :rtype: tuple
+        :return: 取得件数。
+        '''
+
+        cursor.execute('''
+                        SELECT
+                            COUNT(1)
+                        FROM
+                            WORK_ARTICLE_INFO_HATENA W
+                        WHERE
+                            NOT EXISTS (
+                                SELECT
+                                    1
+                                FROM
+                                    ARTICLE_INFO_HATENA A
+                                WHERE
+                                    A.URL = W.URL
+                            )
+                        ''')
+
+        return cursor.fetchone()
+
+    def insert_article_infos(self, cursor: sqlite3.Cursor, article_infos: dict):
+        '''取得した記事情報をWORK_ARTICLE_INFO_HATENA.TBLへ挿入するクエリ。
+
+        :param sqlite3.Cursor cursor: カーソル。
+        :param dict article_infos: カラムと挿入する記事情報の対応辞書。
+        '''
+
+        cursor.execute('''
+                        INSERT INTO
+                            WORK_ARTICLE_INFO_HATENA
+                        VALUES (
+                            :URL,
+                            :TITLE,
+                            :PUBLISHED_DATE,
+                            :BOOKMARKS,
+                            :TAG,
+                            datetime('now', 'localtime'),
+                            datetime('now', 'localtime'),
+                            :RESERVED_DEL_DATE
+                        )
+                        ''',(article_infos))
+
+    def insert_article_infos_bulk(self, cursor: sqlite3.Cursor, list_article_infos: list):
+        '''取得した複数の記事情報をWORK_ARTICLE_INFO_HATENA.TBLへ一括で挿入するクエリ。
+        既にワークテーブルに登録されているURLは無視する。
+
+        :param sqlite3.Cursor cursor: カーソル。
+        :param list list_article_infos: カラムと挿入する記事情報の対応辞書のリスト。
+        '''
+
+        cursor.executemany('''
+                        INSERT OR IGNORE INTO
+                            WORK_ARTICLE_INFO_HATENA
+                        VALUES (
+                            :URL,
+                            :TITLE,
+                            :PUBLISHED_DATE,
+                            :BOOKMARKS,
+                            :TAG,
+                            datetime('now', 'localtime'),
+                            datetime('now', 'localtime'),
+                            :RESERVED_DEL_DATE
+                        )
+                        ''', list_article_infos)
+
+    def delete_records(self, cursor: sqlite3.Cursor):
+        '''WORK_ARTICLE_INFO_HATENA.TBLから全レコードを削除するクエリ。
+
+        :param sqlite3.Cursor cursor: カーソル。
+        '''
+
+        cursor.execute('''
+                        DELETE FROM
+                            WORK_ARTICLE_INFO_HATENA
+                        ''')
+
+@timed_dao
+class DeadLetterHatenaDao:
+    '''DEAD_LETTER_HATENA.TBL(再試行後も失敗したリクエスト)へのトランザクション処理を定義するDAOクラス。
+    リクエストの種別と対象を主キーとし、再投入に成功したレコードは削除する。
+    '''
+
+    # 検索結果ページの取得
+    KIND_SEARCH = 'SEARCH'
+    # ブックマーク数の取得
+    KIND_BOOKMARKS = 'BOOKMARKS'
+
+    def create_table(self, cursor: sqlite3.Cursor):
+        '''DEAD_LETTER_HATENA.TBLが存在しない場合に作成するクエリ。
+
+        :param sqlite3.Cursor cursor: カーソル。
+        '''
+
+        cursor.execute('''
+                        CREATE TABLE IF NOT EXISTS DEAD_LETTER_HATENA (
+                            KIND TEXT NOT NULL,
+                            TARGET TEXT NOT NULL,
+                            REASON TEXT NOT NULL,
+                            ATTEMPTS INTEGER NOT NULL,
+                            FIRST_FAILED_DATE TEXT NOT NULL,
+                            LAST_FAILED_DATE TEXT NOT NULL,
+                            PRIMARY KEY (KIND, TARGET)
+                        ) WITHOUT ROWID
+                        ''')
+
+    def upsert_dead_letters(self, cursor: sqlite3.Cursor, dead_letters: list):
+        '''失敗したリクエストをDEAD_LETTER_HATENA.TBLへ登録するクエリ。
+        登録済みの場合は失敗回数を加算し、失敗理由と最終失敗日時を更新する。
+
+        :param sqlite3.Cursor cursor: カーソル。
+        :param list dead_letters: (種別, 対象, 失敗理由)のタプルを格納したリスト。
+        '''
+
+        cursor.executemany('''
+                        INSERT INTO
+                            DEAD_LETTER_HATENA
+                        VALUES (
+                            ?,
+                            ?,
+                            ?,
+                            1,
+                            datetime('now', 'localtime'),
+                            datetime('now', 'localtime')
+                        )
+                        ON CONFLICT (KIND, TARGET) DO UPDATE SET
+                            REASON = excluded.REASON,
+                            ATTEMPTS = ATTEMPTS + 1,
+                            LAST_FAILED_DATE = excluded.LAST_FAILED_DATE
+                        ''', dead_letters)
+
+    def select_targets_by_kind(self, cursor: sqlite3.Cursor, kind: str, max_attempts: int) -> list:
+        '''再投入の対象とするリクエストの対象を取得するクエリ。
+        失敗回数が上限に達したレコードは対象外とする。
+
+        :param sqlite3.Cursor cursor: カーソル。
+        :param str kind: リクエストの種別。
+        :param int max_attempts: 失敗回数の上限。
+        :rtype: list
+        :return: リクエストの対象のリスト。
+        '''
+
+        cursor.execute('''
+                        SELECT
+                            TARGET
+                        FROM
+                            DEAD_LETTER_HATENA
+                        WHERE
+                            KIND = ?
+                        AND
+                            ATTEMPTS < ?
+                        ORDER BY
+                            FIRST_FAILED_DATE
+                        ''', (kind, max_attempts,))
+
+        return [row[0] for row in cursor.fetchall()]
+
+    def count_records(self, cursor: sqlite3.Cursor) -> tuple:
+        '''DEAD_LETTER_HATENA.TBLのレコード数を取得するクエリ。
+
+        :param sqlite3.Cursor cursor: カーソル。
+        :rtype: tuple
+        :return: 検索結果。
+        '''
+
+        cursor.execute('''
+                        SELECT
+                            COUNT(1)
+                        FROM
+                            DEAD_LETTER_HATENA
+                        ''')
+
+        return cursor.fetchone()
+
+    def delete_by_primary_keys(self, cursor: sqlite3.Cursor, kind: str, targets: list):
+        '''再投入に成功したリクエストをDEAD_LETTER_HATENA.TBLから削除するクエリ。
+
+        :param sqlite3.Cursor cursor: カーソル。
+        :param str kind: リクエストの種別。
+        :param list targets: リクエストの対象のリスト。
+        '''
+
+        cursor.executemany('''
+                        DELETE FROM
+                            DEAD_LETTER_HATENA
+                        WHERE
+                            KIND = ?
+                        AND
+                            TARGET = ?
+                        ''', [(kind, target,) for target in targets])
+
+@timed_dao
+class DatabaseMaintenanceDao:
+    '''データベースファイル単位の操作(空き領域の回収、アタッチ)を定義するDAOクラス。'''
+
+    # PRAGMA auto_vacuumにおけるINCREMENTALの値
+    AUTO_VACUUM_INCREMENTAL = 2
+
+    def select_auto_vacuum(self, cursor: sqlite3.Cursor) -> tuple:
+        '''現在のauto_vacuumの設定値を取得するクエリ。
+
+        :param sqlite3.Cursor cursor: カーソル。
+        :rtype: tuple
+        :return: 設定値(0: NONE, 1: FULL, 2: INCREMENTAL)。
+        '''
+
+        cursor.execute('PRAGMA auto_vacuum')
+
+        return cursor.fetchone()
+
+    def select_freelist_count(self, cursor: sqlite3.Cursor) -> tuple:
+        '''データベースファイル内の未使用ページ数を取得するクエリ。
+
+        :param sqlite3.Cursor cursor: カーソル。
+        :rtype: tuple
+        :return: 未使用ページ数。
+        '''
+
+        cursor.execute('PRAGMA freelist_count')
+
+        return cursor.fetchone()
+
+    def enable_incremental_vacuum(self, cursor: sqlite3.Cursor):
+        '''auto_vacuumをINCREMENTALへ変更するクエリ。
+        既存のデータベースファイルへ反映するためVACUUMを実行するので、トランザクション外で実行すること。
+        VACUUMによりrowidが振り直されるため、実行後は全文検索インデックスを再構築すること。
+
+        :param sqlite3.Cursor cursor: カーソル。
+        '''
+
+        cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        cursor.execute('VACUUM')
+
+    def incremental_vacuum(self, cursor: sqlite3.Cursor, pages=0):
+        '''未使用ページをデータベースファイルから解放するクエリ。
+        auto_vacuumがINCREMENTALの場合のみ有効。
+        実行前に未コミットのトランザクションはコミットされる。
+
+        :param sqlite3.Cursor cursor: カーソル。
+        :param int pages: 解放するページ数。0の場合は全ての未使用ページを解放する。初期値は0。
+        '''
+
+        # executeでは1ページ解放する毎に停止するため、最後まで実行されるexecutescriptを使用する
+        cursor.executescript('PRAGMA incremental_vacuum({});'.format(int(pages)))
+
+    def attach_database(self, cursor: sqlite3.Cursor, path: str, schema_name: str):
+        '''別のデータベースファイルをアタッチするクエリ。トランザクション外で実行すること。
+
+        :param sqlite3.Cursor cursor: カーソル。
+        :param str path: アタッチするデータベースファイルへのパス。
+        :param str schema_name: アタッチしたデータベースのスキーマ名。
+        '''
+
+        cursor.execute('ATTACH DATABASE ? AS {}'.format(schema_name), (path,))
+
+    def detach_database(self, cursor: sqlite3.Cursor, schema_name: str):
+        '''アタッチしたデータベースファイルを切り離すクエリ。トランザクション外で実行すること。
+
+        :param sqlite3.Cursor cursor: カーソル。
+        :param str schema_name: アタッチしたデータベースのスキーマ名。
+        '''
+
+        cursor.execute('DETACH DATABASE {}'.format(schema_name))
+
+class SchemaMigrator:
+    '''データベースのスキーマをバージョン管理し、未適用のマイグレーションを順に適用するクラス。
+    スキーマのバージョンはPRAGMA user_versionに保持する。
+    '''
+
+    def __init__(self):
+        '''コンストラクタ。'''
+
+        # ARTICLE_INFO_HATENA_FTS.TBLのDAOクラス
+        self.article_info_hatena_fts_dao = ArticleInfoHatenaFtsDao()
+        # ARTICLE_TAG.TBLのDAOクラス
+        self.article_tag_dao = ArticleTagDao()
+        # WORK_ARTICLE_INFO_HATENA.TBLのDAOクラス
+        self.work_article_info_hatena_dao = WorkArticleInfoHatenaDao()
+        # DEAD_LETTER_HATENA.TBLのDAOクラス
+        self.dead_letter_hatena_dao = DeadLetterHatenaDao()
+
+        # バージョン順のマイグレーション
+        # 適用後のバージョンはリストの位置+1となるため、追加する場合は末尾に追加すること
+        self.MIGRATIONS = [
+            self.__create_search_index,
+            self.__create_article_tag,
+            self.__convert_to_typed_columns,
+            self.__skip_unchanged_search_index_update,
+            self.__create_dead_letter,
+            self.__rebuild_search_index_with_trigram,
+            self.__normalize_article_tag,
+        ]
+
+    def get_version(self, cursor: sqlite3.Cursor) -> int:
+        '''現在のスキーマのバージョンを取得するメソッド。
+
+        :param sqlite3.Cursor cursor: カーソル。
+        :rtype: int
+        :return: スキーマのバージョン。
+        '''
+
+        cursor.execute('PRAGMA user_version')
+
+        return cursor.fetchone()[0]
+
+    def get_latest_version(self) -> int:
+        '''適用可能な最新のスキーマのバージョンを取得するメソッド。
+
+        :rtype: int
+        :return: 最新のスキーマのバージョン。
+        '''
+
+        return len(self.MIGRATIONS)
+
+    def migrate(self, conn: sqlite3.Connection) -> list:
+        '''未適用のマイグレーションを順に適用するメソッド。
+        マイグレーションはバージョン毎に1トランザクションで適用し、失敗した場合はそのバージョンのみを取り消す。
+
+        :param sqlite3.Connection conn: DBとのコネクション。
+        :rtype: list
+        :return: 適用したバージョンのリスト。
+        :raises sqlite3.Error: マイグレーションに失敗した場合。
+        '''
+
+        cursor = conn.cursor()
+        applied_versions = []
+
+        if conn.in_transaction:
+            conn.commit()
+
+        for version in range(self.get_version(cursor), self.get_latest_version()):
+            try:
+                cursor.execute('BEGIN IMMEDIATE')
+                self.MIGRATIONS[version](cursor)
+                cursor.execute('PRAGMA user_version = {}'.format(version + 1))
+                conn.commit()
+            except sqlite3.Error:
+                conn.rollback()
+                raise
+
+            applied_versions.append(version + 1)
+
+        if applied_versions:
+            # 追加したインデックスの統計情報を収集する
+            cursor.execute('PRAGMA optimize')
+
+        return applied_versions
+
+    def __create_search_index(self, cursor: sqlite3.Cursor):
+        '''バージョン1: タイトルおよびタグの全文検索インデックスを作成する。
+
+        :param sqlite3.Cursor cursor: カーソル。
+        '''
+
+        self.article_info_hatena_fts_dao.create_table(cursor)
+
+    def __create_article_tag(self, cursor: sqlite3.Cursor):
+        '''バージョン2: 記事毎のタグを保持するタグテーブルを作成する。
+
+        :param sqlite3.Cursor cursor: カーソル。
+        '''
+
+        self.article_tag_dao.create_table(cursor)
+
+    def __convert_to_typed_columns(self, cursor: sqlite3.Cursor):
+        '''バージョン3: ブックマーク数を整数型へ、公開日をISO 8601形式へ変換し、ソートおよび絞り込み用のインデックスを作成する。
+
+        :param sqlite3.Cursor cursor: カーソル。
+        '''
+
+        # 文字列として格納されているブックマーク数を整数へ変換する
+        cursor.execute('''
+                        UPDATE
+                            ARTICLE_INFO_HATENA
+                        SET
+                            BOOKMARKS = CAST(BOOKMARKS AS INTEGER)
+                        WHERE
+                            typeof(BOOKMARKS) <> 'integer'
+                        ''')
+
+        # 公開日をYYYY/MM/DDからYYYY-MM-DDへ変換する
+        cursor.execute('''
+                        UPDATE
+                            ARTICLE_INFO_HATENA
+                        SET
+                            PUBLISHED_DATE = replace(PUBLISHED_DATE, '/', '-')
+                        WHERE
+                            PUBLISHED_DATE LIKE '%/%'
+                        ''')
+
+        # ワークテーブルはブックマーク数がTEXT型で定義されているため再作成する
+        self.work_article_info_hatena_dao.create_table(cursor, 'WORK_ARTICLE_INFO_HATENA_NEW')
+
+        cursor.execute('''
+                        INSERT INTO
+                            WORK_ARTICLE_INFO_HATENA_NEW
+                        SELECT
+                            URL,
+                            TITLE,
+                            replace(PUBLISHED_DATE, '/', '-'),
+                            CAST(BOOKMARKS AS INTEGER),
+                            TAG,
+                            REGISTER_DATE,
+                            UPDATED_DATE,
+                            RESERVED_DEL_DATE
+                        FROM
+                            WORK_ARTICLE_INFO_HATENA
+                        ''')
+
+        cursor.execute('DROP TABLE WORK_ARTICLE_INFO_HATENA')
+        cursor.execute('ALTER TABLE WORK_ARTICLE_INFO_HATENA_NEW RENAME TO WORK_ARTICLE_INFO_HATENA')
+
+        # ブックマーク数順の上位取得をインデックスの走査で行う
+        cursor.execute('''
+                        CREATE INDEX IF NOT EXISTS INDEX_ARTICLE_INFO_HATENA_BOOKMARKS ON ARTICLE_INFO_HATENA (
+                            BOOKMARKS DESC,
+                            URL
+                        )
+                        ''')
+
+        # 削除予定日による絞り込み用
+        cursor.execute('''
+                        CREATE INDEX IF NOT EXISTS INDEX_ARTICLE_INFO_HATENA_RESERVED_DEL_DATE ON ARTICLE_INFO_HATENA (
+                            RESERVED_DEL_DATE
+                        )
+                        ''')
+
+        # 最終更新日時による絞り込み用
+        cursor.execute('''
+                        CREATE INDEX IF NOT EXISTS INDEX_ARTICLE_INFO_HATENA_UPDATED_DATE ON ARTICLE_INFO_HATENA (
+                            UPDATED_DATE
+                        )
+                        ''')
+
+    def __skip_unchanged_search_index_update(self, cursor: sqlite3.Cursor):
+        '''バージョン4: TITLE/TAGに変更がない更新では全文検索インデックスを更新しないようトリガを再作成する。
+
+        :param sqlite3.Cursor cursor: カーソル。
+        '''
+
+        cursor.execute('DROP TRIGGER IF EXISTS ARTICLE_INFO_HATENA_FTS_AU')
+        self.article_info_hatena_fts_dao.create_update_trigger(cursor)
+
+    def __create_dead_letter(self, cursor: sqlite3.Cursor):
+        '''バージョン5: 再試行後も失敗したリクエストを保持するテーブルを作成する。
+
+        :param sqlite3.Cursor cursor: カーソル。
+        '''
+
+        self.dead_letter_hatena_dao.create_table(cursor)
+
+    def __rebuild_search_index_with_trigram(self, cursor: sqlite3.Cursor):
+        '''バージョン6: 日本語の部分一致を検索できるよう、全文検索インデックスをトライグラムで再作成する。
+
+        :param sqlite3.Cursor cursor: カーソル。
+        '''
+
+        cursor.execute('DROP TRIGGER IF EXISTS ARTICLE_INFO_HATENA_FTS_AI')
+        cursor.execute('DROP TRIGGER IF EXISTS ARTICLE_INFO_HATENA_FTS_AD')
+        cursor.execute('DROP TRIGGER IF EXISTS ARTICLE_INFO_HATENA_FTS_AU')
+        cursor.execute('DROP TABLE IF EXISTS ARTICLE_INFO_HATENA_FTS')
+
+        self.article_info_hatena_fts_dao.create_table(cursor)
+
+    def __normalize_article_tag(self, cursor: sqlite3.Cursor):
+        '''バージョン7: 非ASCII文字を含めて大文字小文字を区別せず検索できるよう、タグを正規化してタグテーブルを再作成する。
+
+        :param sqlite3.Cursor cursor: カーソル。
+        '''
+
+        cursor.execute('DROP TRIGGER IF EXISTS ARTICLE_TAG_AD')
+        cursor.execute('DROP TABLE IF EXISTS ARTICLE_TAG')
+
+        self.article_tag_dao.create_table(cursor)
+
+if __name__ == '__main__':
+    from common import connect_to_database
+
+    conn, cursor = connect_to_database()
+    migrator = SchemaMigrator()
+
+    try:
+        print('current schema version : {}'.format(migrator.get_version(cursor)))
+        applied_versions = migrator.migrate(conn)
+        print('applied versions : {}'.format(applied_versions or 'none'))
+        print('latest schema version : {}'.format(migrator.get_version(cursor)))
+    finally:
+        conn.close()
@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+
+'''
+
+Structured crawl telemetry written as JSON lines.
+
+Every timed stage (HTTP name resolution, connect and download, scraping, the bookmark API, DAO calls,
+inserting into and migrating from the work table) becomes one JSON object per line
+with its elapsed time in milliseconds and the fields of its context (search word, page, rows, bytes...).
+Counters (inserted rows, duplicates, HTTP errors, retries...) are written once when the process exits.
+Each process writes its own file under the 'dir_telemetry' path, so worker processes never share a file.
+
+Telemetry is disabled unless the 'telemetry' section of userConfig.json enables it;
+while disabled, timers and counters cost a single attribute check,
+and the DAO methods decorated with timed_dao are replaced by the original methods on their first call.
+
+Summarise one or more runs with:
+
+    python telemetry.py [FILE_OR_DIRECTORY ...]
+
+:copyright: (c) 2018 by Kato Shinya.
+:license: MIT, see LICENSE for more details.
+'''
+
+from contextlib import contextmanager
+from collections import defaultdict
+from multiprocessing import util
+from datetime import datetime
+from functools import wraps
+import threading
+import inspect
+import atexit
+import time
+import json
+import glob
+import sys
+import os
+
+__author__ = 'Kato Shinya'
+__date__ = '2018/04/21'
+
+# プロセス内で共有するテレメトリ
+_telemetry = None
+# 上記の生成を排他制御するロック
+_telemetry_lock = threading.Lock()
+
+class Telemetry:
+    '''処理段階毎の所要時間とカウンタをJSON Lines形式で出力するクラス。'''
+
+    def __init__(self, path=None, buffer_records=256):
+        '''コンストラクタ。
+
+        :param str path: 出力先ファイルへのパス。Noneの場合は出力しない。初期値はNone。
+        :param int buffer_records: まとめて書き込むまでに蓄積する最大件数。初期値は256。
+        '''
+
+        self.PATH = path
+        self.BUFFER_RECORDS = max(1, buffer_records)
+        # 出力するか否か
+        self.enabled = path is not None
+
+        # 書き込み待ちの行
+        self.__buffer = []
+        # カウンタ
+        self.__counters = defaultdict(int)
+        self.__lock = threading.Lock()
+
+    @contextmanager
+    def timer(self, stage: str, **fields):
+        '''with文で囲んだ処理の所要時間を記録するメソッド。
+        with文の中で返却値の辞書へ追加した項目も併せて記録する。
+
+        :param str stage: 処理段階の名前。
+        :param dict fields: 併せて記録する項目。
+        :rtype: dict
+        :return: 記録する項目の辞書。
+
+        >>> with telemetry.timer('scrape', word='Python', page=1) as fields:
+        >>>     fields['articles'] = len(article_infos)
+        '''
+
+        if not self.enabled:
+            yield fields
+            return
+
+        started = time.perf_counter()
+        try:
+            yield fields
+        finally:
+            self.record(stage, time.perf_counter() - started, **fields)
+
+    def record(self, stage: str, elapsed: float, **fields):
+        '''処理段階の所要時間を記録するメソッド。
+
+        :param str stage: 処理段階の名前。
+        :param float elapsed: 所要時間(秒)。
+        :param dict fields: 併せて記録する項目。
+        '''
+
+        if not self.enabled:
+            return
+
+        self.__write(dict(fields, ts=time.time(), pid=os.getpid(), stage=stage, elapsed_ms=round(elapsed * 1000, 3)))
+
+    def count(self, name: str, value=1):
+        '''カウンタを加算するメソッド。
+
+        :param str name: カウンタ名。
+        :param int value: 加算する値。初期値は1。
+        '''
+
+        if not self.enabled:
+            return
+
+        with self.__lock:
+            self.__counters[name] += value
+
+    def close(self):
+        '''カウンタと書き込み待ちの行を書き込むメソッド。'''
+
+        if not self.enabled:
+            return
+
+        with self.__lock:
+            counters, self.__counters = dict(self.__counters), defaultdict(int)
+
+        if counters:
+            self.__write({'ts' : time.time(), 'pid' : os.getpid(), 'stage' : 'counters', 'counters' : counters})
+
+        self.flush()
+
+    def flush(self):
+        '''書き込み待ちの行をまとめて書き込むメソッド。'''
+
+        with self.__lock:
+            lines, self.__buffer = self.__buffer, []
+
+        if not lines:
+            return
+
+        dir_telemetry = os.path.dirname(self.PATH)
+        if dir_telemetry and not os.path.exists(dir_telemetry):
+            os.makedirs(dir_telemetry, exist_ok=True)
+
+        with open(self.PATH, 'a', encoding='utf-8') as f:
+            f.write(''.join(lines))
+
+    def __write(self, record: dict):
+        '''1件分の記録を書き込み待ちの行として蓄積するメソッド。
+
+        :param dict record: 記録する内容。
+        '''
+
+        line = json.dumps(record, ensure_ascii=False, default=str) + '\n'
+
+        with self.__lock:
+            self.__buffer.append(line)
+            full = len(self.__buffer) >= self.BUFFER_RECORDS
+
+        if full:
+            self.flush()
+
+def get_telemetry() -> Telemetry:
+    '''プロセス内で共有するテレメトリを返す関数。
+    初回の呼び出し時に構成管理ファイルのtelemetryセクションを読み込み、
+    有効な場合はプロセス毎の出力先ファイルを決定する。
+
+    :rtype: Telemetry
+    :return: テレメトリ。
+    '''
+
+    global _telemetry
+
+    # fork後の子プロセスでは出力先ファイルを分けるため生成し直す
+    if _telemetry is not None and _telemetry[0] == os.getpid():
+        return _telemetry[1]
+
+    with _telemetry_lock:
+        if _telemetry is None or _telemetry[0] != os.getpid():
+            from common import read_config_file
+
+            config = read_config_file()
+            path = None
+
+            if config['telemetry']['enabled']:
+                path = os.path.join(config['path']['dir_telemetry'], '{}_{}.jsonl'.format(datetime.now().strftime('%Y%m%d_%H%M%S'), os.getpid()))
+
+            telemetry = Telemetry(path, int(config['telemetry']['buffer_records']))
+            _telemetry = (os.getpid(), telemetry)
+
+            # 終了時にカウンタと書き込み待ちの行を書き込む(multiprocessingの子プロセスではatexitが呼ばれない)
+            atexit.register(telemetry.close)
+            util.Finalize(None, telemetry.close, exitpriority=10)
+
+        return _telemetry[1]
+
+def timed_dao(cls):
+    '''DAOクラスの公開メソッドの所要時間を'dao.クラス名.メソッド名'として記録するクラスデコレータ。
+    ジェネレータメソッドは呼び出し時には処理を行わないため対象外とする。
+    構成管理ファイルを読み込む前にモジュールの読み込み時点で適用されるため、
+    テレメトリの有効/無効は各メソッドの初回の呼び出し時に判定し、以降はその結果に応じたメソッドを直接呼び出す。
+
+    :param type cls: DAOクラス。
+    :rtype: type
+    :return: 計測を組み込んだDAOクラス。
+    '''
+
+    for name, method in list(vars(cls).items()):
+        if name.startswith('_') or not inspect.isfunction(method) or inspect.isgeneratorfunction(method):
+            continue
+
+        setattr(cls, name, _bind_timed(cls, name, method, 'dao.{}.{}'.format(cls.__name__, name)))
+
+    return cls
+
+def _bind_timed(cls, name: str, method, stage: str):
+    '''初回の呼び出し時にテレメトリの有効/無効を判定し、クラスのメソッドを置き換えるラッパを生成する関数。
+    無効の場合は元のメソッドへ戻すため、以降の呼び出しではラッパを経由しない。
+
+    :param type cls: DAOクラス。
+    :param str name: メソッド名。
+    :param function method: 対象のメソッド。
+    :param str stage: 処理段階の名前。
+    :rtype: function
+    :return: メソッドを置き換えるラッパ。
+    '''
+
+    @wraps(method)
+    def bind(*args, **kwargs):
+        bound = _timed(method, stage) if get_telemetry().enabled else method
+        setattr(cls, name, bound)
+
+        return bound(*args, **kwargs)
+
+    return bind
+
+def _timed(method, stage: str):
+    '''メソッドの所要時間を記録するラッパを生成する関数。
+
+    :param function method: 対象のメソッド。
+    :param str stage: 処理段階の名前。
+    :rtype: function
+    :return: 所要時間を記録するラッパ。
+    '''
+
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        with get_telemetry().timer(stage):
+            return method(*args, **kwargs)
+
+    return wrapper
+
+def summarize(paths: list) -> tuple:
+    '''テレメトリを集計する関数。
+
+    :param list paths: テレメトリファイルへのパスのリスト。
+    :rtype: tuple
+    :return: 処理段階毎の所要時間(ミリ秒)のリストの辞書と、カウンタの合計の辞書のタプル。
+    '''
+
+    elapsed = defaultdict(list)
+    counters = defaultdict(int)
+
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+
+                record = json.loads(line)
+                if record['stage'] == 'counters':
+                    for name, value in record['counters'].items():
+                        counters[name] += value
+                else:
+                    elapsed[record['stage']].append(record['elapsed_ms'])
+
+    return elapsed, counters
+
+def percentile(values: list, rate: float) -> float:
+    '''ソート済みの値から最近傍順位法でパーセンタイルを求める関数。
+
+    :param list values: 昇順にソートした値のリスト。
+    :param float rate: パーセンタイル(0から100)。
+    :rtype: float
+    :return: パーセンタイル値。
+    '''
+
+    if not values:
+        return 0.0
+
+    rank = max(1, -(-len(values) * rate // 100))
+
+    return values[int(rank) - 1]
+
+def format_summary(elapsed: dict, counters: dict) -> str:
+    '''集計結果を表形式の文字列にする関数。
+    処理段階は合計所要時間の降順に並べる。
+
+    :param dict elapsed: 処理段階毎の所要時間(ミリ秒)のリストの辞書。
+    :param dict counters: カウンタの合計の辞書。
+    :rtype: str
+    :return: 表形式の集計結果。
+    '''
+
+    lines = ['{:<56}{:>8}{:>12}{:>10}{:>10}{:>10}'.format('stage', 'count', 'total ms', 'p50', 'p95', 'p99')]
+
+    for stage, values in sorted(elapsed.items(), key=lambda item: -sum(item[1])):
+        values = sorted(values)
+        lines.append('{:<56}{:>8}{:>12.1f}{:>10.2f}{:>10.2f}{:>10.2f}'.format(stage, len(values), sum(values), percentile(values, 50), percentile(values, 95), percentile(values, 99)))
+
+    if counters:
+        lines.append('')
+        lines.extend('{:<56}{:>8}'.format(name, value) for name, value in sorted(counters.items()))
+
+    return '\n'.join(lines)
+
+if __name__ == '__main__':
+    paths = []
+
+    for target in sys.argv[1:] or ['../log/telemetry/']:
+        paths.extend(sorted(glob.glob(os.path.join(target, '*.jsonl'))) if os.path.isdir(target) else [target])
+
+    print(format_summary(*summarize(paths)))
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+
+'''
+Shared fixtures for the test suite.
+
+The modules under metis/ import each other by name and read their message files from ../env/,
+so every test runs from the metis directory with that directory on sys.path.
+
+:copyright: (c) 2018 by Kato Shinya.
+:license: MIT, see LICENSE for more details.
+'''
+
+import sqlite3
+import shutil
+import json
+import sys
+import os
+
+import pytest
+
+DIR_METIS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'metis')
+sys.path.insert(0, DIR_METIS)
+
+from standin import HatenaStandInServer
+import telemetry
+import common
+import log
+
+__author__ = 'Kato Shinya'
+__date__ = '2018/04/21'
+
+@pytest.fixture(autouse=True)
+def in_metis_dir(monkeypatch):
+    '''metisディレクトリを作業ディレクトリとするフィクスチャ。'''
+
+    monkeypatch.chdir(DIR_METIS)
+
+@pytest.fixture
+def standin():
+    '''起動済みのスタンドインサーバを返すフィクスチャ。'''
+
+    server = HatenaStandInServer()
+    server.start()
+
+    yield server
+
+    server.stop()
+
+@pytest.fixture
+def config(tmp_path, standin, monkeypatch):
+    '''スタンドインサーバと一時ディレクトリを参照する構成管理ファイルを読み込ませるフィクスチャ。
+    ブックマーク数の一括取得は2件毎に分割する。
+
+    :rtype: dict
+    :return: 読み込まれた構成管理ファイルの内容。
+    '''
+
+    with open(os.path.join(DIR_METIS, '..', 'env', 'userConfig.json'), encoding='utf-8') as f:
+        values = json.load(f)
+
+    base_url = standin.base_url()
+    values['url']['hatena_search'] = base_url + '/search/tag'
+    values['url']['hatena_bookmark_api'] = base_url + '/entry.count'
+    values['url']['hatena_bookmarks_api'] = base_url + '/entry.counts'
+
+    values['path']['database'] = str(tmp_path / 'USER01.db')
+    values['path']['dir_log'] = str(tmp_path / 'log') + os.sep
+    values['path']['http_cache'] = str(tmp_path / 'cache' / 'http_cache.db')
+    values['path']['dir_archive'] = str(tmp_path / 'archive') + os.sep
+    values['path']['dir_staging'] = str(tmp_path / 'staging') + os.sep
+    values['path']['dir_telemetry'] = str(tmp_path / 'telemetry') + os.sep
+
+    values['cache']['enabled'] = False
+    values['telemetry']['enabled'] = False
+    values['crawler']['bookmark_batch_size'] = 2
+    values['crawler']['exit_pause_sec'] = 0
+    values['http']['backoff_sec'] = 0.01
+
+    path = tmp_path / 'userConfig.json'
+    path.write_text(json.dumps(values, ensure_ascii=False), encoding='utf-8')
+
+    # プロセス内でキャッシュされた設定と、それを基に生成された書き込み先を破棄する
+    monkeypatch.setenv('METIS_CONFIG', str(path))
+    monkeypatch.setattr(common, '_config', None)
+    monkeypatch.setattr(telemetry, '_telemetry', None)
+    shutil.copy(os.path.join(DIR_METIS, '..', 'common', 'db', 'USER01.db'), values['path']['database'])
+
+    yield common.read_config_file()
+
+    log._stop_writer()
+
+@pytest.fixture
+def rewrite_config(config):
+    '''構成管理ファイルの設定値を書き換える関数を返すフィクスチャ。
+    書き換えた値は以降に生成したクラスと、構成管理ファイルを読み込み直すワーカプロセスが参照する。
+    '''
+
+    def rewrite(values: dict):
+        for section, items in values.items():
+            config[section].update(items)
+
+        with open(os.environ['METIS_CONFIG'], 'w', encoding='utf-8') as f:
+            json.dump(config, f, ensure_ascii=False)
+
+    return rewrite
+
+def issue_serial_number(config: dict) -> str:
+    '''管理テーブルへシリアル番号を登録し、そのシリアル番号を返す関数。'''
+
+    from sql import ManageSerialDao
+
+    serial_number = common.create_serial_number()
+    conn = sqlite3.connect(config['path']['database'])
+    ManageSerialDao().insert_serial_no(conn.cursor(), serial_number)
+    conn.commit()
+    conn.close()
+
+    return serial_number
+
+@pytest.fixture
+def crawler(config):
+    '''シリアル番号を発行し、疎通確認を行わずに生成したクローラの基底クラスを返すフィクスチャ。'''
+
+    from crawler import CommunicateBase
+
+    return CommunicateBase(['test', '0', issue_serial_number(config)], check_internet=False)
+
+@pytest.fixture
+def create_crawling(config):
+    '''シリアル番号を発行し、疎通確認を行わずにクローリング処理のクラスを生成する関数を返すフィクスチャ。
+    シリアル番号は処理の終了時に消去されるため、同じテスト内で複数回実行する場合は実行毎に生成する。
+    '''
+
+    from crawler import CrawlingHatena
+
+    return lambda: CrawlingHatena(['test', '0', issue_serial_number(config)], check_internet=False)
+
+@pytest.fixture
+def crawling(create_crawling):
+    '''シリアル番号を発行し、疎通確認を行わずに生成したクローリング処理のクラスを返すフィクスチャ。'''
+
+    return create_crawling()
+
+@pytest.fixture
+def updater(config):
+    '''シリアル番号を発行し、疎通確認を行わずに生成したブックマーク数の更新処理のクラスを返すフィクスチャ。'''
+
+    from crawler import UpdateBookmarksHatena
+
+    return UpdateBookmarksHatena(['test', '1', issue_serial_number(config)], check_internet=False)
+
+@pytest.fixture
+def create_purger(config):
+    '''シリアル番号を発行し、期限切れ記事の削除処理のクラスを生成する関数を返すフィクスチャ。'''
+
+    from crawler import PurgeExpiredArticlesHatena
+
+    return lambda: PurgeExpiredArticlesHatena(['test', '2', issue_serial_number(config)])
+
+@pytest.fixture
+def purger(create_purger):
+    '''シリアル番号を発行して生成した期限切れ記事の削除処理のクラスを返すフィクスチャ。'''
+
+    return create_purger()
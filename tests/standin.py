@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+
+'''
+
+A local stand-in server for the Hatena endpoints used by the crawler.
+
+It answers the bookmark count APIs (entry.count and entry.counts)
+and the tag search page from in-memory data,
+so that the crawler can be exercised without reaching the Internet.
+Point the 'url' section of userConfig.json at the address returned by start().
+
+Every response can be delayed by a fixed latency plus a random jitter to approximate a remote server,
+and the number of requests served is counted per endpoint along with the number of accepted connections.
+Error replies (429, 503...) with an optional Retry-After header can be queued with fail_next().
+
+It is a helper of the test suite and is not shipped with the application; the benchmarks import it from here as well.
+
+:copyright: (c) 2018 by Kato Shinya.
+:license: MIT, see LICENSE for more details.
+'''
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from collections import Counter
+import threading
+import random
+import time
+import hashlib
+import gzip
+import json
+import sys
+
+__author__ = 'Kato Shinya'
+__date__ = '2018/04/21'
+
+class HatenaStandInHandler(BaseHTTPRequestHandler):
+    '''スタンドインサーバへのリクエストを処理するクラス。'''
+
+    # Keep-Alive接続を受け付ける
+    protocol_version = 'HTTP/1.1'
+    # ヘッダとボディを別々に送信しても遅延ACKで待たされないようにする
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        '''GETリクエストを処理するメソッド。'''
+
+        parsed = urlparse(self.path)
+        query = parse_qs(parsed.query)
+
+        # 遠隔のサーバを模倣するため応答を遅延させる
+        self.server.delay()
+        self.server.count_hit(parsed.path)
+
+        failure = self.server.take_failure()
+        if failure:
+            # 予約されたエラー応答を返却する
+            self.__send_failure(*failure)
+        elif parsed.path.endswith('/entry.counts'):
+            # 登録されているURLのみを返却する
+            counts = {url : self.server.bookmarks[url] for url in query.get('url', []) if url in self.server.bookmarks}
+            self.__send(json.dumps(counts), 'application/json')
+        elif parsed.path.endswith('/entry.count'):
+            # ブックマーク数が0の場合は空を返却する
+            url = query.get('url', [''])[0]
+            self.__send(str(self.server.bookmarks[url]) if url in self.server.bookmarks else '', 'text/plain')
+        elif parsed.path.endswith('/search/tag'):
+            word = query.get('q', [''])[0]
+            page = int(query.get('page', ['1'])[0])
+            self.__send(self.server.pages.get((word, page), self.server.pages.get(page, '')), 'text/html')
+        else:
+            self.send_error(404)
+
+    def log_message(self, format, *args):
+        '''アクセスログを標準エラーへ出力しないためのオーバーライド。'''
+
+        pass
+
+    def __send_failure(self, status: int, retry_after):
+        '''本文のないエラー応答を送信するメソッド。
+
+        :param int status: ステータスコード。
+        :param str retry_after: Retry-Afterヘッダの値。Noneの場合は送信しない。
+        '''
+
+        self.send_response(status)
+        if retry_after is not None:
+            self.send_header('Retry-After', str(retry_after))
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def __send(self, body: str, content_type: str):
+        '''レスポンスを送信するメソッド。
+
+        :param str body: レスポンスボディ。
+        :param str content_type: Content-Typeヘッダの値。
+        '''
+
+        data = body.encode('utf-8')
+        etag = '"{}"'.format(hashlib.md5(data).hexdigest())
+
+        if self.headers.get('If-None-Match') == etag:
+            # 変更がない場合は本文を返却しない
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        if self.server.compress and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            # 圧縮転送を要求された場合はgzipで圧縮する
+            data = gzip.compress(data)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Type', '{}; charset=utf-8'.format(content_type))
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+class HatenaStandInServer(ThreadingHTTPServer):
+    '''Hatenaの各エンドポイントを模倣するローカルHTTPサーバクラス。'''
+
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, bookmarks={}, pages={}, compress=True, latency=0.0, jitter=0.0):
+        '''コンストラクタ。
+
+        :param str host: 待ち受けるホスト名。初期値は'127.0.0.1'。
+        :param int port: 待ち受けるポート番号。初期値は0(空きポートを自動で割り当てる)。
+        :param dict bookmarks: URLをキーとしたブックマーク数の辞書。
+        :param dict pages: (検索ワード, ページ番号)またはページ番号をキーとした検索結果HTMLの辞書。
+        :param bool compress: 要求された場合にgzipで圧縮して返却するか否か。初期値はTrue。
+        :param float latency: 全ての応答に加える遅延(秒)。初期値は0.0。
+        :param float jitter: 遅延に無作為に加える最大時間(秒)。初期値は0.0。
+        '''
+
+        super().__init__((host, port), HatenaStandInHandler)
+
+        # ブックマーク数の辞書
+        self.bookmarks = dict(bookmarks)
+        # 検索結果HTMLの辞書
+        self.pages = dict(pages)
+        # gzip圧縮の可否
+        self.compress = compress
+        # 応答の遅延(秒)
+        self.latency = latency
+        # 遅延に加える最大時間(秒)
+        self.jitter = jitter
+        # エンドポイント毎の応答数
+        self.hits = Counter()
+        # リクエストを受信した時刻(time.monotonic)
+        self.requested_at = []
+        # 受け付けた接続数
+        self.connections = 0
+        # 予約されたエラー応答(ステータスコード, Retry-After)
+        self.failures = []
+        # 上記カウンタとリストの排他制御用ロック
+        self.__lock = threading.Lock()
+        # サーバスレッド
+        self.__thread = None
+
+    def start(self) -> str:
+        '''バックグラウンドスレッドでサーバを起動するメソッド。
+
+        :rtype: str
+        :return: サーバのベースURL。
+        '''
+
+        self.__thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.__thread.start()
+
+        return self.base_url()
+
+    def stop(self):
+        '''サーバを停止するメソッド。'''
+
+        self.shutdown()
+        self.server_close()
+
+        if self.__thread:
+            self.__thread.join()
+
+    def process_request(self, request, client_address):
+        '''受け付けた接続数を加算してから接続を処理するメソッド。
+
+        :param socket.socket request: 受け付けた接続。
+        :param tuple client_address: 接続元のアドレス。
+        '''
+
+        with self.__lock:
+            self.connections += 1
+
+        super().process_request(request, client_address)
+
+    def fail_next(self, status: int, retry_after=None, times=1):
+        '''次のリクエストから指定回数だけエラー応答を返却するよう予約するメソッド。
+
+        :param int status: ステータスコード。
+        :param str retry_after: Retry-Afterヘッダの値(秒数またはHTTP日付)。初期値はNone(送信しない)。
+        :param int times: エラー応答を返却する回数。初期値は1。
+        '''
+
+        with self.__lock:
+            self.failures.extend([(status, retry_after)] * times)
+
+    def take_failure(self) -> tuple:
+        '''予約されたエラー応答を1件取り出すメソッド。
+
+        :rtype: tuple
+        :return: (ステータスコード, Retry-After)のタプル。予約がない場合はNone。
+        '''
+
+        with self.__lock:
+            return self.failures.pop(0) if self.failures else None
+
+    def delay(self):
+        '''設定された遅延と無作為な揺らぎの分だけ待機するメソッド。'''
+
+        seconds = self.latency + random.uniform(0, self.jitter)
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def count_hit(self, path: str):
+        '''エンドポイント毎の応答数を加算し、受信した時刻を記録するメソッド。
+
+        :param str path: リクエストのパス。
+        '''
+
+        with self.__lock:
+            self.hits[path] += 1
+            self.requested_at.append(time.monotonic())
+
+    def base_url(self) -> str:
+        '''サーバのベースURLを返すメソッド。
+
+        :rtype: str
+        :return: サーバのベースURL。
+        '''
+
+        host, port = self.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+if __name__ == '__main__':
+    server = HatenaStandInServer(port=int(sys.argv[1]) if len(sys.argv) > 1 else 8080)
+    print(server.base_url())
+    server.serve_forever()
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+'''
+:copyright: (c) 2018 by Kato Shinya.
+:license: MIT, see LICENSE for more details.
+'''
+
+from concurrent.futures import ThreadPoolExecutor
+
+from common import connect_to_database, normalize_fields
+
+__author__ = 'Kato Shinya'
+__date__ = '2018/04/21'
+
+def test_shared_connection_is_reused(config):
+    '''同一スレッド内では同じコネクションを返却し、close()では未確定のトランザクションのみを破棄すること。'''
+
+    conn, cursor = connect_to_database()
+    cursor.execute("INSERT INTO MST_PARAMETER VALUES ('TEST', 'VALUE')")
+    conn.close()
+
+    reused, cursor = connect_to_database()
+    cursor.execute("SELECT COUNT(1) FROM MST_PARAMETER WHERE PARAM_NAME = 'TEST'")
+
+    assert reused is conn
+    assert cursor.fetchone()[0] == 0
+
+def test_shared_connection_per_thread(config):
+    '''別スレッドには別のコネクションを返却すること。'''
+
+    conn, _ = connect_to_database()
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        other = executor.submit(lambda: connect_to_database()[0]).result()
+
+    assert other is not conn
+    assert connect_to_database()[0] is conn
+
+def test_private_connection(config):
+    '''共有しない場合は呼び出し毎に新しいコネクションを返却すること。'''
+
+    conn, _ = connect_to_database(shared=False)
+    other, _ = connect_to_database(shared=False)
+
+    assert other is not conn
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == config['database']['journal_mode'].lower()
+
+    conn.close()
+    other.close()
+
+def test_normalize_fields_unescapes_references():
+    '''文字参照を値毎に復元すること。'''
+
+    assert normalize_fields(['A &amp; B', '&lt;tag&gt;', '&#12354;&quot;']) == ['A & B', '<tag>', 'あ"']
+
+def test_normalize_fields_drops_characters_outside_encoding():
+    '''保存時の文字コードで表現できない文字のみを除くこと。'''
+
+    assert normalize_fields(['Python&#x1F40D;入門', 'caf&eacute;', '①'], 'cp932') == ['Python入門', 'caf', '①']
+    assert normalize_fields(['Python&#x1F40D;入門'], 'utf-8') == ['Python\U0001f40d入門']
+
+def test_normalize_fields_with_separator():
+    '''値に区切り文字が含まれていても値の数と位置を保ち、区切り文字を除くこと。'''
+
+    values = ['A\x1fB', '&amp;\x1f', '\x1f', 'C &#31;D']
+
+    assert normalize_fields(values) == ['AB', '&', '', 'C D']
+    assert normalize_fields(values, 'cp932') == ['AB', '&', '', 'C D']
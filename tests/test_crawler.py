@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+
+'''
+:copyright: (c) 2018 by Kato Shinya.
+:license: MIT, see LICENSE for more details.
+'''
+
+import sqlite3
+import json
+import gzip
+import glob
+import os
+
+from crawler import CrawlingHatena
+from httpcache import HttpCache
+from sql import MstParameterDao, ArticleInfoHatenaFtsDao, ArticleTagDao, DatabaseMaintenanceDao
+import common
+
+__author__ = 'Kato Shinya'
+__date__ = '2018/04/21'
+
+# 検索結果ページ等のフィクスチャを格納したディレクトリ
+DIR_FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+def test_get_bookmark_counts_in_batches(standin, crawler):
+    '''登録済みのURLはAPIの値、未登録のURLは0として、2件毎に一括取得すること。'''
+
+    standin.bookmarks = {'http://a.com/' : 10, 'http://c.com/' : 3, 'http://e.com/' : 7}
+    urls = ['http://a.com/', 'http://b.com/', 'http://c.com/', 'http://d.com/', 'http://e.com/']
+
+    counts = crawler.get_bookmark_counts(urls)
+
+    assert counts == {'http://a.com/' : 10, 'http://b.com/' : 0, 'http://c.com/' : 3, 'http://d.com/' : 0, 'http://e.com/' : 7}
+    assert standin.hits['/entry.counts'] == 3
+    assert crawler.take_dead_letters() == []
+
+def test_get_bookmark_counts_without_registered_urls(standin, crawler):
+    '''APIが空の結果を返した場合は全てのURLを0とすること。'''
+
+    counts = crawler.get_bookmark_counts(['http://a.com/', 'http://b.com/'])
+
+    assert counts == {'http://a.com/' : 0, 'http://b.com/' : 0}
+    assert standin.hits['/entry.counts'] == 1
+
+def test_get_bookmark_counts_skips_unreachable_batches(standin, crawler):
+    '''接続できなかったURLは返却値に含めず、再投入用に記録すること。'''
+
+    crawler.HATENA_BOOKMARKS_API = standin.base_url() + '/missing'
+
+    counts = crawler.get_bookmark_counts(['http://a.com/', 'http://b.com/', 'http://c.com/'])
+
+    assert counts == {}
+    assert [target for kind, target, reason in crawler.take_dead_letters()] == ['http://a.com/', 'http://b.com/', 'http://c.com/']
+
+def test_get_html_without_available_cache(standin, crawler, tmp_path):
+    '''キャッシュファイルを利用できない場合もキャッシュを使用せずに取得すること。'''
+
+    standin.bookmarks = {'http://a.com/' : 10}
+    crawler.http_cache = HttpCache(str(tmp_path / 'http_cache.db'))
+    crawler.http_cache.close()
+
+    html = crawler.get_html(standin.base_url() + '/entry.count', params={'url' : 'http://a.com/'})
+
+    assert html == '10'
+    assert standin.hits['/entry.count'] == 1
+
+def read_fixture(name: str) -> str:
+    '''testsディレクトリのフィクスチャを読み込む関数。'''
+
+    with open(os.path.join(DIR_FIXTURES, name), encoding='utf-8') as f:
+        return f.read()
+
+def test_scrape_search_page(crawling):
+    '''検索結果ページの記事一覧の範囲から、短縮URLを除く記事情報を正規化して取得すること。'''
+
+    article_infos = crawling._CrawlingHatena__scrape_page(read_fixture('hatena_search.html'))
+
+    assert article_infos == [
+        ['https://a.example.com/python-tips', 'Python & Pandas で始めるデータ分析', '2018-06-17', 0, 'Python,データ分析'],
+        # 保存時の文字コード(cp932)で表現できない文字は除く
+        ['http://b.example.com/entry/2018/06/15/', '<script>タグをエスケープする', '2018-06-15', 0, ''],
+        ['http://c.example.com/?id=1', 'Kotlin coroutines', '2018-06-14', 0, 'Kotlin,C&C,Android'],
+    ]
+
+def set_parameter(config: dict, name: str, value: str):
+    '''MST_PARAMETER.TBLのパラメータを設定する関数。'''
+
+    conn = sqlite3.connect(config['path']['database'])
+    MstParameterDao().upsert_params_by_primary_key(conn.cursor(), value, name)
+    conn.commit()
+    conn.close()
+
+def select_articles(config: dict) -> list:
+    '''登録済みの記事情報をURL順に取得する関数。'''
+
+    conn = sqlite3.connect(config['path']['database'])
+    articles = conn.execute('SELECT URL, TITLE, PUBLISHED_DATE, BOOKMARKS, TAG FROM ARTICLE_INFO_HATENA ORDER BY URL').fetchall()
+    conn.close()
+
+    return articles
+
+def test_crawl_registers_scraped_articles(standin, config, crawling):
+    '''スクレイピングした記事情報をAPIから取得したブックマーク数とともに登録すること。'''
+
+    set_parameter(config, 'SEARCH_WORDS_4_HATENA', 'Python')
+    standin.pages = {('Python', 1) : read_fixture('hatena_search.html')}
+    standin.bookmarks = {'https://a.example.com/python-tips' : 120, 'http://c.example.com/?id=1' : 3}
+
+    crawling.execute()
+
+    assert select_articles(config) == [
+        ('http://b.example.com/entry/2018/06/15/', '<script>タグをエスケープする', '2018-06-15', 0, ''),
+        ('http://c.example.com/?id=1', 'Kotlin coroutines', '2018-06-14', 3, 'Kotlin,C&C,Android'),
+        ('https://a.example.com/python-tips', 'Python & Pandas で始めるデータ分析', '2018-06-17', 120, 'Python,データ分析'),
+    ]
+
+def register_article(config: dict, article: tuple):
+    '''ARTICLE_INFO_HATENA.TBLへ記事情報を登録し、タグをARTICLE_TAG.TBLへ反映する関数。'''
+
+    conn = sqlite3.connect(config['path']['database'])
+    conn.execute('INSERT INTO ARTICLE_INFO_HATENA VALUES (?, ?, ?, ?, ?, ?, ?, ?)', article)
+    ArticleTagDao().replace_tags(conn.cursor(), [(article[0], article[4])])
+    conn.commit()
+    conn.close()
+
+def test_crawl_updates_registered_articles(standin, config, crawling):
+    '''登録済みの記事はブックマーク数、タグおよび最終更新日時のみを更新し、登録日時を保持すること。'''
+
+    register_article(config, ('https://a.example.com/python-tips', '古いタイトル', '2018-06-17', 80, 'Python', '2018-06-17 10:00:00', '2018-06-17 10:00:00', '20180708'))
+    set_parameter(config, 'SEARCH_WORDS_4_HATENA', 'Python')
+    standin.pages = {('Python', 1) : read_fixture('hatena_search.html')}
+    standin.bookmarks = {'https://a.example.com/python-tips' : 120}
+
+    crawling.execute()
+
+    conn = sqlite3.connect(config['path']['database'])
+    article = conn.execute("SELECT TITLE, BOOKMARKS, TAG, REGISTER_DATE, UPDATED_DATE FROM ARTICLE_INFO_HATENA WHERE URL = 'https://a.example.com/python-tips'").fetchone()
+    count_work = conn.execute('SELECT COUNT(1) FROM WORK_ARTICLE_INFO_HATENA').fetchone()[0]
+    conn.close()
+
+    assert article[:4] == ('古いタイトル', 120, 'Python,データ分析', '2018-06-17 10:00:00')
+    assert article[4] > '2018-06-17 10:00:00'
+    assert count_work == 0
+    assert len(select_articles(config)) == 3
+
+def test_insert_to_work_counts_new_articles(config, crawling):
+    '''ワークテーブルへの登録数のうち、登録済みと登録待ちの記事を除いた新規の記事数を返すこと。'''
+
+    register_article(config, ('http://a.com/', 'A', '2018-06-17', 1, '', '2018-06-17 10:00:00', '2018-06-17 10:00:00', '20180708'))
+    conn, cursor = common.connect_to_database()
+    insert = crawling._CrawlingHatena__insert_article_info_to_work
+
+    assert insert(conn, cursor, [['http://a.com/', 'A', '2018-06-17', 2, ''], ['http://b.com/', 'B', '2018-06-17', 0, '']]) == 1
+    assert insert(conn, cursor, [['http://b.com/', 'B', '2018-06-17', 0, ''], ['http://c.com/', 'C', '2018-06-17', 0, '']]) == 1
+
+def create_search_page(urls: list) -> str:
+    '''指定URLの記事を掲載した検索結果ページを生成する関数。'''
+
+    items = ''.join('<li class="bookmark-item"><div class="centerarticle-entry-title"><h3><a href="{0}"><img src="" alt="">{0}</a></h3></div>'
+                    '<div class="entry-contents"><span class="entry-contents-date">2018/06/17</span></div></li>'.format(url) for url in urls)
+
+    return '<div class="entrysearch-articles"><ul>{}</ul></div><div class="centerarticle-pager"></div>'.format(items)
+
+def select_page_depths(config: dict) -> dict:
+    '''保存された検索ワード毎の取得ページ数と取得実績を取得する関数。'''
+
+    conn = sqlite3.connect(config['path']['database'])
+    value = MstParameterDao().select_params_by_primary_key(conn.cursor(), 'PAGE_DEPTH_4_HATENA')
+    conn.close()
+
+    return json.loads(value[0])
+
+def test_crawl_extends_depth_while_pages_are_new(standin, config, crawling):
+    '''全記事が未登録のページが続く間は取得ページ数を超えて取得し、次回の取得ページ数を増やすこと。'''
+
+    set_parameter(config, 'SEARCH_WORDS_4_HATENA', 'Python')
+    standin.pages = {('Python', page) : create_search_page(['http://{}.com/{}'.format(page, i) for i in range(3)]) for page in range(1, 8)}
+
+    crawling.execute()
+
+    assert len(select_articles(config)) == 21
+    # 初期値の5ページを超えて、記事のない8ページ目まで取得している
+    assert standin.hits['/search/tag'] == 8
+    assert select_page_depths(config) == {'Python' : {'depth' : 8, 'history' : [7]}}
+
+def test_crawl_stops_at_registered_page(standin, config, crawling):
+    '''全記事が登録済みのページで取得を終え、直近の取得実績から次回の取得ページ数を減らすこと。'''
+
+    for i in range(2):
+        register_article(config, ('http://2.com/{}'.format(i), '', '2018-06-17', 0, '', '2018-06-17 10:00:00', '2018-06-17 10:00:00', '20180708'))
+    set_parameter(config, 'SEARCH_WORDS_4_HATENA', 'Python')
+    set_parameter(config, 'PAGE_DEPTH_4_HATENA', json.dumps({'Python' : {'depth' : 4, 'history' : [3, 2]}}))
+    standin.pages = {('Python', page) : create_search_page(['http://{}.com/{}'.format(page, i) for i in range(2)]) for page in range(1, 5)}
+    crawling.PAGE_DEPTH_HISTORY = 2
+
+    crawling.execute()
+
+    # 登録済みの2ページ目以降の記事は登録しない
+    assert [article[0] for article in select_articles(config)] == ['http://1.com/0', 'http://1.com/1', 'http://2.com/0', 'http://2.com/1']
+    assert select_page_depths(config) == {'Python' : {'depth' : 3, 'history' : [2, 1]}}
+
+def test_sharded_crawl_shares_rate_per_host(standin, config, crawling, rewrite_config):
+    '''複数のワーカプロセスで分担した場合も、ホスト毎の送信数の合計が設定値を超えないこと。'''
+
+    rewrite_config({'crawler' : {'processes' : 2}, 'http' : {'rate_per_host' : 10, 'burst_per_host' : 2}})
+    set_parameter(config, 'SEARCH_WORDS_4_HATENA', 'Python,Kotlin')
+    standin.pages = {(word, page) : create_search_page(['http://{}.com/{}/{}'.format(word, page, i) for i in range(3)]) for word in ['Python', 'Kotlin'] for page in range(1, 4)}
+
+    CrawlingHatena(crawling.ARGV, check_internet=False).execute()
+
+    assert len(select_articles(config)) == 18
+    requested_at = standin.requested_at
+    # 各プロセスのバースト分(1件ずつ)を除き、毎秒10件を超えて送信していない
+    assert len(requested_at) >= 20
+    assert len(requested_at) <= 2 + 10 * (requested_at[-1] - requested_at[0]) + 1
+
+def select_dead_letters(config: dict) -> list:
+    '''記録された失敗したリクエストを取得する関数。'''
+
+    conn = sqlite3.connect(config['path']['database'])
+    dead_letters = conn.execute('SELECT KIND, TARGET, ATTEMPTS FROM DEAD_LETTER_HATENA ORDER BY KIND, TARGET').fetchall()
+    conn.close()
+
+    return dead_letters
+
+def test_redrive_failed_search_page(standin, config, create_crawling):
+    '''再試行後も失敗した検索結果ページを記録し、次回の実行で再取得して記録を削除すること。'''
+
+    set_parameter(config, 'SEARCH_WORDS_4_HATENA', 'Python')
+    standin.pages = {('Python', 1) : create_search_page(['http://a.com/', 'http://b.com/'])}
+    # 初回と3回の再試行の全てを失敗させる
+    standin.fail_next(503, times=4)
+
+    crawling = create_crawling()
+    # 1ページ目の取得で予約したエラー応答を全て消費させる
+    crawling.CONCURRENCY = 1
+    crawling.execute()
+
+    assert select_articles(config) == []
+    assert select_dead_letters(config) == [('SEARCH', '["Python", 1]', 1)]
+
+    create_crawling().execute()
+
+    assert [article[0] for article in select_articles(config)] == ['http://a.com/', 'http://b.com/']
+    assert select_dead_letters(config) == []
+
+def test_redrive_skips_exhausted_requests(standin, config, create_crawling):
+    '''失敗回数が上限に達したリクエストは再投入せず、記録のみ残すこと。'''
+
+    set_parameter(config, 'SEARCH_WORDS_4_HATENA', 'Python')
+    standin.pages = {('Python', 9) : create_search_page(['http://a.com/'])}
+    crawling = create_crawling()
+
+    conn, cursor = common.connect_to_database()
+    for _ in range(crawling.DEAD_LETTER_MAX_ATTEMPTS):
+        crawling.record_dead_letters('SEARCH', ['["Python", 9]'], 'HTTP Error 503')
+        crawling.flush_dead_letters(conn, cursor)
+
+    crawling.execute()
+
+    assert select_articles(config) == []
+    assert select_dead_letters(config) == [('SEARCH', '["Python", 9]', crawling.DEAD_LETTER_MAX_ATTEMPTS)]
+
+def select_bookmarks(config: dict) -> dict:
+    '''登録済みの記事のブックマーク数をURLをキーとして取得する関数。'''
+
+    return {article[0] : article[3] for article in select_articles(config)}
+
+def test_update_all_bookmarks_from_checkpoint(standin, config, updater):
+    '''全件更新はチェックポイントより後ろのURLからチャンク毎に更新し、完了後にチェックポイントを削除すること。'''
+
+    for url in ['http://a.com/', 'http://b.com/', 'http://c.com/', 'http://d.com/', 'http://e.com/']:
+        register_article(config, (url, '', '2018-06-17', 1, '', '2018-06-17 10:00:00', '2018-06-17 10:00:00', '99991231'))
+        standin.bookmarks[url] = 10
+    # 前回処理がb.comまでのチャンクをコミットした後に異常終了していた
+    set_parameter(config, 'CHECKPOINT_UPDATE_BOOKMARKS_HATENA', 'http://b.com/')
+    updater.REFRESH_POLICY = 'full'
+    updater.REFRESH_CHUNK_SIZE = 2
+
+    updater.execute()
+
+    assert select_bookmarks(config) == {'http://a.com/' : 1, 'http://b.com/' : 1, 'http://c.com/' : 10, 'http://d.com/' : 10, 'http://e.com/' : 10}
+    # 3件を2件毎のチャンクに分けて取得している
+    assert standin.hits['/entry.counts'] == 2
+
+    conn = sqlite3.connect(config['path']['database'])
+    assert MstParameterDao().select_params_by_primary_key(conn.cursor(), 'CHECKPOINT_UPDATE_BOOKMARKS_HATENA') is None
+    conn.close()
+
+def test_update_bookmarks_incrementally(standin, config, updater):
+    '''差分更新は対象外の記事を除き、更新優先度の上位から指定件数を重複も欠落もなく1度ずつ更新すること。'''
+
+    # 1日あたりのブックマーク数の増加量が多いほど更新優先度が高い
+    for url, bookmarks in [('http://a.com/', 400), ('http://b.com/', 300), ('http://c.com/', 200), ('http://d.com/', 100), ('http://e.com/', 0)]:
+        register_article(config, (url, '', '2018-06-17', bookmarks, '', '2018-06-17 10:00:00', '2018-06-18 10:00:00', '99991231'))
+    # 最終更新から間もない記事と削除予定日を過ぎた記事は対象外
+    register_article(config, ('http://recent.com/', '', '2018-06-17', 1000, '', '2018-06-17 10:00:00', '9999-12-31 00:00:00', '99991231'))
+    register_article(config, ('http://expired.com/', '', '2018-06-17', 1000, '', '2018-06-17 10:00:00', '2018-06-18 10:00:00', '20180708'))
+    standin.bookmarks = {url : 1 for url in select_bookmarks(config)}
+    updater.REFRESH_POLICY = 'incremental'
+    updater.REFRESH_TOP_K = 4
+    updater.REFRESH_CHUNK_SIZE = 2
+
+    updater.execute()
+
+    assert select_bookmarks(config) == {'http://a.com/' : 1, 'http://b.com/' : 1, 'http://c.com/' : 1, 'http://d.com/' : 1, 'http://e.com/' : 0, 'http://recent.com/' : 1000, 'http://expired.com/' : 1000}
+    assert standin.hits['/entry.counts'] == 2
+
+def test_purge_archives_and_deletes_expired_articles(config, purger):
+    '''期限切れの記事を保存してから削除し、全文検索インデックスとタグも削除され、初回のみ差分VACUUMへ切り替えること。'''
+
+    expired = [
+        ('http://a.com/', 'Python入門', '2018-06-01', 12, 'Python,入門', '2018-06-02 10:00:00', '2018-06-03 10:00:00', 20180622),
+        ('http://b.com/', 'Kotlin coroutines', '2018-06-02', 3, 'Kotlin', '2018-06-03 10:00:00', '2018-06-04 10:00:00', 20180623),
+    ]
+    alive = ('http://c.com/', 'Python tips', '2018-06-03', 5, 'Python', '2018-06-04 10:00:00', '2018-06-05 10:00:00', 99991231)
+    for article in expired + [alive]:
+        register_article(config, article)
+    purger.PURGE_BATCH_SIZE = 1
+
+    purger.execute()
+
+    paths = glob.glob(os.path.join(config['path']['dir_archive'], 'ARTICLE_INFO_HATENA_*.jsonl.gz'))
+    assert len(paths) == 1
+    with gzip.open(paths[0], 'rt', encoding='utf-8') as f:
+        archived = [json.loads(line) for line in f]
+    columns = ['URL', 'TITLE', 'PUBLISHED_DATE', 'BOOKMARKS', 'TAG', 'REGISTER_DATE', 'UPDATED_DATE', 'RESERVED_DEL_DATE']
+    assert sorted(archived, key=lambda article: article['URL']) == [dict(zip(columns, article)) for article in expired]
+
+    conn = sqlite3.connect(config['path']['database'])
+    cursor = conn.cursor()
+    assert [article[0] for article in select_articles(config)] == ['http://c.com/']
+    assert [row[0] for row in ArticleInfoHatenaFtsDao().search(cursor, 'Python', 10)] == ['http://c.com/']
+    assert ArticleInfoHatenaFtsDao().search(cursor, 'Kotlin', 10) == []
+    assert cursor.execute('SELECT URL, TAG FROM ARTICLE_TAG ORDER BY URL').fetchall() == [('http://c.com/', 'python')]
+    assert cursor.execute('PRAGMA auto_vacuum').fetchone()[0] == DatabaseMaintenanceDao.AUTO_VACUUM_INCREMENTAL
+    assert cursor.execute('PRAGMA freelist_count').fetchone()[0] == 0
+    conn.close()
+
+def test_purge_releases_free_pages_incrementally(config, create_purger):
+    '''差分VACUUMへ切り替え済みの場合は、削除により生じた未使用ページを解放すること。'''
+
+    create_purger().execute()
+
+    for i in range(200):
+        register_article(config, ('http://{}.com/'.format(i), os.urandom(512).hex(), '2018-06-01', 0, '', '2018-06-02 10:00:00', '2018-06-03 10:00:00', 20180622))
+    conn = sqlite3.connect(config['path']['database'])
+    page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+
+    create_purger().execute()
+
+    assert conn.execute('SELECT COUNT(1) FROM ARTICLE_INFO_HATENA').fetchone()[0] == 0
+    assert conn.execute('PRAGMA freelist_count').fetchone()[0] == 0
+    assert conn.execute('PRAGMA page_count').fetchone()[0] < page_count
+    conn.close()
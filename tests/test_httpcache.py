@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+'''
+:copyright: (c) 2018 by Kato Shinya.
+:license: MIT, see LICENSE for more details.
+'''
+
+import sqlite3
+import os
+
+import pytest
+
+from httpclient import HttpConnectionPool
+from httpcache import HttpCache
+
+__author__ = 'Kato Shinya'
+__date__ = '2018/04/21'
+
+@pytest.fixture
+def pool():
+    '''コネクションプールを返すフィクスチャ。'''
+
+    pool = HttpConnectionPool()
+
+    yield pool
+
+    pool.close()
+
+@pytest.fixture
+def pages(standin):
+    '''圧縮後も約1KiBとなる検索結果ページを3件登録し、ページ番号毎のURLを返すフィクスチャ。'''
+
+    standin.pages = {page : os.urandom(1024).hex() for page in range(1, 4)}
+
+    return {page : '{}/search/tag?q=Python&page={}'.format(standin.base_url(), page) for page in standin.pages}
+
+def test_hit(standin, pool, tmp_path):
+    '''TTL内のキャッシュは通信せずに返却すること。'''
+
+    standin.bookmarks = {'http://a.com/' : 10}
+    url = standin.base_url() + '/entry.count?url=http://a.com/'
+    cache = HttpCache(str(tmp_path / 'http_cache.db'), ttl=3600)
+
+    first = cache.fetch(pool, url)
+    second = cache.fetch(pool, url)
+
+    assert first.body == second.body == b'10'
+    assert second.headers.get_content_type() == 'text/plain'
+    assert standin.hits['/entry.count'] == 1
+    assert cache.statistics()['hits'] == 1
+    assert cache.statistics()['misses'] == 1
+
+def test_revalidate_after_ttl(standin, pool, tmp_path):
+    '''TTLを過ぎたキャッシュは条件付きリクエストで再検証し、304応答時はキャッシュを返却すること。'''
+
+    standin.bookmarks = {'http://a.com/' : 10}
+    url = standin.base_url() + '/entry.count?url=http://a.com/'
+    cache = HttpCache(str(tmp_path / 'http_cache.db'), ttl=0)
+
+    cache.fetch(pool, url)
+    response = cache.fetch(pool, url)
+
+    assert response.status == 200
+    assert response.body == b'10'
+    assert standin.hits['/entry.count'] == 2
+    assert cache.statistics()['revalidated'] == 1
+    assert cache.statistics()['misses'] == 1
+
+def test_refetch_changed_after_ttl(standin, pool, tmp_path):
+    '''TTLを過ぎたキャッシュが変更されていた場合は新しいレスポンスで置き換えること。'''
+
+    standin.bookmarks = {'http://a.com/' : 10}
+    url = standin.base_url() + '/entry.count?url=http://a.com/'
+    cache = HttpCache(str(tmp_path / 'http_cache.db'), ttl=0)
+
+    cache.fetch(pool, url)
+    standin.bookmarks['http://a.com/'] = 11
+    response = cache.fetch(pool, url)
+
+    assert response.body == b'11'
+    assert cache.statistics()['revalidated'] == 0
+    assert cache.statistics()['misses'] == 2
+
+def test_evict_least_recently_used(standin, pool, pages, tmp_path):
+    '''最大サイズを超えた場合は最終参照日時の古いキャッシュから削除すること。'''
+
+    cache = HttpCache(str(tmp_path / 'http_cache.db'), max_bytes=2500)
+
+    cache.fetch(pool, pages[1])
+    cache.fetch(pool, pages[2])
+    # 1ページ目を参照して2ページ目を最も古くする
+    cache.fetch(pool, pages[1])
+    cache.fetch(pool, pages[3])
+
+    assert cache.statistics()['bytes'] <= 2500
+    assert standin.hits['/search/tag'] == 3
+
+    cache.fetch(pool, pages[1])
+    cache.fetch(pool, pages[3])
+    assert standin.hits['/search/tag'] == 3
+
+    cache.fetch(pool, pages[2])
+    assert standin.hits['/search/tag'] == 4
+
+def test_evict_counts_entries_of_other_processes(standin, pool, pages, tmp_path):
+    '''同一ファイルを共有する他プロセスが保存した分も含めて最大サイズを守ること。'''
+
+    path = str(tmp_path / 'http_cache.db')
+    caches = [HttpCache(path, max_bytes=2500), HttpCache(path, max_bytes=2500)]
+
+    caches[0].fetch(pool, pages[1])
+    caches[0].fetch(pool, pages[2])
+    caches[1].fetch(pool, pages[3])
+
+    assert caches[1].statistics()['bytes'] <= 2500
+
+    # 最も古い1ページ目のみが削除されている
+    caches[0].fetch(pool, pages[2])
+    caches[0].fetch(pool, pages[3])
+    assert standin.hits['/search/tag'] == 3
+    caches[0].fetch(pool, pages[1])
+    assert standin.hits['/search/tag'] == 4
+
+def test_total_bytes_follows_entries(standin, pool, pages, tmp_path):
+    '''置き換えと削除の後もキャッシュサイズが保存済みのキャッシュの合計と一致し、再度開いた場合も引き継ぐこと。'''
+
+    path = str(tmp_path / 'http_cache.db')
+    cache = HttpCache(path, ttl=0, max_bytes=2500)
+
+    cache.fetch(pool, pages[1])
+    cache.fetch(pool, pages[2])
+    standin.pages[1] = os.urandom(512).hex()
+    cache.fetch(pool, pages[1])
+    cache.fetch(pool, pages[3])
+
+    connection = sqlite3.connect(path)
+    total_bytes = connection.execute('SELECT SUM(SIZE) FROM HTTP_CACHE').fetchone()[0]
+    connection.close()
+
+    assert cache.statistics()['bytes'] == total_bytes <= 2500
+    cache.close()
+    assert HttpCache(path).statistics()['bytes'] == total_bytes
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+'''
+:copyright: (c) 2018 by Kato Shinya.
+:license: MIT, see LICENSE for more details.
+'''
+
+from urllib.error import HTTPError
+import time
+import json
+
+import pytest
+
+from httpclient import HttpConnectionPool
+
+__author__ = 'Kato Shinya'
+__date__ = '2018/04/21'
+
+@pytest.fixture
+def pool():
+    '''再試行時の待機を短くしたコネクションプールを返すフィクスチャ。'''
+
+    pool = HttpConnectionPool(max_connections_per_host=1, timeout=5.0, retries=3, backoff=0.01)
+
+    yield pool
+
+    pool.close()
+
+def test_reuses_connection_after_empty_body(standin, pool):
+    '''本文が空のレスポンスを受信した後も同じ接続を再利用すること。'''
+
+    for _ in range(3):
+        response = pool.request(standin.base_url() + '/entry.count?url=http://a.com/')
+        assert response.status == 200
+        assert response.body == b''
+
+    assert standin.hits['/entry.count'] == 3
+    assert standin.connections == 1
+
+def test_reuses_connection_after_not_modified(standin, pool):
+    '''304応答の後も同じ接続を再利用すること。'''
+
+    standin.bookmarks = {'http://a.com/' : 10}
+    url = standin.base_url() + '/entry.count?url=http://a.com/'
+
+    etag = pool.request(url).headers['ETag']
+    not_modified = pool.request(url, headers={'If-None-Match' : etag})
+    response = pool.request(url)
+
+    assert not_modified.status == 304
+    assert not_modified.body == b''
+    assert response.body == b'10'
+    assert standin.connections == 1
+
+def test_decodes_gzip(standin, pool):
+    '''gzipで圧縮されたレスポンスを伸長すること。'''
+
+    standin.bookmarks = {'http://example.com/{}'.format(i) : i for i in range(100)}
+    query = '&'.join('url=http://example.com/{}'.format(i) for i in range(100))
+
+    response = pool.request(standin.base_url() + '/entry.counts?' + query)
+
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert json.loads(response.text()) == standin.bookmarks
+
+def test_requests_identity_without_compression(standin):
+    '''圧縮転送を要求しない場合は非圧縮のレスポンスを受信すること。'''
+
+    standin.bookmarks = {'http://a.com/' : 10}
+    pool = HttpConnectionPool(compression=False)
+
+    response = pool.request(standin.base_url() + '/entry.count?url=http://a.com/')
+    pool.close()
+
+    assert response.headers['Content-Encoding'] is None
+    assert response.body == b'10'
+
+@pytest.mark.parametrize('status', [429, 503])
+def test_retries_with_retry_after(standin, pool, status):
+    '''429および503応答時はRetry-Afterの秒数だけ待機して再試行すること。'''
+
+    standin.bookmarks = {'http://a.com/' : 10}
+    standin.fail_next(status, retry_after='1')
+
+    started = time.monotonic()
+    response = pool.request(standin.base_url() + '/entry.count?url=http://a.com/')
+
+    assert time.monotonic() - started >= 1.0
+    assert response.body == b'10'
+    assert standin.hits['/entry.count'] == 2
+
+def test_retries_with_backoff(standin, pool):
+    '''Retry-Afterがない場合も再試行回数の上限まで再試行すること。'''
+
+    standin.bookmarks = {'http://a.com/' : 10}
+    standin.fail_next(503, times=3)
+
+    response = pool.request(standin.base_url() + '/entry.count?url=http://a.com/')
+
+    assert response.body == b'10'
+    assert standin.hits['/entry.count'] == 4
+
+def test_gives_up_after_retries(standin, pool):
+    '''再試行後も5xx応答だった場合はHTTPErrorを送出すること。'''
+
+    standin.fail_next(503, times=4)
+
+    with pytest.raises(HTTPError) as e:
+        pool.request(standin.base_url() + '/entry.count?url=http://a.com/')
+
+    assert e.value.code == 503
+    assert standin.hits['/entry.count'] == 4
+
+def test_does_not_retry_beyond_max_backoff(standin):
+    '''Retry-Afterが待機時間の上限を超える場合は再試行しないこと。'''
+
+    standin.fail_next(429, retry_after='120')
+    pool = HttpConnectionPool(max_backoff=60.0)
+
+    with pytest.raises(HTTPError) as e:
+        pool.request(standin.base_url() + '/entry.count?url=http://a.com/')
+    pool.close()
+
+    assert e.value.code == 429
+    assert e.value.headers['Retry-After'] == '120'
+    assert standin.hits['/entry.count'] == 1
+
+def test_keeps_accept_encoding_of_caller(standin, pool):
+    '''呼び出し元が指定したAccept-Encodingを上書きしないこと。'''
+
+    standin.bookmarks = {'http://a.com/' : 10}
+
+    response = pool.request(standin.base_url() + '/entry.count?url=http://a.com/', headers={'Accept-Encoding' : 'identity'})
+
+    assert response.headers['Content-Encoding'] is None
+    assert response.body == b'10'
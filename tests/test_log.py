@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+'''
+:copyright: (c) 2018 by Kato Shinya.
+:license: MIT, see LICENSE for more details.
+'''
+
+from logging import LogRecord, INFO
+from datetime import datetime, timedelta
+from queue import SimpleQueue
+import time
+import os
+
+from log import DailyLogFileHandler, BatchingQueueListener, Log, LogLevel, _stop_writer
+
+__author__ = 'Kato Shinya'
+__date__ = '2018/04/21'
+
+def create_record(message: str, created=None) -> LogRecord:
+    '''指定日時に生成したログレコードを返す関数。'''
+
+    record = LogRecord('test', INFO, __file__, 1, message, (), None)
+    if created is not None:
+        record.created = created.timestamp()
+
+    return record
+
+def read_log(dir_log: str, day: datetime) -> str:
+    '''指定日のログファイルを読み込む関数。'''
+
+    with open(os.path.join(dir_log, day.strftime('%Y%m%d') + '.mlog'), encoding='utf-8') as f:
+        return f.read()
+
+def test_creates_file_of_today(tmp_path):
+    '''レコードを出力する前に当日のログファイルを生成すること。'''
+
+    dir_log = str(tmp_path / 'log') + os.sep
+    handler = DailyLogFileHandler(dir_log, encoding='utf-8')
+
+    assert read_log(dir_log, datetime.now()) == ''
+
+    handler.close()
+
+def test_writes_in_batches(tmp_path):
+    '''蓄積件数が上限に達するかflushされるまで書き込まないこと。'''
+
+    dir_log = str(tmp_path) + os.sep
+    handler = DailyLogFileHandler(dir_log, capacity=3, encoding='utf-8')
+
+    handler.handle(create_record('first'))
+    handler.handle(create_record('second'))
+    assert read_log(dir_log, datetime.now()) == ''
+
+    handler.handle(create_record('third'))
+    assert read_log(dir_log, datetime.now()).split(os.linesep) == ['first', 'second', 'third', '']
+
+    handler.handle(create_record('fourth'))
+    handler.flush()
+    assert read_log(dir_log, datetime.now()).split(os.linesep)[3] == 'fourth'
+
+    handler.close()
+
+def test_rotates_daily(tmp_path):
+    '''日付が変わった場合は蓄積済みの行を前日のファイルへ書き込んでから切り替えること。'''
+
+    dir_log = str(tmp_path) + os.sep
+    today = datetime.now()
+    tomorrow = datetime.combine(today.date() + timedelta(1), datetime.min.time())
+    handler = DailyLogFileHandler(dir_log, encoding='utf-8')
+
+    handler.handle(create_record('today', today))
+    handler.handle(create_record('tomorrow', tomorrow))
+    handler.close()
+
+    assert read_log(dir_log, today) == 'today' + os.linesep
+    assert read_log(dir_log, tomorrow) == 'tomorrow' + os.linesep
+
+def test_listener_flushes_when_queue_is_empty(tmp_path):
+    '''キューが空になった時点で書き込むこと。'''
+
+    dir_log = str(tmp_path) + os.sep
+    queue = SimpleQueue()
+    handler = DailyLogFileHandler(dir_log, encoding='utf-8')
+    listener = BatchingQueueListener(queue, handler)
+
+    for i in range(3):
+        queue.put(create_record(str(i)))
+    listener.start()
+
+    deadline = time.monotonic() + 5
+    while not read_log(dir_log, datetime.now()) and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert read_log(dir_log, datetime.now()).split(os.linesep) == ['0', '1', '2', '']
+
+    listener.stop()
+    handler.close()
+
+def test_flushes_at_exit(config):
+    '''書き込みスレッドの停止時に書き込み待ちのレコードを書き込むこと。'''
+
+    log = Log()
+    dir_log = config['path']['dir_log']
+    assert os.path.exists(os.path.join(dir_log, datetime.now().strftime('%Y%m%d') + '.mlog'))
+
+    log.normal(LogLevel.INFO.value, 'LINF0001', 'TestLog')
+    _stop_writer()
+
+    assert 'TestLog class.' in read_log(dir_log, datetime.now())
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+
+'''
+:copyright: (c) 2018 by Kato Shinya.
+:license: MIT, see LICENSE for more details.
+'''
+
+import sqlite3
+
+import pytest
+
+from sql import SchemaMigrator, ArticleInfoHatenaFtsDao, ArticleTagDao
+
+__author__ = 'Kato Shinya'
+__date__ = '2018/04/21'
+
+# 変更前の形式(公開日はYYYY/MM/DD、ワークテーブルのブックマーク数は文字列)の記事情報
+BASELINE_ARTICLES = [
+    ('http://a.com/', 'Python tips', '2018/06/01', '120', 'Python,programming', '2018-06-02 10:00:00', '2018-06-02 10:00:00', 20180801),
+    ('http://b.com/', 'Kotlin coroutines', '2018/06/03', '7', 'Kotlin,Android', '2018-06-04 10:00:00', '2018-06-05 10:00:00', 20180803),
+]
+
+def dump(conn: sqlite3.Connection) -> tuple:
+    '''スキーマと記事情報を比較用に取得する関数。'''
+
+    schema = conn.execute('SELECT type, name, sql FROM sqlite_master ORDER BY type, name').fetchall()
+    articles = conn.execute('SELECT * FROM ARTICLE_INFO_HATENA ORDER BY URL').fetchall()
+    work_articles = conn.execute('SELECT * FROM WORK_ARTICLE_INFO_HATENA ORDER BY URL').fetchall()
+
+    return schema, articles, work_articles
+
+@pytest.fixture
+def baseline(config):
+    '''変更前のスキーマに記事情報を登録したDBのコネクションを返すフィクスチャ。'''
+
+    conn = sqlite3.connect(config['path']['database'])
+    conn.executemany('INSERT INTO ARTICLE_INFO_HATENA VALUES (?, ?, ?, ?, ?, ?, ?, ?)', BASELINE_ARTICLES)
+    conn.executemany('INSERT INTO WORK_ARTICLE_INFO_HATENA VALUES (?, ?, ?, ?, ?, ?, ?, ?)', BASELINE_ARTICLES)
+    conn.commit()
+
+    yield conn
+
+    conn.close()
+
+def test_migrate_from_baseline(baseline):
+    '''変更前のスキーマを最新化し、登録済みの記事情報を型と形式を変換して保持すること。'''
+
+    migrator = SchemaMigrator()
+    assert migrator.get_version(baseline.cursor()) == 0
+
+    assert migrator.migrate(baseline) == [1, 2, 3, 4, 5, 6, 7]
+    assert baseline.execute('PRAGMA user_version').fetchone()[0] == 7
+
+    expected = [(url, title, published_date.replace('/', '-'), int(bookmarks), tag, register_date, updated_date, reserved_del_date)
+                    for url, title, published_date, bookmarks, tag, register_date, updated_date, reserved_del_date in BASELINE_ARTICLES]
+    schema, articles, work_articles = dump(baseline)
+    assert articles == expected
+    assert work_articles == expected
+    assert baseline.execute("SELECT COUNT(1) FROM WORK_ARTICLE_INFO_HATENA WHERE typeof(BOOKMARKS) <> 'integer'").fetchone()[0] == 0
+
+    names = [name for type, name, sql in schema]
+    for name in ['ARTICLE_INFO_HATENA_FTS', 'ARTICLE_TAG', 'DEAD_LETTER_HATENA', 'INDEX_ARTICLE_INFO_HATENA_BOOKMARKS',
+                    'INDEX_ARTICLE_INFO_HATENA_RESERVED_DEL_DATE', 'INDEX_ARTICLE_INFO_HATENA_UPDATED_DATE']:
+        assert name in names
+
+    # 登録済みの記事情報から全文検索インデックスとタグテーブルが構築されている
+    cursor = baseline.cursor()
+    assert [row[0] for row in ArticleInfoHatenaFtsDao().search(cursor, 'coroutines', 10)] == ['http://b.com/']
+    assert cursor.execute('SELECT URL, TAG FROM ARTICLE_TAG ORDER BY URL, TAG').fetchall() == [
+        ('http://a.com/', 'programming'), ('http://a.com/', 'python'), ('http://b.com/', 'android'), ('http://b.com/', 'kotlin')]
+
+def test_migrate_twice(baseline):
+    '''最新化済みのDBに対する2回目の実行では何も変更しないこと。'''
+
+    migrator = SchemaMigrator()
+    migrator.migrate(baseline)
+    migrated = dump(baseline)
+
+    assert migrator.migrate(baseline) == []
+    assert baseline.execute('PRAGMA user_version').fetchone()[0] == 7
+    assert dump(baseline) == migrated
+
+@pytest.fixture
+def migrated(baseline):
+    '''最新化したDBに日本語の記事情報を追加登録したカーソルを返すフィクスチャ。'''
+
+    SchemaMigrator().migrate(baseline)
+    baseline.executemany('INSERT INTO ARTICLE_INFO_HATENA VALUES (?, ?, ?, ?, ?, ?, ?, ?)', [
+        ('http://c.com/', 'Pandasで始めるデータ分析', '2018-06-05', 300, 'Python,データ分析', '2018-06-06 10:00:00', '2018-06-06 10:00:00', 20180805),
+        ('http://d.com/', 'Goで書くWebサーバ', '2018-06-06', 45, 'Go,Web', '2018-06-07 10:00:00', '2018-06-07 10:00:00', 20180806),
+    ])
+    ArticleTagDao().replace_tags(baseline.cursor(), [('http://c.com/', 'Python,データ分析'), ('http://d.com/', 'Go,Web')])
+    baseline.commit()
+
+    yield baseline.cursor()
+
+def test_search_japanese_substring(migrated):
+    '''分かち書きされていない日本語のタイトルおよびタグを部分一致で検索できること。'''
+
+    dao = ArticleInfoHatenaFtsDao()
+
+    assert [row[0] for row in dao.search(migrated, 'データ', 10)] == ['http://c.com/']
+    assert [row[0] for row in dao.search(migrated, '始める', 10)] == ['http://c.com/']
+    assert [row[0] for row in dao.search(migrated, 'サーバ python', 10)] == []
+    assert dao.count(migrated, 'データ分析') == (1,)
+
+def test_search_short_words_fallback(migrated):
+    '''3文字未満の単語はLIKEで絞り込み、ワイルドカードを文字として扱うこと。'''
+
+    dao = ArticleInfoHatenaFtsDao()
+
+    # 全単語が3文字未満の場合はブックマーク数の降順に並ぶ
+    assert [row[0] for row in dao.search(migrated, 'Go', 10)] == ['http://d.com/']
+    assert [row[0] for row in dao.search(migrated, '分析', 10)] == ['http://c.com/']
+    assert [row[0] for row in dao.search(migrated, 'py', 10)] == ['http://c.com/', 'http://a.com/']
+    assert dao.count(migrated, 'py') == (2,)
+    # 3文字以上の単語と組み合わせた場合は両方を含む記事のみ
+    assert [row[0] for row in dao.search(migrated, 'Pandas 分析', 10)] == ['http://c.com/']
+    assert dao.search(migrated, 'Kotlin 分析', 10) == []
+    assert dao.search(migrated, '%', 10) == []
+    assert dao.search(migrated, '', 10) == []
+
+def test_search_order_by_bookmarks_after(migrated):
+    '''検索結果をブックマーク数順に前回の最終行の続きから取得できること。'''
+
+    dao = ArticleInfoHatenaFtsDao()
+
+    first = dao.search_order_by_bookmarks_after(migrated, 'py', None, 1)
+    assert [row[0] for row in first] == ['http://c.com/']
+    rest = dao.search_order_by_bookmarks_after(migrated, 'py', (first[-1][3], first[-1][0]), 10)
+    assert [row[0] for row in rest] == ['http://a.com/']
+
+    assert [row[0] for row in dao.search_order_by_bookmarks_after(migrated, 'o', None, 10, descending=False)] == ['http://b.com/', 'http://d.com/', 'http://a.com/', 'http://c.com/']
+    assert [row[0] for row in dao.search_order_by_bookmarks_after(migrated, 'python', (120, 'http://a.com/'), 10, descending=False)] == ['http://c.com/']
+
+def test_split_tags():
+    '''タグを分割し、非ASCII文字を含めて大文字小文字を区別しない形へ正規化すること。'''
+
+    assert ArticleTagDao.split_tags(' Python, ,ÄPFEL,データ分析,') == ['python', 'äpfel', 'データ分析']
+    assert ArticleTagDao.split_tags(None) == []
+    assert ArticleTagDao.normalize_tag(' Straße ') == 'strasse'
+
+def test_search_by_tags(migrated):
+    ''''tag:'で始まる単語はタグの完全一致で絞り込み、他の単語と組み合わせられること。'''
+
+    dao = ArticleInfoHatenaFtsDao()
+    ArticleTagDao().replace_tags(migrated, [('http://b.com/', 'Kotlin,ÄPFEL')])
+
+    assert [row[0] for row in dao.search(migrated, 'tag:PYTHON', 10)] == ['http://c.com/', 'http://a.com/']
+    assert [row[0] for row in dao.search(migrated, 'tag:python tag:データ分析', 10)] == ['http://c.com/']
+    assert [row[0] for row in dao.search(migrated, 'tips tag:python', 10)] == ['http://a.com/']
+    assert [row[0] for row in dao.search(migrated, 'tag:äpfel', 10)] == ['http://b.com/']
+    # 部分一致ではなく完全一致で比較する
+    assert dao.search(migrated, 'tag:pyth', 10) == []
+    assert dao.count(migrated, 'tag:python') == (2,)
+    assert [row[0] for row in dao.search_order_by_bookmarks_after(migrated, 'tag:python', None, 10, descending=False)] == ['http://a.com/', 'http://c.com/']
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+'''
+:copyright: (c) 2018 by Kato Shinya.
+:license: MIT, see LICENSE for more details.
+'''
+
+import json
+
+from httpclient import HttpConnectionPool
+import telemetry
+
+__author__ = 'Kato Shinya'
+__date__ = '2018/04/21'
+
+def read_records(path) -> list:
+    '''テレメトリファイルの各行を読み込む関数。'''
+
+    with open(str(path), encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+def test_writes_json_lines(tmp_path):
+    '''処理段階毎の記録を1行ずつ出力し、カウンタは終了時にまとめて出力すること。'''
+
+    path = tmp_path / 'telemetry.jsonl'
+    recorder = telemetry.Telemetry(str(path), buffer_records=2)
+
+    with recorder.timer('scrape', word='Python', page=1) as fields:
+        fields['articles'] = 40
+    recorder.record('insert', 0.5, rows=40)
+    recorder.count('rows.inserted', 40)
+    recorder.count('rows.inserted', 2)
+
+    # 蓄積件数が上限に達した時点で書き込まれる
+    assert [record['stage'] for record in read_records(path)] == ['scrape', 'insert']
+
+    recorder.count('http.errors')
+    recorder.close()
+    records = read_records(path)
+
+    assert records[0]['word'] == 'Python'
+    assert records[0]['page'] == 1
+    assert records[0]['articles'] == 40
+    assert records[1]['elapsed_ms'] == 500.0
+    assert records[2] == dict(records[2], stage='counters', counters={'rows.inserted' : 42, 'http.errors' : 1})
+    assert len(records) == 3
+
+def test_summarize(tmp_path):
+    '''複数ファイルの所要時間を処理段階毎にまとめ、カウンタを合計すること。'''
+
+    paths = []
+    for i, elapsed in enumerate([[0.001, 0.003], [0.002]]):
+        path = tmp_path / '{}.jsonl'.format(i)
+        recorder = telemetry.Telemetry(str(path))
+        for value in elapsed:
+            recorder.record('http.request', value)
+        recorder.count('http.retries', i + 1)
+        recorder.close()
+        paths.append(str(path))
+
+    elapsed, counters = telemetry.summarize(paths)
+
+    assert elapsed == {'http.request' : [1.0, 3.0, 2.0]}
+    assert counters == {'http.retries' : 3}
+    assert telemetry.percentile(sorted(elapsed['http.request']), 50) == 2.0
+
+def test_disabled_does_not_write(tmp_path):
+    '''出力先がない場合は何も記録しないこと。'''
+
+    recorder = telemetry.Telemetry()
+
+    with recorder.timer('scrape'):
+        pass
+    recorder.count('rows.inserted')
+    recorder.close()
+
+    assert not recorder.enabled
+    assert list(tmp_path.iterdir()) == []
+
+def test_timed_dao_binds_original_when_disabled(config):
+    '''テレメトリが無効の場合は初回の呼び出し後に元のメソッドへ戻すこと。'''
+
+    def select(self, cursor):
+        return cursor
+
+    Dao = telemetry.timed_dao(type('Dao', (), {'select' : select}))
+
+    assert Dao.select is not select
+    assert Dao().select('cursor') == 'cursor'
+    assert Dao.select is select
+
+def test_timed_dao_records_when_enabled(config, monkeypatch, tmp_path):
+    '''テレメトリが有効の場合はDAOのメソッド毎に所要時間を記録すること。'''
+
+    path = tmp_path / 'dao.jsonl'
+    monkeypatch.setattr(telemetry, '_telemetry', (telemetry.os.getpid(), telemetry.Telemetry(str(path))))
+
+    def select(self, cursor):
+        return cursor
+
+    Dao = telemetry.timed_dao(type('Dao', (), {'select' : select}))
+
+    assert Dao().select('cursor') == 'cursor'
+    assert Dao().select('cursor') == 'cursor'
+    telemetry.get_telemetry().close()
+
+    assert [record['stage'] for record in read_records(path)] == ['dao.Dao.select'] * 2
+
+def test_http_dns_and_connect(standin, tmp_path):
+    '''名前解決と接続の所要時間を分けて記録すること。'''
+
+    path = tmp_path / 'http.jsonl'
+    recorder = telemetry.Telemetry(str(path))
+    pool = HttpConnectionPool(telemetry=recorder)
+
+    standin.bookmarks = {'http://a.com/' : 10}
+    response = pool.request(standin.base_url() + '/entry.count?url=http://a.com/')
+    pool.close()
+    recorder.close()
+
+    assert response.body == b'10'
+    assert [record['stage'] for record in read_records(path)] == ['http.dns', 'http.connect', 'http.request']